@@ -1,17 +1,15 @@
 import argparse
 import os
 import time
-from glob import glob
-from typing import Dict, List
 
-import h5py
 import mujoco
 import mujoco.viewer
 import numpy as np
 import placo
 from scipy.spatial.transform import Rotation as R
 
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.episode_writer import HDF5EpisodeWriter
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 from mini_bdx.utils.xbox_controller import XboxController
 
 # from mini_bdx.utils.xbox_controller import XboxController
@@ -40,6 +38,14 @@ parser.add_argument(
     default=10,
     help="Episode length in seconds",
 )
+parser.add_argument(
+    "-c",
+    "--compression",
+    type=str,
+    required=False,
+    default=None,
+    help="HDF5 compression filter (e.g. gzip, lzf)",
+)
 args = parser.parse_args()
 
 session_name = args.session_name + "_raw"
@@ -47,58 +53,42 @@ session_path = os.path.join("data", session_name)
 os.makedirs(session_path, exist_ok=True)
 
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 data = mujoco.MjData(model)
 
-recording = False
-data_dict: Dict[str, List[float]] = {
-    "/action": [],
-    "/observations/qpos": [],
-    "/observations/qvel": [],
-    "/observations/target": [],  # [target_step_size_x, target_step_size_y, target_yaw, target_head_pitch, target_head_yaw, target_head_z_offset]
-    "/observations/feet_contact": [],  # [right_contact, left_contact]
-}
+# Steps are streamed to the episode file by a background thread, starting and
+# stopping a recording does not stall the simulation
+writer = HDF5EpisodeWriter(
+    session_path,
+    {
+        "/action": model.nu,
+        "/observations/qpos": model.nq,
+        "/observations/qvel": model.nv,
+        "/observations/target": 6,  # [target_step_size_x, target_step_size_y, target_yaw, target_head_pitch, target_head_yaw, target_head_z_offset]
+        "/observations/feet_contact": 2,  # [right_contact, left_contact]
+    },
+    compression=args.compression,
+)
+
+
+# The viewer calls key_callback from its own thread, the recording is started or
+# stopped by the simulation loop, which appends the steps to the writer
+toggle_recording = False
 
 
 def key_callback(keycode):
+    global toggle_recording
     if keycode == 257:  # enter
-        start_stop_recording()
+        toggle_recording = True
 
 
 def start_stop_recording():
-    global recording, data_dict
-    recording = not recording
-    if recording:
-        print("Recording started")
-        pass
+    if not writer.recording:
+        episode_path = writer.start_episode({"sampling_rate": args.sampling_rate})
+        print(f"Recording started in {episode_path}")
     else:
-        print("Recording stopped")
-        episode_id = len(glob(f"{session_path}/*.hdf5"))
-        episode_path = os.path.join(session_path, f"episode_{episode_id}.hdf5")
-        print(f"Saving episode in {episode_path} ...")
-        max_timesteps = len(data_dict["/action"])
-        with h5py.File(
-            episode_path,
-            "w",
-            rdcc_nbytes=1024**2 * 2,
-        ) as root:
-            obs = root.create_group("observations")
-            obs.create_dataset("qpos", (max_timesteps, 20))
-            obs.create_dataset("qvel", (max_timesteps, 19))
-            obs.create_dataset("target", (max_timesteps, 6))
-            obs.create_dataset("feet_contact", (max_timesteps, 2))
-            root.create_dataset("action", (max_timesteps, 13))
-
-            for name, array in data_dict.items():
-                root[name][...] = array
-        print("Done")
-        data_dict = {
-            "/action": [],
-            "/observations/qpos": [],
-            "/observations/qvel": [],
-            "/observations/target": [],
-            "/observations/feet_contact": [],
-        }
+        episode_path = writer.end_episode()
+        print(f"Recording stopped, {episode_path} is being saved")
 
 
 max_target_step_size_x = 0.03
@@ -167,6 +157,10 @@ try:
         dt = data.time - prev
         xbox_input()
 
+        if toggle_recording:
+            toggle_recording = False
+            start_stop_recording()
+
         # if data.time - episode_start > args.episode_length:
         #     start_stop_recording()
         #     episode_start = data.time
@@ -196,29 +190,25 @@ try:
         # Apply the angles to the robot
         data.ctrl[:] = list(angles.values())
 
-        if recording and data.time - last > (1 / args.sampling_rate):
+        if writer.recording and data.time - last > (1 / args.sampling_rate):
             last = data.time
-            action = list(angles.values())
-            qpos = data.qpos.flat.copy()
-            qvel = data.qvel.flat.copy()
-
             # TODO merge all observations into one array "state" ?
             # Don't understand very well how it is handled in lerobot
-            data_dict["/action"].append(action)
-            data_dict["/observations/qpos"].append(qpos)
-            data_dict["/observations/qvel"].append(qvel)
-            data_dict["/observations/target"].append(
-                [
-                    target_step_size_x,
-                    target_step_size_y,
-                    target_yaw,
-                    target_head_pitch,
-                    target_head_yaw,
-                    target_head_z_offset,
-                ]
-            )
-            data_dict["/observations/feet_contact"].append(
-                [right_contact, left_contact]
+            writer.append(
+                {
+                    "/action": list(angles.values()),
+                    "/observations/qpos": data.qpos,
+                    "/observations/qvel": data.qvel,
+                    "/observations/target": [
+                        target_step_size_x,
+                        target_step_size_y,
+                        target_yaw,
+                        target_head_pitch,
+                        target_head_yaw,
+                        target_head_z_offset,
+                    ],
+                    "/observations/feet_contact": [right_contact, left_contact],
+                }
             )
 
         prev = data.time
@@ -229,4 +219,6 @@ try:
 
 except KeyboardInterrupt:
     print("stop")
+    # An episode being recorded is ended and saved
+    writer.close()
     exit()
@@ -0,0 +1,19 @@
+import argparse
+import pickle
+
+from mini_bdx.utils.trajectory_dataset import TrajectoryDataset, write_trajectories
+
+# Converts a pickled list of imitation Trajectory objects (as written by the former
+# record_episodes.py) to a trajectory dataset directory
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-i", "--input", type=str, required=True, help=".pkl dataset")
+parser.add_argument("-o", "--output", type=str, default="dataset")
+args = parser.parse_args()
+
+with open(args.input, "rb") as f:
+    trajectories = pickle.load(f)
+write_trajectories(args.output, trajectories)
+
+dataset = TrajectoryDataset(args.output)
+print(f"{args.output}: {len(dataset)} episodes, {dataset.nb_transitions} transitions")
@@ -4,6 +4,9 @@ from gymnasium import utils
 from gymnasium.envs.mujoco import MujocoEnv
 from gymnasium.spaces import Box
 
+from mini_bdx.utils.mujoco_utils import CachedModelMixin
+from mini_bdx.utils.observation import ObservationLayout
+from mini_bdx.utils.ring_buffer import RingBuffer
 from mini_bdx.walk_engine import WalkEngine
 
 init_pos = {
@@ -40,7 +43,7 @@ dofs = {
 }
 
 
-class BDXEnv(MujocoEnv, utils.EzPickle):
+class BDXEnv(CachedModelMixin, MujocoEnv, utils.EzPickle):
     """
     ## Action space
 
@@ -160,13 +163,29 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         "render_fps": 100,
     }
 
-    def __init__(self, **kwargs):
-        utils.EzPickle.__init__(self, **kwargs)
-        observation_space = Box(low=-np.inf, high=np.inf, shape=(77,), dtype=np.float64)
+    def __init__(self, joint_history_length=3, **kwargs):
+        utils.EzPickle.__init__(
+            self, joint_history_length=joint_history_length, **kwargs
+        )
         self.target_velocity = np.asarray([1, 0, 0])  # x, y, yaw
-        self.joint_history_length = 3
-        self.joint_error_history = self.joint_history_length * [13 * [0]]
-        self.joint_ctrl_history = self.joint_history_length * [13 * [0]]
+        self.joint_history_length = joint_history_length
+        self.joint_error_history = RingBuffer(self.joint_history_length, 13)
+        self.joint_ctrl_history = RingBuffer(self.joint_history_length, 13)
+        self.obs = ObservationLayout(
+            [
+                ("joints_rotations", 13),
+                ("joints_velocities", 13),
+                ("angular_velocity", 3),
+                ("linear_velocity", 3),
+                ("target_velocity", 3),
+                ("joint_error_history", 13 * self.joint_history_length),
+                ("feet_contact", 2),
+                ("t", 1),
+            ]
+        )
+        observation_space = Box(
+            low=-np.inf, high=np.inf, shape=(len(self.obs),), dtype=np.float64
+        )
 
         self.left_foot_in_contact = 0
         self.right_foot_in_contact = 0
@@ -206,18 +225,11 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         return False
 
     def smoothness_reward(self):
-        # Warning, this function only works if the history is 3 :)
-        smooth = 0
-        t0 = self.joint_ctrl_history[0]
-        t_minus1 = self.joint_ctrl_history[1]
-        t_minus2 = self.joint_ctrl_history[2]
-
-        for i in range(13):
-            smooth += 2.5 * np.square(t0[i] - t_minus1[i]) + 1.5 * np.square(
-                t0[i] - 2 * t_minus1[i] + t_minus2[i]
-            )
-
-        return -smooth
+        # Penalizes the last control variation and acceleration
+        return -(
+            2.5 * self.joint_ctrl_history.squared_differences(1, last=1)
+            + 1.5 * self.joint_ctrl_history.squared_differences(2, last=1)
+        )
 
     def feet_contact_reward(self):
 
@@ -369,33 +381,24 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
             self.data.qpos[i + 7] = value
 
     def _get_obs(self):
+        cvel = self.data.body("base").cvel
+        self.obs["joints_rotations"] = self.data.qpos[7 : 7 + 13]
+        self.obs["joints_velocities"] = self.data.qvel[6 : 6 + 13]
 
-        joints_rotations = self.data.qpos[7 : 7 + 13]
-        joints_velocities = self.data.qvel[6 : 6 + 13]
+        self.joint_error_history.push(self.data.ctrl - self.data.qpos[7 : 7 + 13])
+        self.obs.set_history("joint_error_history", self.joint_error_history)
 
-        joints_error = self.data.ctrl - self.data.qpos[7 : 7 + 13]
-        self.joint_error_history.append(joints_error)
-        self.joint_error_history = self.joint_error_history[
-            -self.joint_history_length :
-        ]
+        # TODO this is imu, add noise to it later
+        self.obs["angular_velocity"] = cvel[:3]
+        self.obs["linear_velocity"] = cvel[3:]
 
-        angular_velocity = self.data.body("base").cvel[
-            :3
-        ]  # TODO this is imu, add noise to it later
-        linear_velocity = self.data.body("base").cvel[3:]
+        self.joint_ctrl_history.push(self.data.ctrl)
 
-        self.joint_ctrl_history.append(self.data.ctrl.copy())
-        self.joint_ctrl_history = self.joint_ctrl_history[-self.joint_history_length :]
+        self.obs["target_velocity"] = self.target_velocity
+        self.obs["feet_contact"] = [
+            self.left_foot_in_contact,
+            self.right_foot_in_contact,
+        ]
+        self.obs["t"] = self.data.time
 
-        return np.concatenate(
-            [
-                joints_rotations,
-                joints_velocities,
-                angular_velocity,
-                linear_velocity,
-                self.target_velocity,
-                np.array(self.joint_error_history).flatten(),
-                [self.left_foot_in_contact, self.right_foot_in_contact],
-                [self.data.time],
-            ]
-        )
+        return self.obs.get()
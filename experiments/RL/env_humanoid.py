@@ -6,6 +6,7 @@ from gymnasium import utils
 from gymnasium.envs.mujoco import MujocoEnv
 from gymnasium.spaces import Box
 
+from mini_bdx.utils.mujoco_utils import CachedModelMixin
 from mini_bdx.walk_engine import WalkEngine
 
 
@@ -15,7 +16,7 @@ def mass_center(model, data):
     return (np.sum(mass * xpos, axis=0) / np.sum(mass))[0:2].copy()
 
 
-class BDXEnv(MujocoEnv, utils.EzPickle):
+class BDXEnv(CachedModelMixin, MujocoEnv, utils.EzPickle):
     """
     ## Action space
 
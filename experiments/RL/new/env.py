@@ -3,10 +3,14 @@ from gymnasium import utils
 from gymnasium.envs.mujoco import MujocoEnv
 from gymnasium.spaces import Box
 
+from mini_bdx.utils.mujoco_utils import CachedModelMixin
+from mini_bdx.utils.observation import ObservationLayout
+from mini_bdx.utils.ring_buffer import RingBuffer
+
 FRAME_SKIP = 10
 
 
-class BDXEnv(MujocoEnv, utils.EzPickle):
+class BDXEnv(CachedModelMixin, MujocoEnv, utils.EzPickle):
     """
     ## Action space
 
@@ -131,13 +135,27 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
     # Ideas
     # Low pass filter on the joint angles
 
-    def __init__(self, **kwargs):
-        utils.EzPickle.__init__(self, **kwargs)
-        observation_space = Box(low=-np.inf, high=np.inf, shape=(86,), dtype=np.float64)
+    def __init__(self, joint_history_length=3, **kwargs):
+        utils.EzPickle.__init__(
+            self, joint_history_length=joint_history_length, **kwargs
+        )
         self.target_velocity = np.asarray([0, 0, 0])  # x, y, yaw
-        self.joint_history_length = 3
-        self.joint_error_history = self.joint_history_length * [15 * [0]]
-        self.joint_ctrl_history = self.joint_history_length * [15 * [0]]
+        self.joint_history_length = joint_history_length
+        self.joint_ctrl_history = RingBuffer(self.joint_history_length, 15)
+        self.obs = ObservationLayout(
+            [
+                ("joints_rotations", 15),
+                ("joints_velocities", 15),
+                ("angular_velocity", 3),
+                ("linear_velocity", 3),
+                ("target_velocity", 3),
+                ("joint_ctrl_history", 15 * self.joint_history_length),
+                ("feet_contact", 2),
+            ]
+        )
+        observation_space = Box(
+            low=-np.inf, high=np.inf, shape=(len(self.obs),), dtype=np.float64
+        )
 
         self.left_foot_in_contact = 0
         self.right_foot_in_contact = 0
@@ -200,35 +218,15 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         return np.exp(-np.square(base_velocity - self.target_velocity).sum())
 
     def smoothness_reward(self):
-        # Warning, this function only works if the history is 3 :)
-        smooth = 0
-        t0 = self.joint_ctrl_history[0]
-        t_minus1 = self.joint_ctrl_history[1]
-        t_minus2 = self.joint_ctrl_history[2]
-
-        for i in range(15):
-            smooth += 2.5 * np.square(t0[i] - t_minus1[i]) + 1.5 * np.square(
-                t0[i] - 2 * t_minus1[i] + t_minus2[i]
-            )
-
-        return -smooth
+        # Penalizes the last control variation and acceleration
+        return -(
+            2.5 * self.joint_ctrl_history.squared_differences(1, last=1)
+            + 1.5 * self.joint_ctrl_history.squared_differences(2, last=1)
+        )
 
     def smoothness_reward2(self):
-        # Warning, this function only works if the history is 3 :)
-        smooth = 0
-        t0 = self.joint_ctrl_history[0]
-        t_minus1 = self.joint_ctrl_history[1]
-        t_minus2 = self.joint_ctrl_history[2]
-
-        for i in range(15):
-            smooth += np.square(t0[i] - t_minus1[i]) + np.square(
-                t_minus1[i] - t_minus2[i]
-            )
-            # smooth += 2.5 * np.square(t0[i] - t_minus1[i]) + 1.5 * np.square(
-            #     t0[i] - 2 * t_minus1[i] + t_minus2[i]
-            # )
-
-        return -smooth
+        # Penalizes all the control variations over the history
+        return -self.joint_ctrl_history.squared_differences(1)
 
     def joint_velocity_reward(self):
         return -np.square(self.data.qvel[:]).sum()
@@ -256,17 +254,10 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
 
     def action_LFP(self, action):
         # Low pass filter for the actions
-        action_tminus1 = self.joint_ctrl_history[0]
-        action_tminus2 = self.joint_ctrl_history[1]
-        action_tminus3 = self.joint_ctrl_history[2]
-        # return action * 0.5 + action_tminus1 * 0.5
-        return (
-            action * 0.5
-            + action_tminus1 * 0.3
-            + action_tminus2 * 0.15
-            + action_tminus3 * 0.05
-        )
+        # return action * 0.5 + self.joint_ctrl_history.fir([0.5])
+        return action * 0.5 + self.joint_ctrl_history.fir([0.3, 0.15, 0.05])
 
+        action_tminus1 = self.joint_ctrl_history.latest()
         d_action = action - action_tminus1
 
         action = [
@@ -330,8 +321,7 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
 
         self.goto_init()
 
-        self.joint_error_history = self.joint_history_length * [15 * [0]]
-        self.joint_ctrl_history = self.joint_history_length * [15 * [0]]
+        self.joint_ctrl_history.reset()
         # qpos = self.data.qpos
 
         # LATEST
@@ -359,31 +349,21 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         self.data.ctrl[:] = self.init_pos
 
     def _get_obs(self):
-        joints_rotations = self.data.qpos[7 : 7 + 15]
-        joints_velocities = self.data.qvel[6 : 6 + 15]
+        cvel = self.data.body("base").cvel
+        self.obs["joints_rotations"] = self.data.qpos[7 : 7 + 15]
+        self.obs["joints_velocities"] = self.data.qvel[6 : 6 + 15]
 
-        # joints_error = self.data.ctrl - self.data.qpos[7 : 7 + 13]
-        # self.joint_error_history.append(joints_error)
-        # self.joint_error_history = self.joint_error_history[
-        #     -self.joint_history_length :
-        # ]
+        # TODO this is imu, add noise to it later
+        self.obs["angular_velocity"] = cvel[:3]
+        self.obs["linear_velocity"] = cvel[3:]
+        self.obs["target_velocity"] = self.target_velocity
 
-        angular_velocity = self.data.body("base").cvel[
-            :3
-        ]  # TODO this is imu, add noise to it later
-        linear_velocity = self.data.body("base").cvel[3:]
+        self.joint_ctrl_history.push(self.data.ctrl)
+        self.obs.set_history("joint_ctrl_history", self.joint_ctrl_history)
 
-        self.joint_ctrl_history.append(self.data.ctrl.copy())
-        self.joint_ctrl_history = self.joint_ctrl_history[-self.joint_history_length :]
+        self.obs["feet_contact"] = [
+            self.left_foot_in_contact,
+            self.right_foot_in_contact,
+        ]
 
-        return np.concatenate(
-            [
-                joints_rotations,
-                joints_velocities,
-                angular_velocity,
-                linear_velocity,
-                self.target_velocity,
-                np.array(self.joint_ctrl_history).flatten(),
-                [self.left_foot_in_contact, self.right_foot_in_contact],
-            ]
-        )
+        return self.obs.get()
@@ -0,0 +1,301 @@
+import argparse
+import csv
+import itertools
+import os
+import time
+from glob import glob
+
+import gymnasium as gym
+import mujoco
+import numpy as np
+from sb3_contrib import TQC
+from scipy.spatial.transform import Rotation as R
+from shm_vec_env import ShmVecEnv
+from simple_env import BDXEnv
+from stable_baselines3 import A2C, PPO, SAC, TD3
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from mini_bdx.utils.policy_runner import PolicyRunner
+
+# Headless evaluation of checkpoints (SB3 zip or ONNX) on a grid of cases:
+# commanded velocities x seeds x terrains x frictions. Each case is one episode,
+# cases run in parallel worker processes (ShmVecEnv) and the policy is called once
+# per step for all of them. Writes one row of metrics per (checkpoint, case) to a
+# csv, and prints the per checkpoint averages.
+# Terrains are floor slopes (degrees), simulated by tilting the gravity.
+
+ALGOS = {"SAC": SAC, "TD3": TD3, "A2C": A2C, "TQC": TQC, "PPO": PPO}
+
+METRICS = [
+    "survival_time",  # s, max_duration if the robot did not fall
+    "fell",
+    "xy_velocity_error",  # m/s, mean while walking
+    "yaw_velocity_error",  # rad/s, mean while walking
+    "energy",  # J, actuators mechanical work while walking
+    "foot_slip",  # m/s, mean horizontal speed of the feet in contact
+]
+
+
+def make_cases(commands, seeds, terrains, frictions):
+    cases = []
+    for command, seed, slope, friction in itertools.product(
+        commands, seeds, terrains, frictions
+    ):
+        cases.append(
+            {"command": command, "seed": seed, "slope": slope, "friction": friction}
+        )
+    return cases
+
+
+class EvalWrapper(gym.Wrapper):
+    # Applies an evaluation case to a BDX env (see set_case()), and measures the
+    # episode, the metrics being in info["episode_metrics"] of its last step.
+    # Episodes are truncated after max_duration seconds
+    def __init__(self, env, max_duration=10.0):
+        super().__init__(env)
+        self.max_duration = max_duration
+        model = env.unwrapped.model
+        self.nominal_friction = model.geom_friction.copy()
+        self.nominal_gravity = model.opt.gravity.copy()
+        # The feet bodies are frames without geoms, the collision geoms belong to
+        # their parents. The bodies of the subtree of the closest ancestor with
+        # geoms are flagged (parents come before their children)
+        self.floor_id = mujoco.mj_name2id(model, mujoco.mjtObj.mjOBJ_BODY, "floor")
+        self.feet_ids = []
+        self.feet_bodies = []
+        for foot in ["left_foot", "right_foot"]:
+            foot_id = mujoco.mj_name2id(model, mujoco.mjtObj.mjOBJ_BODY, foot)
+            root_id = foot_id
+            while model.body_geomnum[root_id] == 0 and root_id > 0:
+                root_id = model.body_parentid[root_id]
+            bodies = np.zeros(model.nbody, dtype=bool)
+            bodies[root_id] = True
+            for body_id in range(root_id + 1, model.nbody):
+                bodies[body_id] = bodies[model.body_parentid[body_id]]
+            self.feet_ids.append(foot_id)
+            self.feet_bodies.append(bodies)
+        self.foot_velocity = np.zeros(6)
+        self.set_case(
+            {"command": [0.05, 0, 0], "seed": None, "slope": 0.0, "friction": 1.0}
+        )
+
+    def set_case(self, case):
+        self.case = case
+        env = self.env.unwrapped
+        env.fixed_target_velocities = case["command"]
+        env.model.geom_friction[:] = self.nominal_friction
+        env.model.geom_friction[:, 0] *= case["friction"]
+        tilt = R.from_euler("y", case["slope"], degrees=True)
+        env.model.opt.gravity[:] = tilt.apply(self.nominal_gravity)
+
+    def reset(self, seed=None, options=None):
+        # Every episode of a case starts from its seed, the global numpy generator
+        # (used by the envs) included
+        if self.case["seed"] is not None:
+            seed = self.case["seed"]
+            np.random.seed(seed)
+        obs, info = self.env.reset(seed=seed, options=options)
+        self.start_time = self.env.unwrapped.data.time
+        self.walking_steps = 0
+        self.xy_error = 0.0
+        self.yaw_error = 0.0
+        self.energy = 0.0
+        self.slip = 0.0
+        self.contact_steps = 0
+        return obs, info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        env = self.env.unwrapped
+        data = env.data
+
+        if env.startup_cooldown <= 0:
+            cvel = data.body("base").cvel
+            target = env.target_velocities
+            self.walking_steps += 1
+            self.xy_error += abs(target[0] - cvel[3]) + abs(target[1] - cvel[4])
+            self.yaw_error += abs(target[2] - cvel[2])
+            power = np.abs(data.actuator_force * data.actuator_velocity)
+            self.energy += np.sum(power) * env.dt
+            ncon = data.ncon
+            body1 = env.model.geom_bodyid[data.contact.geom1[:ncon]]
+            body2 = env.model.geom_bodyid[data.contact.geom2[:ncon]]
+            for foot_id, bodies in zip(self.feet_ids, self.feet_bodies):
+                on_floor = (bodies[body1] & (body2 == self.floor_id)) | (
+                    bodies[body2] & (body1 == self.floor_id)
+                )
+                if on_floor.any():
+                    mujoco.mj_objectVelocity(
+                        env.model,
+                        data,
+                        mujoco.mjtObj.mjOBJ_BODY,
+                        foot_id,
+                        self.foot_velocity,
+                        0,
+                    )
+                    self.slip += np.linalg.norm(self.foot_velocity[3:5])
+                    self.contact_steps += 1
+
+        duration = data.time - self.start_time
+        if duration >= self.max_duration:
+            truncated = True
+        if terminated or truncated:
+            walking_steps = max(self.walking_steps, 1)
+            info["episode_metrics"] = {
+                "survival_time": duration,
+                "fell": bool(terminated),
+                "xy_velocity_error": self.xy_error / walking_steps,
+                "yaw_velocity_error": self.yaw_error / walking_steps,
+                "energy": self.energy,
+                "foot_slip": self.slip / max(self.contact_steps, 1),
+            }
+        return obs, reward, terminated, truncated, info
+
+
+def make_env(max_duration):
+    return EvalWrapper(BDXEnv(), max_duration=max_duration)
+
+
+def list_checkpoints(paths):
+    # Directories are expanded to the zip and onnx files they contain
+    checkpoints = []
+    for path in paths:
+        if os.path.isdir(path):
+            checkpoints += sorted(glob(os.path.join(path, "*.zip")))
+            checkpoints += sorted(glob(os.path.join(path, "*.onnx")))
+        else:
+            checkpoints.append(path)
+    return checkpoints
+
+
+def load_policy(path, algo, batch_size):
+    # Returns a function mapping a (n, obs_size) batch to (n, action_size) actions
+    if path.endswith(".onnx"):
+        runner = PolicyRunner(path, batch_size=batch_size)
+        return runner.infer_batch
+    model = ALGOS[algo].load(path, device="cpu")
+    return lambda observations: model.predict(observations, deterministic=True)[0]
+
+
+def evaluate(vec_env, policy, cases):
+    # Runs the cases by chunks of vec_env.num_envs, returns the metrics of each case
+    # and the number of simulated steps per second
+    num_envs = vec_env.num_envs
+    low, high = vec_env.action_space.low, vec_env.action_space.high
+    results = [None for _ in cases]
+    total_steps = 0
+    start = time.time()
+
+    for chunk_start in range(0, len(cases), num_envs):
+        chunk = list(range(chunk_start, min(chunk_start + num_envs, len(cases))))
+        for i, case_index in enumerate(chunk):
+            vec_env.env_method("set_case", cases[case_index], indices=i)
+
+        running = np.zeros(num_envs, dtype=bool)
+        running[: len(chunk)] = True
+        obs = vec_env.reset()
+        while running.any():
+            actions = np.clip(policy(obs), low, high)
+            obs, _, dones, infos = vec_env.step(actions)
+            total_steps += running.sum()
+            for i in np.flatnonzero(dones & running):
+                results[chunk[i]] = infos[i]["episode_metrics"]
+                running[i] = False
+
+    return results, total_steps / (time.time() - start)
+
+
+def parse_commands(commands):
+    # "vx,vy,vtheta" strings
+    return [[float(v) for v in command.split(",")] for command in commands]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless evaluation")
+    parser.add_argument(
+        "-p",
+        "--paths",
+        nargs="+",
+        required=True,
+        help="Checkpoints (zip or onnx) or directories of checkpoints",
+    )
+    parser.add_argument("-a", "--algo", default="SAC", help="For the zip checkpoints")
+    parser.add_argument(
+        "-c",
+        "--commands",
+        nargs="+",
+        default=["0.05,0,0"],
+        help="Commanded velocities, as vx,vy,vtheta",
+    )
+    parser.add_argument("-s", "--seeds", nargs="+", type=int, default=[0, 1, 2])
+    parser.add_argument(
+        "--terrains",
+        nargs="+",
+        type=float,
+        default=[0.0],
+        help="Floor slopes, in degrees",
+    )
+    parser.add_argument(
+        "--frictions",
+        nargs="+",
+        type=float,
+        default=[1.0],
+        help="Scales of the sliding friction",
+    )
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument(
+        "-e", "--num_envs", type=int, default=8, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--dummy", action="store_true", help="Run the envs in this process"
+    )
+    parser.add_argument("-o", "--output", default="evaluation.csv")
+    args = parser.parse_args()
+
+    cases = make_cases(
+        parse_commands(args.commands), args.seeds, args.terrains, args.frictions
+    )
+    checkpoints = list_checkpoints(args.paths)
+    num_envs = min(args.num_envs, len(cases))
+    env_fns = [lambda: make_env(args.duration) for _ in range(num_envs)]
+    if args.dummy:
+        vec_env = DummyVecEnv(env_fns)
+    else:
+        vec_env = ShmVecEnv(env_fns)
+
+    rows = []
+    print(
+        f"{'checkpoint':>40} {'survival':>9} {'fell':>5} {'xy_err':>7} "
+        f"{'yaw_err':>7} {'energy':>8} {'slip':>6} {'steps/s':>8}"
+    )
+    for checkpoint in checkpoints:
+        policy = load_policy(checkpoint, args.algo, num_envs)
+        results, steps_per_second = evaluate(vec_env, policy, cases)
+        for case, metrics in zip(cases, results):
+            rows.append(
+                {
+                    "checkpoint": checkpoint,
+                    "command": ",".join(str(v) for v in case["command"]),
+                    "seed": case["seed"],
+                    "slope": case["slope"],
+                    "friction": case["friction"],
+                    **metrics,
+                    "steps_per_second": steps_per_second,
+                }
+            )
+
+        mean = {name: np.mean([m[name] for m in results]) for name in METRICS}
+        print(
+            f"{os.path.basename(checkpoint)[-40:]:>40} "
+            f"{mean['survival_time']:9.2f} {mean['fell']:5.2f} "
+            f"{mean['xy_velocity_error']:7.4f} {mean['yaw_velocity_error']:7.4f} "
+            f"{mean['energy']:8.2f} {mean['foot_slip']:6.4f} {steps_per_second:8.0f}"
+        )
+
+    vec_env.close()
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved {len(rows)} rows to {args.output}")
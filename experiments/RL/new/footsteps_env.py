@@ -6,12 +6,12 @@ from gymnasium.spaces import Box
 from scipy.spatial.transform import Rotation as R
 
 from mini_bdx.placo_walk_engine import PlacoWalkEngine
-from mini_bdx.utils.mujoco_utils import check_contact, get_contact_force
+from mini_bdx.utils.mujoco_utils import CachedModelMixin, ContactIndex
 
 FRAME_SKIP = 4
 
 
-class BDXEnv(MujocoEnv, utils.EzPickle):
+class BDXEnv(CachedModelMixin, MujocoEnv, utils.EzPickle):
     # Inspired by https://arxiv.org/pdf/2207.12644
     metadata = {
         "render_modes": [
@@ -76,6 +76,7 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         self.pwe = PlacoWalkEngine(
             "/home/antoine/MISC/mini_BDX/mini_bdx/robots/bdx/robot.urdf",
             ignore_feet_contact=True,
+            verbose=False,
         )
 
         self.startup_cooldown = -self.pwe.initial_delay
@@ -91,14 +92,21 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
             **kwargs,
         )
 
-    def is_terminated(self) -> bool:
-        left_antenna_contact = check_contact(
-            self.data, self.model, "left_antenna_assembly", "floor"
-        )
-        right_antenna_contact = check_contact(
-            self.data, self.model, "right_antenna_assembly", "floor"
+        self.contacts = ContactIndex(
+            self.model,
+            [
+                ("left_antenna_assembly", "floor"),
+                ("right_antenna_assembly", "floor"),
+                ("body_module", "floor"),
+                ("right_foot", "floor"),
+                ("left_foot", "floor"),
+            ],
         )
-        body_contact = check_contact(self.data, self.model, "body_module", "floor")
+
+    def is_terminated(self) -> bool:
+        left_antenna_contact = self.contacts.contact("left_antenna_assembly", "floor")
+        right_antenna_contact = self.contacts.contact("right_antenna_assembly", "floor")
+        body_contact = self.contacts.contact("body_module", "floor")
         rot = np.array(self.data.body("base").xmat).reshape(3, 3)
         Z_vec = rot[:, 2]
         Z_vec /= np.linalg.norm(Z_vec)
@@ -131,12 +139,8 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         #   - penalize speed on both feet
 
         support_phase = self.pwe.get_current_support_phase()  # left, right, both
-        right_contact_force = np.sum(
-            get_contact_force(self.data, self.model, "right_foot", "floor")
-        )
-        left_contact_force = np.sum(
-            get_contact_force(self.data, self.model, "left_foot", "floor")
-        )
+        right_contact_force = np.sum(self.contacts.force("right_foot", "floor"))
+        left_contact_force = np.sum(self.contacts.force("left_foot", "floor"))
         right_speed = self.data.body("right_foot").cvel[3:]  # [rot:vel] size 6
         left_speed = self.data.body("left_foot").cvel[3:]  # [rot:vel] size 6
 
@@ -165,12 +169,8 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
     def support_flying_reward(self):
         # Idea : reward when there is a support foot and a flying foot
         # penalize when both feet are in the air or both feet are on the ground
-        right_contact_force = abs(
-            np.sum(get_contact_force(self.data, self.model, "right_foot", "floor"))
-        )
-        left_contact_force = abs(
-            np.sum(get_contact_force(self.data, self.model, "left_foot", "floor"))
-        )
+        right_contact_force = abs(np.sum(self.contacts.force("right_foot", "floor")))
+        left_contact_force = abs(np.sum(self.contacts.force("left_foot", "floor")))
         right_speed = np.linalg.norm(
             self.data.body("right_foot").cvel[3:]
         )  # [rot:vel] size 6
@@ -270,6 +270,7 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
 
         if self.startup_cooldown > 0:
             self.do_simulation(self.init_pos, FRAME_SKIP)
+            self.contacts.update(self.data)
             reward = 0
         else:
             # We want to learn deltas from the initial position
@@ -281,6 +282,7 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
             a = np.clip(a, current_ctrl - delta_max, current_ctrl + delta_max)
 
             self.do_simulation(a, FRAME_SKIP)
+            self.contacts.update(self.data)
 
             self.pwe.tick(dt)
 
@@ -339,6 +341,7 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         self.goto_init()
 
         self.set_state(self.data.qpos, self.data.qvel)
+        self.contacts.update(self.data)
         return self._get_obs()
 
     def goto_init(self):
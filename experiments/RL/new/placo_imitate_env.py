@@ -3,8 +3,10 @@ from gymnasium import utils
 from gymnasium.envs.mujoco import MujocoEnv
 from gymnasium.spaces import Box
 
-from mini_bdx.placo_walk_engine import PlacoWalkEngine
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.placo_walk_engine import PlacoWalkEngine, ReferenceTrajectories
+from mini_bdx.utils.mujoco_utils import CachedModelMixin, check_contact
+from mini_bdx.utils.observation import ObservationLayout
+from mini_bdx.utils.ring_buffer import RingBuffer
 
 # from placo_utils.visualization import robot_viz
 
@@ -12,7 +14,7 @@ from mini_bdx.utils.mujoco_utils import check_contact
 FRAME_SKIP = 4
 
 
-class BDXEnv(MujocoEnv, utils.EzPickle):
+class BDXEnv(CachedModelMixin, MujocoEnv, utils.EzPickle):
     metadata = {
         "render_modes": [
             "human",
@@ -22,48 +24,60 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         "render_fps": 125,
     }
 
-    def __init__(self, **kwargs):
-        utils.EzPickle.__init__(self, **kwargs)
+    def __init__(
+        self, reference_trajectories_path=None, joint_history_length=3, **kwargs
+    ):
+        utils.EzPickle.__init__(
+            self,
+            reference_trajectories_path=reference_trajectories_path,
+            joint_history_length=joint_history_length,
+            **kwargs,
+        )
         self.nb_dofs = 15
 
         self.target_velocity = np.asarray([0, 0, 0])  # x, y, yaw
-        self.joint_history_length = 3
-        self.joint_error_history = self.joint_history_length * [self.nb_dofs * [0]]
-        self.joint_ctrl_history = self.joint_history_length * [self.nb_dofs * [0]]
+        self.joint_history_length = joint_history_length
+        self.joint_ctrl_history = RingBuffer(self.joint_history_length, self.nb_dofs)
 
         # observation_space = Box(
         #     low=-np.inf, high=np.inf, shape=(101,), dtype=np.float64
         # )
 
+        self.obs = ObservationLayout(
+            [
+                ("joints_rotations", self.nb_dofs),
+                ("joints_velocities", self.nb_dofs),
+                ("angular_velocity", 3),
+                ("linear_velocity", 3),
+                ("target_velocity", 3),
+                ("joint_ctrl_history", self.nb_dofs * self.joint_history_length),
+                ("feet_contact", 2),
+                ("placo_angles", self.nb_dofs),
+            ]
+        )
         observation_space = Box(
-            np.array(
-                [
-                    *(-np.pi * np.ones(self.nb_dofs)),  # joints_rotations
-                    *(-10 * np.ones(self.nb_dofs)),  # joints_velocities
-                    *(-10 * np.ones(3)),  # angular_velocity
-                    *(-10 * np.ones(3)),  # linear_velocity
-                    *(-10 * np.ones(3)),  # target_velocity
-                    *(
-                        -np.pi * np.ones(self.nb_dofs * self.joint_history_length)
-                    ),  # joint_ctrl_history
-                    *(np.zeros(2)),  # feet_contact
-                    *(-np.pi * np.ones(self.nb_dofs)),  # placo_angles
-                ]
-            ),
-            np.array(
-                [
-                    *(np.pi * np.ones(self.nb_dofs)),  # joints_rotations
-                    *(10 * np.ones(self.nb_dofs)),  # joints_velocities
-                    *(10 * np.ones(3)),  # angular_velocity
-                    *(10 * np.ones(3)),  # linear_velocity
-                    *(10 * np.ones(3)),  # target_velocity
-                    *(
-                        np.pi * np.ones(self.nb_dofs * self.joint_history_length)
-                    ),  # joint_ctrl_history
-                    *(np.ones(2)),  # feet_contact
-                    *(np.pi * np.ones(self.nb_dofs)),  # placo_angles
-                ]
-            ),
+            *self.obs.bounds(
+                low={
+                    "joints_rotations": -np.pi,
+                    "joints_velocities": -10,
+                    "angular_velocity": -10,
+                    "linear_velocity": -10,
+                    "target_velocity": -10,
+                    "joint_ctrl_history": -np.pi,
+                    "feet_contact": 0,
+                    "placo_angles": -np.pi,
+                },
+                high={
+                    "joints_rotations": np.pi,
+                    "joints_velocities": 10,
+                    "angular_velocity": 10,
+                    "linear_velocity": 10,
+                    "target_velocity": 10,
+                    "joint_ctrl_history": np.pi,
+                    "feet_contact": 1,
+                    "placo_angles": np.pi,
+                },
+            )
         )
 
         self.left_foot_in_contact = 0
@@ -91,10 +105,20 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
             ]
         )
 
-        self.pwe = PlacoWalkEngine(
-            "/home/antoine/MISC/mini_BDX/mini_bdx/robots/bdx/robot.urdf",
-            ignore_feet_contact=True,
-        )
+        # Precomputed walk cycles (see ReferenceTrajectories) replace the online
+        # walk engine when provided
+        self.references = None
+        if reference_trajectories_path is not None:
+            self.references = ReferenceTrajectories.load(reference_trajectories_path)
+            # Starts standing still as the online walk engine
+            self.reference_t = self.references.initial_delay
+            self.walk_command = [0.0, 0.0, 0.0]  # d_x, d_y, d_theta
+        else:
+            self.pwe = PlacoWalkEngine(
+                "/home/antoine/MISC/mini_BDX/mini_bdx/robots/bdx/robot.urdf",
+                ignore_feet_contact=True,
+                verbose=False,
+            )
 
         # self.viz = robot_viz(self.pwe.robot)
         MujocoEnv.__init__(
@@ -105,6 +129,21 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
             **kwargs,
         )
 
+        if self.references is not None:
+            # References are written as is in the joints slots, their joints must
+            # be the env ones, in the same order
+            joints = []
+            for i in range(self.model.njnt):
+                address = self.model.jnt_qposadr[i]
+                if 7 <= address < 7 + self.nb_dofs:
+                    joints.append((address, self.model.joint(i).name))
+            joints = [name for _, name in sorted(joints)]
+            if self.references.joints != joints:
+                raise Exception(
+                    f"{reference_trajectories_path} joints {self.references.joints} "
+                    f"do not match the env joints {joints}"
+                )
+
     def is_terminated(self) -> bool:
         rot = np.array(self.data.body("base").xmat).reshape(3, 3)
         Z_vec = rot[:, 2]
@@ -119,9 +158,22 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         left_contact = check_contact(self.data, self.model, "foot_module_2", "floor")
         return right_contact, left_contact
 
+    def get_placo_angles(self, out=None):
+        if self.references is not None:
+            if self.references.is_standing(self.reference_t):
+                angles = self.references.stand_angles
+            else:
+                phase = self.references.get_phase(self.reference_t)
+                angles = self.references.get_angles(*self.walk_command, phase)
+            if out is not None:
+                out[:] = angles
+            return angles
+
+        return self.pwe.get_angles_array(out)
+
     def follow_placo_reward(self):
         current_pos = self.data.qpos[7 : 7 + self.nb_dofs]
-        placo_angles = list(self.pwe.get_angles().values())
+        placo_angles = self.get_placo_angles()
         # print(np.around(placo_angles, 2))
         error = np.linalg.norm(placo_angles - current_pos)
         return -np.square(error)
@@ -144,21 +196,8 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         return np.square(np.dot(np.array([0, 0, 1]), Z_vec))
 
     def smoothness_reward2(self):
-        # Warning, this function only works if the history is 3 :)
-        smooth = 0
-        t0 = self.joint_ctrl_history[0]
-        t_minus1 = self.joint_ctrl_history[1]
-        t_minus2 = self.joint_ctrl_history[2]
-
-        for i in range(15):
-            smooth += np.square(t0[i] - t_minus1[i]) + np.square(
-                t_minus1[i] - t_minus2[i]
-            )
-            # smooth += 2.5 * np.square(t0[i] - t_minus1[i]) + 1.5 * np.square(
-            #     t0[i] - 2 * t_minus1[i] + t_minus2[i]
-            # )
-
-        return -smooth
+        # Penalizes all the control variations over the history
+        return -self.joint_ctrl_history.squared_differences(1)
 
     def step(self, a):
 
@@ -185,9 +224,12 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
             #     self.get_feet_contact()
             # )
 
-            self.pwe.tick(
-                dt
-            )  # , self.left_foot_in_contact, self.right_foot_in_contact)
+            if self.references is not None:
+                self.reference_t += dt
+            else:
+                self.pwe.tick(
+                    dt
+                )  # , self.left_foot_in_contact, self.right_foot_in_contact)
 
             reward = (
                 0.05  # time reward
@@ -211,12 +253,14 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
     def reset_model(self):
         self.prev_t = self.data.time
         self.startup_cooldown = 1.0
-        self.pwe.reset()
+        if self.references is not None:
+            self.reference_t = self.references.initial_delay
+        else:
+            self.pwe.reset()
 
         self.goto_init()
 
-        self.joint_error_history = self.joint_history_length * [self.nb_dofs * [0]]
-        self.joint_ctrl_history = self.joint_history_length * [self.nb_dofs * [0]]
+        self.joint_ctrl_history.reset()
 
         self.target_velocity = np.asarray([0.2, 0, 0])  # x, y, yaw
 
@@ -232,27 +276,22 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         self.data.ctrl[:] = self.init_pos
 
     def _get_obs(self):
+        cvel = self.data.body("base").cvel
+        self.obs["joints_rotations"] = self.data.qpos[7 : 7 + self.nb_dofs]
+        self.obs["joints_velocities"] = self.data.qvel[6 : 6 + self.nb_dofs]
 
-        joints_rotations = self.data.qpos[7 : 7 + self.nb_dofs]
-        joints_velocities = self.data.qvel[6 : 6 + self.nb_dofs]
+        # TODO this is imu, add noise to it later
+        self.obs["angular_velocity"] = cvel[:3]
+        self.obs["linear_velocity"] = cvel[3:]
+        self.obs["target_velocity"] = self.target_velocity
 
-        angular_velocity = self.data.body("base").cvel[
-            :3
-        ]  # TODO this is imu, add noise to it later
-        linear_velocity = self.data.body("base").cvel[3:]
+        self.joint_ctrl_history.push(self.data.ctrl)
+        self.obs.set_history("joint_ctrl_history", self.joint_ctrl_history)
 
-        self.joint_ctrl_history.append(self.data.ctrl.copy())
-        self.joint_ctrl_history = self.joint_ctrl_history[-self.joint_history_length :]
-        placo_angles = list(self.pwe.get_angles().values())
-        return np.concatenate(
-            [
-                joints_rotations,
-                joints_velocities,
-                angular_velocity,
-                linear_velocity,
-                self.target_velocity,
-                np.array(self.joint_ctrl_history).flatten(),
-                [self.left_foot_in_contact, self.right_foot_in_contact],
-                placo_angles,
-            ]
-        )
+        self.obs["feet_contact"] = [
+            self.left_foot_in_contact,
+            self.right_foot_in_contact,
+        ]
+        self.get_placo_angles(out=self.obs["placo_angles"])
+
+        return self.obs.get()
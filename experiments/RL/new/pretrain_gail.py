@@ -1,5 +1,4 @@
 import argparse
-import pickle
 
 import gymnasium as gym
 import numpy as np
@@ -13,14 +12,20 @@ from stable_baselines3 import PPO
 from stable_baselines3.common.evaluation import evaluate_policy
 from stable_baselines3.ppo import MlpPolicy
 
+from mini_bdx.utils.trajectory_dataset import load_demonstrations
+
 # Check this out https://imitation.readthedocs.io/en/latest/algorithms/bc.html
 
 parser = argparse.ArgumentParser()
-parser.add_argument("-d", "--dataset", type=str, required=True)
+parser.add_argument(
+    "-d", "--dataset", type=str, required=True, help="Dataset directory or .pkl"
+)
 args = parser.parse_args()
 
 
-dataset = pickle.load(open(args.dataset, "rb"))
+DEMO_BATCH_SIZE = 1024
+# Shuffled minibatches read from the memory mapped dataset
+dataset = load_demonstrations(args.dataset, DEMO_BATCH_SIZE)
 
 register(id="BDX_env", entry_point="simple_env:BDXEnv")
 
@@ -53,7 +58,7 @@ reward_net = BasicRewardNet(
 )
 gail_trainer = GAIL(
     demonstrations=dataset,
-    demo_batch_size=1024,
+    demo_batch_size=DEMO_BATCH_SIZE,
     gen_replay_buffer_capacity=512,
     n_disc_updates_per_round=8,
     venv=env,
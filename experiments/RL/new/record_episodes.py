@@ -1,6 +1,4 @@
 import argparse
-import pickle
-from imitation.data.types import Trajectory
 from scipy.spatial.transform import Rotation as R
 import os
 from glob import glob
@@ -12,6 +10,7 @@ import mujoco
 import numpy as np
 from gymnasium.envs.registration import register
 from mini_bdx.placo_walk_engine import PlacoWalkEngine
+from mini_bdx.utils.trajectory_dataset import TrajectoryWriter
 
 register(
     id="BDX_env",
@@ -29,10 +28,13 @@ NB_EPISODES_TO_RECORD = 100
 
 
 def run(env):
-    episodes = []
-    current_episode = {"observations": [], "actions": []}
+    # Episodes are appended to the dataset as they are recorded
+    writer = TrajectoryWriter(
+        "dataset", env.observation_space.shape[0], env.action_space.shape[0]
+    )
+    nb_episodes = 0
     while True:
-        if len(episodes) >= NB_EPISODES_TO_RECORD:
+        if nb_episodes >= NB_EPISODES_TO_RECORD:
             print("DONE, RECORDED", NB_EPISODES_TO_RECORD, "EPISODES")
             break
         print("Starting episode")
@@ -49,30 +51,20 @@ def run(env):
             action -= env.init_pos
             action = np.array(action)
 
+            # Each step is stored with the observation the action was taken from
+            writer.add_step(obs, action)
             obs, _, done, _, _ = env.step(action)
-            current_episode["observations"].append(list(obs))
-            current_episode["actions"].append(list(action))
 
-            if env.data.time - start > EPISODE_LENGTH:
+            if done or env.data.time - start > EPISODE_LENGTH:
                 print("Episode done")
-                current_episode["observations"].append(list(env.reset()[0]))
-
-                episode = Trajectory(
-                    np.array(current_episode["observations"]),
-                    np.array(current_episode["actions"]),
-                    None,
-                    True,
-                )
-                episodes.append(episode)
-
-                with open("dataset.pkl", "wb") as f:
-                    pickle.dump(episodes, f)
-
-                current_episode = {"observations": [], "actions": []}
+                writer.end_episode(obs)
+                nb_episodes += 1
                 done = True
 
             prev = t
 
+    writer.close()
+
 
 if __name__ == "__main__":
     gymenv = gym.make("BDX_env", render_mode="human")
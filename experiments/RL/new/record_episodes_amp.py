@@ -10,7 +10,7 @@ import mujoco_viewer
 import numpy as np
 from imitation.data.types import Trajectory
 from mini_bdx.placo_walk_engine import PlacoWalkEngine
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 from mini_bdx.utils.rl_utils import mujoco_to_isaac
 from scipy.spatial.transform import Rotation as R
 
@@ -36,7 +36,7 @@ current_episode = {
     "Frames": [],
 }
 
-model = mujoco.MjModel.from_xml_path("../../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../../mini_bdx/robots/bdx/scene.xml")
 model.opt.timestep = 0.001
 data = mujoco.MjData(model)
 mujoco.mj_step(model, data)
@@ -1,6 +1,7 @@
 import argparse
 import mujoco_viewer
 import time
+from mini_bdx.utils.mujoco_utils import load_model
 from mini_bdx.utils.rl_utils import mujoco_to_isaac
 import json
 from imitation.data.types import Trajectory
@@ -36,7 +37,7 @@ current_episode = {
     "Frames": [],
 }
 
-model = mujoco.MjModel.from_xml_path("../../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../../mini_bdx/robots/bdx/scene.xml")
 model.opt.timestep = 0.001
 data = mujoco.MjData(model)
 mujoco.mj_step(model, data)
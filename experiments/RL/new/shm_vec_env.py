@@ -0,0 +1,285 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+from gymnasium.spaces import Box
+from stable_baselines3.common.env_util import is_wrapped
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
+
+# Worker commands
+NOOP = 0
+STEP = 1
+RESET = 2
+CALL = 3
+CLOSE = 4
+
+
+class SharedArrays:
+    # Named numpy arrays packed in a single shared memory block. specs is a list of
+    # (name, shape, dtype), the block is created if name is None, attached otherwise
+    def __init__(self, specs, name=None):
+        self.specs = specs
+        offsets = []
+        size = 0
+        for _, shape, dtype in specs:
+            dtype = np.dtype(dtype)
+            size = -(-size // 8) * 8  # 8 bytes alignment
+            offsets.append(size)
+            size += int(np.prod(shape)) * dtype.itemsize
+
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.arrays = {}
+        for (array_name, shape, dtype), offset in zip(specs, offsets):
+            self.arrays[array_name] = np.ndarray(
+                shape, dtype=dtype, buffer=self.shm.buf, offset=offset
+            )
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self, unlink=False):
+        self.arrays = {}
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker(index, env_fn_wrapper, pipe, start_barrier, done_barrier, cpu, quiet):
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, [cpu])
+    if quiet:
+        # At the file descriptor level, to also silence the C++ libraries
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+
+    try:
+        _worker_loop(index, env_fn_wrapper, pipe, start_barrier, done_barrier)
+    except BaseException:
+        # The main process waiting on a barrier gets a BrokenBarrierError
+        start_barrier.abort()
+        done_barrier.abort()
+        raise
+
+
+def _worker_loop(index, env_fn_wrapper, pipe, start_barrier, done_barrier):
+    env = env_fn_wrapper.var()
+    pipe.send((env.observation_space, env.action_space))
+    shared_name, specs = pipe.recv()
+    shared = SharedArrays(specs, shared_name)
+    commands = shared["commands"]
+
+    while True:
+        start_barrier.wait()
+        command = commands[index]
+        # Replies are sent once past the done barrier: a reply larger than the pipe
+        # buffer would block send() until the main process reads it, which it only
+        # does after the barrier
+        reply = None
+
+        if command == STEP:
+            # A copy, envs may modify the action in place
+            obs, reward, terminated, truncated, info = env.step(
+                shared["actions"][index].copy()
+            )
+            done = terminated or truncated
+            if done:
+                shared["terminal_obs"][index] = obs
+                obs, _ = env.reset()
+            shared["obs"][index] = obs
+            shared["rewards"][index] = reward
+            shared["dones"][index] = done
+            shared["truncated"][index] = truncated and not terminated
+
+            # Infos are rare and go through the pipe, only when not empty
+            shared["has_info"][index] = len(info) > 0
+            if len(info) > 0:
+                reply = info
+        elif command == RESET:
+            seed, options = pipe.recv()
+            obs, info = env.reset(seed=seed, options=options)
+            shared["obs"][index] = obs
+            reply = info
+        elif command == CALL:
+            kind, name, args, kwargs = pipe.recv()
+            try:
+                if kind == "get_attr":
+                    result = env.get_wrapper_attr(name)
+                elif kind == "set_attr":
+                    result = setattr(env.unwrapped, name, args[0])
+                elif kind == "env_method":
+                    result = env.get_wrapper_attr(name)(*args, **kwargs)
+                else:
+                    result = is_wrapped(env, args[0])
+            except Exception as e:
+                result = e
+            reply = (result,)
+        elif command == CLOSE:
+            env.close()
+            shared.close()
+            pipe.close()
+            break
+
+        done_barrier.wait()
+        if reply is not None:
+            pipe.send(reply)
+
+
+class ShmVecEnv(VecEnv):
+    # Subprocess vectorized env exchanging observations, actions, rewards and dones
+    # through shared memory. Steps are synchronized with two barriers (start and
+    # done), pipes only carry non empty infos and the get_attr/env_method calls.
+    # Workers are pinned to cores (cpus, all the available ones by default), and
+    # their stdout is silenced if quiet is set.
+    # Can be used as make_vec_env(..., vec_env_cls=ShmVecEnv).
+    def __init__(self, env_fns, start_method=None, cpus=None, quiet=True):
+        num_envs = len(env_fns)
+        if start_method is None:
+            forkserver_available = (
+                "forkserver" in multiprocessing.get_all_start_methods()
+            )
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = multiprocessing.get_context(start_method)
+
+        if cpus is None and hasattr(os, "sched_getaffinity"):
+            cpus = sorted(os.sched_getaffinity(0))
+
+        self.start_barrier = ctx.Barrier(num_envs + 1)
+        self.done_barrier = ctx.Barrier(num_envs + 1)
+        self.pipes = []
+        self.processes = []
+        for i, env_fn in enumerate(env_fns):
+            pipe, worker_pipe = ctx.Pipe()
+            cpu = None if cpus is None else cpus[i % len(cpus)]
+            process = ctx.Process(
+                target=_worker,
+                args=(
+                    i,
+                    CloudpickleWrapper(env_fn),
+                    worker_pipe,
+                    self.start_barrier,
+                    self.done_barrier,
+                    cpu,
+                    quiet,
+                ),
+                daemon=True,
+            )
+            process.start()
+            worker_pipe.close()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+        spaces = [pipe.recv() for pipe in self.pipes]
+        observation_space, action_space = spaces[0]
+        if not isinstance(observation_space, Box):
+            raise Exception("ShmVecEnv only supports Box observation spaces")
+
+        obs_shape = (num_envs,) + observation_space.shape
+        self.shared = SharedArrays(
+            [
+                ("obs", obs_shape, observation_space.dtype),
+                ("terminal_obs", obs_shape, observation_space.dtype),
+                ("actions", (num_envs,) + action_space.shape, action_space.dtype),
+                ("rewards", (num_envs,), np.float64),
+                ("dones", (num_envs,), bool),
+                ("truncated", (num_envs,), bool),
+                ("has_info", (num_envs,), bool),
+                ("commands", (num_envs,), np.int8),
+            ]
+        )
+        for pipe in self.pipes:
+            pipe.send((self.shared.name, self.shared.specs))
+
+        self.closed = False
+        # After the shared memory setup, VecEnv queries the workers render_mode
+        super().__init__(num_envs, observation_space, action_space)
+
+    def _run(self, command, indices=None):
+        # Triggers command on the given workers (all by default), the others idle
+        commands = self.shared["commands"]
+        if indices is None:
+            commands[:] = command
+        else:
+            commands[:] = NOOP
+            commands[indices] = command
+        self.start_barrier.wait()
+
+    def reset(self):
+        for i, pipe in enumerate(self.pipes):
+            options = self._options[i] if hasattr(self, "_options") else None
+            pipe.send((self._seeds[i], options))
+        self._run(RESET)
+        self.done_barrier.wait()
+        self.reset_infos = [pipe.recv() for pipe in self.pipes]
+
+        self._seeds = [None for _ in range(self.num_envs)]
+        if hasattr(self, "_options"):
+            self._options = [{} for _ in range(self.num_envs)]
+        return self.shared["obs"].copy()
+
+    def step_async(self, actions):
+        self.shared["actions"][:] = actions
+        self._run(STEP)
+
+    def step_wait(self):
+        self.done_barrier.wait()
+
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(self.shared["has_info"]):
+            infos[i] = self.pipes[i].recv()
+        for i in np.flatnonzero(self.shared["dones"]):
+            infos[i]["terminal_observation"] = self.shared["terminal_obs"][i].copy()
+            infos[i]["TimeLimit.truncated"] = bool(self.shared["truncated"][i])
+
+        return (
+            self.shared["obs"].copy(),
+            self.shared["rewards"].copy(),
+            self.shared["dones"].copy(),
+            infos,
+        )
+
+    def _call(self, kind, name, args, kwargs, indices):
+        indices = list(self._get_indices(indices))
+        for i in indices:
+            self.pipes[i].send((kind, name, args, kwargs))
+        self._run(CALL, indices)
+        self.done_barrier.wait()
+
+        results = [self.pipes[i].recv()[0] for i in indices]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call("get_attr", attr_name, (), {}, indices)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._call("set_attr", attr_name, (value,), {}, indices)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._call(
+            "env_method", method_name, method_args, method_kwargs, indices
+        )
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._call("env_is_wrapped", None, (wrapper_class,), {}, indices)
+
+    def close(self):
+        if self.closed:
+            return
+        self._run(CLOSE)
+        for process in self.processes:
+            process.join()
+        for pipe in self.pipes:
+            pipe.close()
+        self.shared.close(unlink=True)
+        self.closed = True
@@ -4,12 +4,71 @@ from gymnasium.envs.mujoco import MujocoEnv
 from gymnasium.spaces import Box
 from scipy.spatial.transform import Rotation as R
 
-from mini_bdx.utils.mujoco_utils import check_contact, get_contact_force
+from mini_bdx.utils.mujoco_utils import CachedModelMixin, ContactIndex
+from mini_bdx.utils.observation import ObservationLayout
 
 FRAME_SKIP = 4
-
-
-class BDXEnv(MujocoEnv, utils.EzPickle):
+SCENE_PATH = "../../../mini_bdx/robots/bdx/scene.xml"
+NB_DOFS = 15
+
+INIT_POS = np.array(
+    [
+        -0.013946457213457239,
+        0.07918837709879874,
+        0.5325073962634973,
+        -1.6225192902713386,
+        0.9149246381274986,
+        0.013627156377842975,
+        0.07738878096596595,
+        0.5933527914082196,
+        -1.630548419252953,
+        0.8621333440557593,
+        -0.17453292519943295,
+        -0.17453292519943295,
+        8.65556854322817e-27,
+        0,
+        0,
+    ]
+)
+
+CONTACT_PAIRS = [
+    ("left_antenna_assembly", "floor"),
+    ("right_antenna_assembly", "floor"),
+    ("body_module", "floor"),
+    ("right_foot", "floor"),
+    ("left_foot", "floor"),
+]
+
+OBSERVATION_FIELDS = [
+    ("joints_rotations", NB_DOFS),
+    ("joints_velocities", NB_DOFS),
+    ("angular_velocity", 3),
+    ("linear_velocity", 3),
+    ("target_velocities", 3),  # [x, y, theta]
+    ("feet_contact", 2),  # [left, right]
+    ("clock_signal", 2),
+]
+OBSERVATION_LOW = {
+    "joints_rotations": -np.pi,
+    "joints_velocities": -10,
+    "angular_velocity": -10,
+    "linear_velocity": -10,
+    "target_velocities": -10,
+    "feet_contact": 0,
+    "clock_signal": -np.pi,
+}
+OBSERVATION_HIGH = {
+    "joints_rotations": np.pi,
+    "joints_velocities": 10,
+    "angular_velocity": 10,
+    "linear_velocity": 10,
+    "target_velocities": 10,
+    "feet_contact": 1,
+    "clock_signal": np.pi,
+}
+
+
+class BDXEnv(CachedModelMixin, MujocoEnv, utils.EzPickle):
     metadata = {
         "render_modes": [
             "human",
@@ -19,33 +78,13 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         "render_fps": 125,
     }
 
-    def __init__(self, **kwargs):
-        utils.EzPickle.__init__(self, **kwargs)
-        self.nb_dofs = 15
+    def __init__(self, target_velocities=None, **kwargs):
+        utils.EzPickle.__init__(self, target_velocities=target_velocities, **kwargs)
+        self.nb_dofs = NB_DOFS
 
+        self.obs = ObservationLayout(OBSERVATION_FIELDS)
         observation_space = Box(
-            np.array(
-                [
-                    *(-np.pi * np.ones(self.nb_dofs)),  # joints_rotations
-                    *(-10 * np.ones(self.nb_dofs)),  # joints_velocities
-                    *(-10 * np.ones(3)),  # angular_velocity
-                    *(-10 * np.ones(3)),  # linear_velocity
-                    *(-10 * np.ones(3)),  # target velocity [x, y, theta]
-                    *(0 * np.ones(2)),  # feet contact [left, right]
-                    *(-np.pi * np.ones(2)),  # clock signal
-                ]
-            ),
-            np.array(
-                [
-                    *(np.pi * np.ones(self.nb_dofs)),  # joints_rotations
-                    *(10 * np.ones(self.nb_dofs)),  # joints_velocities
-                    *(10 * np.ones(3)),  # angular_velocity
-                    *(10 * np.ones(3)),  # linear_velocity
-                    *(10 * np.ones(3)),  # target velocity [x, y, theta]
-                    *(1 * np.ones(2)),  # feet contact [left, right]
-                    *(np.pi * np.ones(2)),  # clock signal
-                ]
-            ),
+            *self.obs.bounds(low=OBSERVATION_LOW, high=OBSERVATION_HIGH)
         )
 
         self.right_foot_contact = True
@@ -55,49 +94,31 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         self.prev_torque = np.zeros(self.nb_dofs)
 
         self.prev_t = 0
-        self.init_pos = np.array(
-            [
-                -0.013946457213457239,
-                0.07918837709879874,
-                0.5325073962634973,
-                -1.6225192902713386,
-                0.9149246381274986,
-                0.013627156377842975,
-                0.07738878096596595,
-                0.5933527914082196,
-                -1.630548419252953,
-                0.8621333440557593,
-                -0.17453292519943295,
-                -0.17453292519943295,
-                8.65556854322817e-27,
-                0,
-                0,
-            ]
-        )
+        self.init_pos = INIT_POS.copy()
 
         self.startup_cooldown = 1.0
         self.walk_period = 1.0
         self.target_velocities = np.asarray([0, 0, 0])  # x, y, yaw
+        # Commanded velocities at each reset, [0.05, 0, 0] if None
+        self.fixed_target_velocities = target_velocities
         self.cumulated_reward = 0.0
         self.last_time_both_feet_on_the_ground = 0
         self.init_pos_noise = np.zeros(self.nb_dofs)
 
         MujocoEnv.__init__(
             self,
-            "../../../mini_bdx/robots/bdx/scene.xml",
+            SCENE_PATH,
             FRAME_SKIP,
             observation_space=observation_space,
             **kwargs,
         )
 
+        self.contacts = ContactIndex(self.model, CONTACT_PAIRS)
+
     def is_terminated(self) -> bool:
-        left_antenna_contact = check_contact(
-            self.data, self.model, "left_antenna_assembly", "floor"
-        )
-        right_antenna_contact = check_contact(
-            self.data, self.model, "right_antenna_assembly", "floor"
-        )
-        body_contact = check_contact(self.data, self.model, "body_module", "floor")
+        left_antenna_contact = self.contacts.contact("left_antenna_assembly", "floor")
+        right_antenna_contact = self.contacts.contact("right_antenna_assembly", "floor")
+        body_contact = self.contacts.contact("body_module", "floor")
         rot = np.array(self.data.body("base").xmat).reshape(3, 3)
         Z_vec = rot[:, 2]
         Z_vec /= np.linalg.norm(Z_vec)
@@ -114,12 +135,8 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
     def support_flying_reward(self):
         # Idea : reward when there is a support foot and a flying foot
         # penalize when both feet are in the air or both feet are on the ground
-        right_contact_force = abs(
-            np.sum(get_contact_force(self.data, self.model, "right_foot", "floor"))
-        )
-        left_contact_force = abs(
-            np.sum(get_contact_force(self.data, self.model, "left_foot", "floor"))
-        )
+        right_contact_force = abs(np.sum(self.contacts.force("right_foot", "floor")))
+        left_contact_force = abs(np.sum(self.contacts.force("left_foot", "floor")))
         right_speed = np.linalg.norm(
             self.data.body("right_foot").cvel[3:]
         )  # [rot:vel] size 6
@@ -195,15 +212,12 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         if self.startup_cooldown > 0:
             self.startup_cooldown -= dt
             self.do_simulation(self.init_pos + self.init_pos_noise, FRAME_SKIP)
+            self.contacts.update(self.data)
             reward = 0
             self.last_time_both_feet_on_the_ground = t
         else:
-            self.right_foot_contact = check_contact(
-                self.data, self.model, "right_foot", "floor"
-            )
-            self.left_foot_contact = check_contact(
-                self.data, self.model, "left_foot", "floor"
-            )
+            self.right_foot_contact = self.contacts.contact("right_foot", "floor")
+            self.left_foot_contact = self.contacts.contact("left_foot", "floor")
 
             if self.right_foot_contact and self.left_foot_contact:
                 self.last_time_both_feet_on_the_ground = t
@@ -218,6 +232,7 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
             a[10:] = self.init_pos[10:]  # Only control the legs
 
             self.do_simulation(a, FRAME_SKIP)
+            self.contacts.update(self.data)
 
             # IDEA : normalize reward by the episode length ?
             reward = (
@@ -274,7 +289,10 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         v_y = np.random.uniform(-0.03, 0.03)
         v_theta = np.random.uniform(-0.1, 0.1)
         # self.target_velocities = np.asarray([v_x, v_y, v_theta])  # x, y, yaw
-        self.target_velocities = np.asarray([0.05, 0, 0])  # x, y, yaw
+        if self.fixed_target_velocities is None:
+            self.target_velocities = np.asarray([0.05, 0, 0])  # x, y, yaw
+        else:
+            self.target_velocities = np.asarray(self.fixed_target_velocities)
 
         self.prev_action = np.zeros(self.nb_dofs)
         self.prev_torque = np.zeros(self.nb_dofs)
@@ -282,6 +300,7 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         self.goto_init()
 
         self.set_state(self.data.qpos, self.data.qvel)
+        self.contacts.update(self.data)
         return self._get_obs()
 
     def goto_init(self):
@@ -300,21 +319,16 @@ class BDXEnv(MujocoEnv, utils.EzPickle):
         return [a, b]
 
     def _get_obs(self):
-        joints_rotations = self.data.qpos[7 : 7 + self.nb_dofs]
-        joints_velocities = self.data.qvel[6 : 6 + self.nb_dofs]
+        cvel = self.data.body("base").cvel
+        self.obs["joints_rotations"] = self.data.qpos[7 : 7 + self.nb_dofs]
+        self.obs["joints_velocities"] = self.data.qvel[6 : 6 + self.nb_dofs]
 
         # TODO this is imu, add noise to it later
-        angular_velocity = self.data.body("base").cvel[:3]
-        linear_velocity = self.data.body("base").cvel[3:]
-
-        return np.concatenate(
-            [
-                joints_rotations,
-                joints_velocities,
-                angular_velocity,
-                linear_velocity,
-                self.target_velocities,
-                [self.left_foot_contact, self.right_foot_contact],
-                self.get_clock_signal(),
-            ]
-        )
+        self.obs["angular_velocity"] = cvel[:3]
+        self.obs["linear_velocity"] = cvel[3:]
+
+        self.obs["target_velocities"] = self.target_velocities
+        self.obs["feet_contact"] = [self.left_foot_contact, self.right_foot_contact]
+        self.obs["clock_signal"] = self.get_clock_signal()
+
+        return self.obs.get()
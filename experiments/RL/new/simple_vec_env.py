@@ -0,0 +1,253 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import mujoco
+import numpy as np
+from gymnasium.spaces import Box
+from simple_env import (
+    CONTACT_PAIRS,
+    FRAME_SKIP,
+    INIT_POS,
+    NB_DOFS,
+    OBSERVATION_FIELDS,
+    OBSERVATION_HIGH,
+    OBSERVATION_LOW,
+    SCENE_PATH,
+)
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from mini_bdx.utils.mujoco_utils import ContactIndex, load_model
+from mini_bdx.utils.observation import ObservationLayout
+
+
+class BDXVecEnv(VecEnv):
+    # Same task as simple_env.BDXEnv, for num_envs MjData sharing a single MjModel,
+    # stepped in lockstep. Rewards, observations and terminations are computed on
+    # (num_envs, ...) arrays. With num_threads > 1, the mj_step calls are spread on
+    # a thread pool (MuJoCo releases the GIL while stepping).
+    # Envs are reset automatically when done, the last observation being stored in
+    # info["terminal_observation"].
+    def __init__(self, num_envs, num_threads=1, scene_path=SCENE_PATH):
+        self.model = load_model(scene_path)
+        self.datas = [mujoco.MjData(self.model) for _ in range(num_envs)]
+        self.contacts = [ContactIndex(self.model, CONTACT_PAIRS) for _ in self.datas]
+        self.base_id = mujoco.mj_name2id(self.model, mujoco.mjtObj.mjOBJ_BODY, "base")
+        self.walk_period = 1.0
+
+        self.obs_layout = ObservationLayout(OBSERVATION_FIELDS)
+        observation_space = Box(
+            *self.obs_layout.bounds(low=OBSERVATION_LOW, high=OBSERVATION_HIGH)
+        )
+        ctrl_range = self.model.actuator_ctrlrange.copy().astype(np.float32)
+        action_space = Box(ctrl_range[:, 0], ctrl_range[:, 1], dtype=np.float32)
+        super().__init__(num_envs, observation_space, action_space)
+
+        # Simulation state, gathered from the MjData after each step
+        self.qpos = np.zeros((num_envs, self.model.nq))
+        self.qvel = np.zeros((num_envs, self.model.nv))
+        self.qfrc_actuator = np.zeros((num_envs, self.model.nv))
+        self.base_cvel = np.zeros((num_envs, 6))
+        self.base_xmat = np.zeros((num_envs, 9))
+        self.base_z = np.zeros(num_envs)
+        self.time = np.zeros(num_envs)
+        self.contact_states = np.zeros((num_envs, len(CONTACT_PAIRS)), dtype=bool)
+
+        # Task state
+        self.ctrl = np.zeros((num_envs, self.model.nu))
+        self.actions = np.zeros((num_envs, self.model.nu))
+        self.prev_t = np.zeros(num_envs)
+        self.prev_torque = np.zeros((num_envs, self.model.nv))
+        self.startup_cooldown = np.zeros(num_envs)
+        self.target_velocities = np.zeros((num_envs, 3))  # x, y, yaw
+        self.left_foot_contact = np.ones(num_envs, dtype=bool)
+        self.right_foot_contact = np.ones(num_envs, dtype=bool)
+        self.init_pos_noise = np.zeros((num_envs, NB_DOFS))
+
+        pair_ids = self.contacts[0].pair_ids
+        self.left_foot_pair = pair_ids[("left_foot", "floor")]
+        self.right_foot_pair = pair_ids[("right_foot", "floor")]
+        self.termination_pairs = [
+            pair_ids[("left_antenna_assembly", "floor")],
+            pair_ids[("right_antenna_assembly", "floor")],
+            pair_ids[("body_module", "floor")],
+        ]
+
+        self.buf_obs = np.zeros((num_envs, len(self.obs_layout)))
+        self.obs_views = self.obs_layout.split(self.buf_obs)
+
+        self.num_threads = min(num_threads, num_envs)
+        self.pool = None
+        if self.num_threads > 1:
+            self.pool = ThreadPoolExecutor(self.num_threads)
+            self.chunks = np.array_split(np.arange(num_envs), self.num_threads)
+
+    def _gather(self, i):
+        data = self.datas[i]
+        self.qpos[i] = data.qpos
+        self.qvel[i] = data.qvel
+        self.qfrc_actuator[i] = data.qfrc_actuator
+        self.base_cvel[i] = data.cvel[self.base_id]
+        self.base_xmat[i] = data.xmat[self.base_id]
+        self.base_z[i] = data.xpos[self.base_id, 2]
+        self.time[i] = data.time
+        self.contact_states[i] = self.contacts[i].contacts
+
+    def _step_envs(self, indices):
+        for i in indices:
+            data = self.datas[i]
+            data.ctrl[:] = self.ctrl[i]
+            mujoco.mj_step(self.model, data, nstep=FRAME_SKIP)
+            mujoco.mj_rnePostConstraint(self.model, data)
+            self.contacts[i].update(data, compute_forces=False)
+            self._gather(i)
+
+    def _reset_env(self, i):
+        data = self.datas[i]
+        mujoco.mj_resetData(self.model, data)
+        data.qvel[:] = 0
+        data.qpos[7 : 7 + NB_DOFS] = INIT_POS + self.init_pos_noise[i]
+        data.qpos[2] = 0.15
+        data.qpos[3 : 3 + 4] = [1, 0, 0.08, 0]
+        data.ctrl[:] = INIT_POS
+        mujoco.mj_forward(self.model, data)
+        self.contacts[i].update(data, compute_forces=False)
+        self._gather(i)
+
+        self.ctrl[i] = INIT_POS
+        self.prev_t[i] = data.time
+        self.prev_torque[i] = 0
+        self.startup_cooldown[i] = 1.0
+        self.target_velocities[i] = [0.05, 0, 0]
+        self.left_foot_contact[i] = True
+        self.right_foot_contact[i] = True
+
+    def _fill_obs(self):
+        obs = self.obs_views
+        obs["joints_rotations"][:] = self.qpos[:, 7 : 7 + NB_DOFS]
+        obs["joints_velocities"][:] = self.qvel[:, 6 : 6 + NB_DOFS]
+        obs["angular_velocity"][:] = self.base_cvel[:, :3]
+        obs["linear_velocity"][:] = self.base_cvel[:, 3:]
+        obs["target_velocities"][:] = self.target_velocities
+        obs["feet_contact"][:, 0] = self.left_foot_contact
+        obs["feet_contact"][:, 1] = self.right_foot_contact
+        phase = 2 * np.pi * (self.time % self.walk_period) / self.walk_period
+        obs["clock_signal"][:, 0] = np.sin(phase)
+        obs["clock_signal"][:, 1] = np.cos(phase)
+
+    def _terminated(self):
+        Z_vec = self.base_xmat[:, [2, 5, 8]]
+        upright = Z_vec[:, 2] / np.linalg.norm(Z_vec, axis=1)
+        return (
+            (self.base_z < 0.08)
+            | (upright <= 0.4)
+            | self.contact_states[:, self.termination_pairs].any(axis=1)
+        )
+
+    def reset(self):
+        for i in range(self.num_envs):
+            self._reset_env(i)
+        self._fill_obs()
+        return self.buf_obs.copy()
+
+    def step_async(self, actions):
+        self.actions[:] = actions
+
+    def step_wait(self):
+        t = self.time.copy()
+        dt = t - self.prev_t
+
+        cooldown = self.startup_cooldown > 0
+        walking = ~cooldown
+        self.startup_cooldown[cooldown] -= dt[cooldown]
+
+        # Feet contacts as of the previous step
+        self.left_foot_contact[walking] = self.contact_states[
+            walking, self.left_foot_pair
+        ]
+        self.right_foot_contact[walking] = self.contact_states[
+            walking, self.right_foot_pair
+        ]
+
+        # We want to learn deltas from the initial position
+        delta_max = 0.05
+        a = np.clip(
+            self.actions + INIT_POS, self.ctrl - delta_max, self.ctrl + delta_max
+        )
+        a[:, 10:] = INIT_POS[10:]  # Only control the legs
+        self.ctrl[:] = np.where(cooldown[:, None], INIT_POS + self.init_pos_noise, a)
+
+        if self.pool is None:
+            self._step_envs(range(self.num_envs))
+        else:
+            list(self.pool.map(self._step_envs, self.chunks))
+
+        follow_xy_target_reward = -(
+            np.abs(self.target_velocities[:, 0] - self.base_cvel[:, 3])
+            + np.abs(self.target_velocities[:, 1] - self.base_cvel[:, 4])
+        )
+        follow_yaw_target_reward = -np.abs(
+            self.target_velocities[:, 2] - self.base_cvel[:, 2]
+        )
+        torque_reward = np.exp(
+            -0.25 * np.sum(self.prev_torque - self.qfrc_actuator, axis=1) / NB_DOFS
+        )
+        rewards = np.where(
+            walking,
+            0.15 * follow_xy_target_reward
+            + 0.15 * follow_yaw_target_reward
+            + 0.05 * torque_reward,
+            0.0,
+        )
+
+        self.prev_t[:] = t
+        self.prev_torque[:] = self.qfrc_actuator
+
+        self._fill_obs()
+        dones = self._terminated()
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = self.buf_obs[i].copy()
+            infos[i]["TimeLimit.truncated"] = False
+            self._reset_env(i)
+        if dones.any():
+            self._fill_obs()
+
+        return self.buf_obs.copy(), rewards, dones, infos
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def get_attr(self, attr_name, indices=None):
+        # Per env attributes are the rows of the batched arrays
+        values = getattr(self, attr_name)
+        if isinstance(values, np.ndarray) and len(values) == self.num_envs:
+            return [values[i] for i in self._indices(indices)]
+        return [values for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        values = getattr(self, attr_name, None)
+        indices = self._indices(indices)
+        if isinstance(values, np.ndarray) and len(values) == self.num_envs:
+            for i in indices:
+                values[i] = value
+        elif len(set(indices)) == self.num_envs:
+            # Attribute shared by all the envs
+            setattr(self, attr_name, value)
+        else:
+            raise Exception(
+                f"{attr_name} is shared by all the BDXVecEnv envs, it can't be set "
+                "for some of them only"
+            )
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        raise Exception(f"BDXVecEnv does not support env_method ({method_name})")
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._indices(indices)]
@@ -5,7 +5,11 @@ from datetime import datetime
 import gymnasium as gym
 from gymnasium.envs.registration import register
 from sb3_contrib import TQC
+from shm_vec_env import ShmVecEnv
+from simple_env import BDXEnv
+from simple_vec_env import BDXVecEnv
 from stable_baselines3 import A2C, PPO, SAC, TD3
+from stable_baselines3.common.vec_env import VecMonitor
 
 
 def train(env, sb3_algo, model_dir, log_dir, pretrained=None, device="cuda"):
@@ -109,6 +113,24 @@ if __name__ == "__main__":
     )
     parser.add_argument("-p", "--pretrained", type=str, required=False)
     parser.add_argument("-d", "--device", type=str, required=False, default="cuda")
+    parser.add_argument(
+        "-e",
+        "--num_envs",
+        type=int,
+        default=1,
+        help="Number of envs. If > 1, uses BDXVecEnv (simple_env task only)",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=1,
+        help="Number of threads stepping the BDXVecEnv envs",
+    )
+    parser.add_argument(
+        "--shm",
+        action="store_true",
+        help="Runs the num_envs envs in subprocesses (ShmVecEnv), works for all envs",
+    )
 
     parser.add_argument(
         "-n",
@@ -134,7 +156,13 @@ if __name__ == "__main__":
     #     autoreset=True,
     # )
 
-    env = gym.make("BDX_env", render_mode=None)
+    if args.shm:
+        # The env is registered in this process only, the workers build it directly
+        env = VecMonitor(ShmVecEnv([lambda: BDXEnv() for _ in range(args.num_envs)]))
+    elif args.num_envs > 1:
+        env = VecMonitor(BDXVecEnv(args.num_envs, num_threads=args.num_threads))
+    else:
+        env = gym.make("BDX_env", render_mode=None)
     # Create directories to hold models and logs
     model_dir = args.name
     log_dir = "logs/" + args.name
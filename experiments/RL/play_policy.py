@@ -9,7 +9,7 @@ import numpy as np
 from gymnasium.envs.registration import register
 from stable_baselines3 import PPO, SAC
 
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 
 
 def get_observation(data, left_contact, right_contact):
@@ -66,7 +66,7 @@ def get_feet_contact(data, model):
 def play(env, path_to_model):
     model_path = get_model_from_dir(path_to_model)
 
-    model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+    model = load_model("../../mini_bdx/robots/bdx/scene.xml")
     data = mujoco.MjData(model)
 
     left_contact = False
@@ -1,5 +1,4 @@
 import argparse
-import pickle
 
 import gymnasium as gym
 import numpy as np
@@ -8,14 +7,20 @@ from imitation.algorithms import bc
 from stable_baselines3 import PPO
 from stable_baselines3.common.evaluation import evaluate_policy
 
+from mini_bdx.utils.trajectory_dataset import load_demonstrations
+
 # Check this out https://imitation.readthedocs.io/en/latest/algorithms/bc.html
 
 parser = argparse.ArgumentParser()
-parser.add_argument("-d", "--dataset", type=str, required=True)
+parser.add_argument(
+    "-d", "--dataset", type=str, required=True, help="Dataset directory or .pkl"
+)
 args = parser.parse_args()
 
 
-dataset = pickle.load(open(args.dataset, "rb"))
+BATCH_SIZE = 32
+# Shuffled minibatches read from the memory mapped dataset
+dataset = load_demonstrations(args.dataset, BATCH_SIZE)
 
 register(id="BDX_env", entry_point="env_humanoid:BDXEnv")
 
@@ -27,6 +32,7 @@ bc_trainer = bc.BC(
     observation_space=env.observation_space,
     action_space=env.action_space,
     demonstrations=dataset,
+    batch_size=BATCH_SIZE,
     rng=rng,
     device="cpu",
     policy=PPO(
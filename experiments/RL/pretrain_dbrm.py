@@ -1,5 +1,4 @@
 import argparse
-import pickle
 import pprint
 
 import numpy as np
@@ -10,8 +9,12 @@ from imitation.util import util
 from stable_baselines3 import PPO
 from stable_baselines3.common.policies import ActorCriticPolicy
 
+from mini_bdx.utils.trajectory_dataset import load_demonstrations
+
 parser = argparse.ArgumentParser()
-parser.add_argument("-d", "--dataset", type=str, required=True)
+parser.add_argument(
+    "-d", "--dataset", type=str, required=True, help="Dataset directory or .pkl"
+)
 args = parser.parse_args()
 
 rng = np.random.default_rng(0)
@@ -19,7 +22,9 @@ rng = np.random.default_rng(0)
 register(id="BDX_env", entry_point="env:BDXEnv")
 env = util.make_vec_env("BDX_env", rng=rng, n_envs=2)
 
-dataset = pickle.load(open(args.dataset, "rb"))
+# Trajectories are views on the memory mapped dataset, the density model still
+# holds all the transitions
+dataset = load_demonstrations(args.dataset)
 
 imitation_trainer = PPO(
     ActorCriticPolicy, env, learning_rate=3e-4, gamma=0.95, ent_coef=1e-4, n_steps=2048
@@ -1,21 +1,20 @@
-import pickle
 import time
 
 import mujoco
 import mujoco.viewer
 import numpy as np
 import placo
-from imitation.data.types import Trajectory
 from scipy.spatial.transform import Rotation as R
 
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
+from mini_bdx.utils.trajectory_dataset import TrajectoryWriter
 
 # from mini_bdx.utils.xbox_controller import XboxController
 from mini_bdx.walk_engine import WalkEngine
 
 # xbox = XboxController()
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 data = mujoco.MjData(model)
 
 EPISODE_LENGTH = 2000
@@ -32,8 +31,10 @@ target_head_yaw = 0
 target_head_z_offset = 0
 walking = True
 recording = False
-episodes = []
-current_episode = {"observations": [], "actions": []}
+episode_steps = 0
+
+# Episodes are appended to the dataset as they are recorded
+writer = TrajectoryWriter("dataset", model.nq + model.nv + 2, model.nu)
 
 
 left_contact = False
@@ -98,25 +99,15 @@ def get_observation():
 
 
 def start_stop_recording():
-    global recording, current_episode
+    global recording, episode_steps
     recording = not recording
     if not recording:
         print("Stop recording")
         # store one last observation here
-        current_episode["observations"].append(list(get_observation()))
-
-        episode = Trajectory(
-            np.array(current_episode["observations"]),
-            np.array(current_episode["actions"]),
-            None,
-            True,
-        )
-        episodes.append(episode)
-        with open("dataset.pkl", "wb") as f:
-            pickle.dump(episodes, f)
+        writer.end_episode(get_observation())
     else:
         print("Start recording")
-        current_episode = {"observations": [], "actions": []}
+        episode_steps = 0
 
 
 viewer = mujoco.viewer.launch_passive(model, data, key_callback=key_callback)
@@ -175,10 +166,10 @@ try:
 
         # store obs here
         if recording:
-            current_episode["observations"].append(list(get_observation()))
-            current_episode["actions"].append(list(angles.values()))
+            writer.add_step(get_observation(), list(angles.values()))
+            episode_steps += 1
 
-        if len(current_episode["observations"]) > EPISODE_LENGTH:
+        if episode_steps >= EPISODE_LENGTH:
             start_stop_recording()  # stop recording
             start_stop_recording()  # start recording
 
@@ -191,4 +182,5 @@ try:
         time.sleep(model.opt.timestep / 2.5)
 
 except KeyboardInterrupt:
+    writer.close()
     viewer.close()
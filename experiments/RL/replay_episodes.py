@@ -5,13 +5,15 @@ import time
 import mujoco
 import mujoco.viewer
 
+from mini_bdx.utils.mujoco_utils import load_model
+
 parser = argparse.ArgumentParser()
 parser.add_argument("-d", "--dataset", type=str, required=True)
 args = parser.parse_args()
 
 episodes = pickle.load(open(args.dataset, "rb"))
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 data = mujoco.MjData(model)
 
 
@@ -1,3 +1,4 @@
+from mini_bdx.utils.mujoco_utils import load_model
 from mini_bdx_runtime.hwi import HWI
 from mini_bdx_runtime.rl_utils import make_action_dict, mujoco_joints_order
 import time
@@ -16,7 +17,7 @@ hwi.set_pid_all([1100, 0, 0])
 
 dt = 0.0001
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 model.opt.timestep = dt
 data = mujoco.MjData(model)
 mujoco.mj_step(model, data)
@@ -9,6 +9,7 @@ import time
 import mujoco
 import mujoco_viewer
 import numpy as np
+from mini_bdx.utils.mujoco_utils import load_model
 from mini_bdx_runtime.hwi import HWI
 from mini_bdx_runtime.rl_utils import (
     ActionFilter,
@@ -40,7 +41,7 @@ assert args.dof in id_to_dof.values()
 
 ## === Init mujoco ===
 # Commented freejoint
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 model.opt.timestep = dt
 data = mujoco.MjData(model)
 mujoco.mj_step(model, data)
@@ -14,7 +14,7 @@ from imitation.data.types import Trajectory
 from scipy.spatial.transform import Rotation as R
 
 from mini_bdx.placo_walk_engine import PlacoWalkEngine
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 from mini_bdx.utils.rl_utils import action_to_pd_targets, mujoco_to_isaac
 from mini_bdx.utils.xbox_controller import XboxController
 from mini_bdx.utils.rl_utils import (
@@ -39,7 +39,7 @@ if args.keyboard:
 pwe = PlacoWalkEngine("../../mini_bdx/robots/bdx/robot.urdf")
 
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 model.opt.timestep = 0.0001
 data = mujoco.MjData(model)
 mujoco.mj_step(model, data)
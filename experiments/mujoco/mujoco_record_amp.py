@@ -13,7 +13,7 @@ from imitation.data.types import Trajectory
 from scipy.spatial.transform import Rotation as R
 
 from mini_bdx.placo_walk_engine import PlacoWalkEngine
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 from mini_bdx.utils.rl_utils import mujoco_to_isaac
 
 pwe = PlacoWalkEngine("../../mini_bdx/robots/bdx/robot.urdf")
@@ -42,7 +42,7 @@ current_episode = {
     "Frames": [],
 }
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 model.opt.timestep = 0.001
 data = mujoco.MjData(model)
 mujoco.mj_step(model, data)
@@ -7,7 +7,7 @@ import numpy as np
 import placo
 from scipy.spatial.transform import Rotation as R
 
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 from mini_bdx.utils.xbox_controller import XboxController
 from mini_bdx.walk_engine import WalkEngine
 
@@ -18,7 +18,7 @@ args = parser.parse_args()
 if args.xbox_controller:
     xbox = XboxController()
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 data = mujoco.MjData(model)
 
 
@@ -8,7 +8,8 @@ import numpy as np
 import pygame
 from scipy.spatial.transform import Rotation as R
 
-from mini_bdx.onnx_infer import OnnxInfer
+from mini_bdx.utils.mujoco_utils import load_model
+from mini_bdx.utils.policy_runner import PolicyRunner
 from mini_bdx.utils.rl_utils import (
     action_to_pd_targets,
     isaac_to_mujoco,
@@ -75,7 +76,7 @@ isaac_init_pos = np.array(
 mujoco_init_pos = np.array(isaac_to_mujoco(isaac_init_pos))
 
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 model.opt.timestep = dt
 data = mujoco.MjData(model)
 mujoco.mj_step(model, data)
@@ -84,9 +85,11 @@ viewer = mujoco_viewer.MujocoViewer(model, data)
 
 NUM_OBS = 51
 
-policy = OnnxInfer(args.onnx_model_path, awd=args.awd)
+policy = PolicyRunner(args.onnx_model_path)
 if args.rma:
-    adaptation_module = OnnxInfer(args.adaptation_module_path, "obs_history")
+    adaptation_module = PolicyRunner(
+        args.adaptation_module_path, input_name="obs_history"
+    )
     obs_history_size = 15
     obs_history = np.zeros((obs_history_size, NUM_OBS)).tolist()
 
@@ -225,7 +228,9 @@ try:
 
             if args.rma:
                 if t - last_adaptation >= 1 / adaptation_module_freq:
-                    latent = adaptation_module.infer(np.array(obs_history).flatten())
+                    latent = adaptation_module.infer(
+                        np.array(obs_history).flatten()
+                    ).copy()
                     last_adaptation = t
                 saved_latent.append(latent)
                 policy_input = np.concatenate([isaac_obs, latent])
@@ -293,5 +298,6 @@ try:
         viewer.render()
         prev = t
 except KeyboardInterrupt:
+    print(policy.report(1 / control_freq))
     pickle.dump(mujoco_saved_obs, open("mujoco_saved_obs.pkl", "wb"))
     pickle.dump(saved_latent, open("mujoco_saved_latent.pkl", "wb"))
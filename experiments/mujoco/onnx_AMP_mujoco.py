@@ -7,7 +7,8 @@ import mujoco_viewer
 import numpy as np
 from scipy.spatial.transform import Rotation as R
 
-from mini_bdx.onnx_infer import OnnxInfer
+from mini_bdx.utils.mujoco_utils import load_model
+from mini_bdx.utils.policy_runner import PolicyRunner
 from mini_bdx.utils.rl_utils import (
     action_to_pd_targets,
     isaac_to_mujoco,
@@ -123,14 +124,14 @@ pd_action_scale = [
 isaac_init_pos = np.array(mujoco_to_isaac(mujoco_init_pos))
 
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 model.opt.timestep = dt
 data = mujoco.MjData(model)
 mujoco.mj_step(model, data)
 viewer = mujoco_viewer.MujocoViewer(model, data)
 # model.opt.gravity[:] = [0, 0, 0]  # no gravity
 
-policy = OnnxInfer(args.onnx_model_path)
+policy = PolicyRunner(args.onnx_model_path)
 
 
 class ImuDelaySimulator:
@@ -269,6 +270,7 @@ try:
         viewer.render()
         prev = t
 except KeyboardInterrupt:
+    print(policy.report(1 / control_freq))
     data = {
         "config": {},
         "mujoco": command_value,
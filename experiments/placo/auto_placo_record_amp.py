@@ -1,45 +1,103 @@
-import os
 import argparse
-from placo_record_amp import record
-from mini_bdx.placo_walk_engine import PlacoWalkEngine
+import multiprocessing
+import os
+import time
+
 import numpy as np
+from placo_record_amp import record
 
-import argparse
+from mini_bdx.placo_walk_engine import PlacoWalkEngine
+from mini_bdx.utils.motion_index import MotionClipIndex
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-o", "--output_dir", type=str, default="recordings")
 parser.add_argument(
     "-n", "--num_samples", type=int, default=10, help="Number of samples"
 )
+parser.add_argument(
+    "-j",
+    "--num_workers",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of worker processes, each one owning its walk engine",
+)
+parser.add_argument(
+    "--seed", type=int, default=0, help="Seed used to draw the (dx, dy, dtheta)"
+)
 args = parser.parse_args()
 
-pwe = PlacoWalkEngine("../../mini_bdx/robots/bdx/robot.urdf", ignore_feet_contact=True)
-
 dx_range = [-0.04, 0.04]
 dy_range = [-0.05, 0.05]
 dtheta_range = [-0.15, 0.15]
 length = 8
 num_samples = args.num_samples
 
-args_dict = {}
-args_dict["name"] = "test"
-args_dict["dx"] = 0
-args_dict["dy"] = 0
-args_dict["dtheta"] = 0
-args_dict["length"] = length
-args_dict["meshcat_viz"] = False
-args_dict["skip_warmup"] = False
-args_dict["stand"] = False
-args_dict["hardware"] = True
-args_dict["output_dir"] = args.output_dir
-
-for i in range(num_samples):
-    args_dict["dx"] = round(np.random.uniform(dx_range[0], dx_range[1]), 2)
-    args_dict["dy"] = round(np.random.uniform(dy_range[0], dy_range[1]), 2)
-    args_dict["dtheta"] = round(np.random.uniform(dtheta_range[0], dtheta_range[1]), 2)
-    args_dict["name"] = str(i)
-    print("RECORDING ", args_dict["name"])
-    print("dx", args_dict["dx"], "dy", args_dict["dy"], "dtheta", args_dict["dtheta"])
-    print("==")
+pwe = None
+
+
+def init_worker():
+    global pwe
+    pwe = PlacoWalkEngine(
+        "../../mini_bdx/robots/bdx/robot.urdf",
+        ignore_feet_contact=True,
+        verbose=False,
+    )
+
+
+def record_sample(args_dict):
     pwe.reset()
     record(pwe, args_dict)
+    return args_dict
+
+
+def is_recorded(args_dict):
+    # Both the clip and its json export must be there, a run killed in between
+    # leaves the clip without its json
+    path = os.path.join(args_dict["output_dir"], args_dict["name"])
+    return os.path.exists(path + ".clip") and os.path.exists(path + ".txt")
+
+
+if __name__ == "__main__":
+    # All the samples are drawn upfront, so that a given seed always yields the
+    # same clips, whatever the number of workers or the resumed ones
+    rng = np.random.default_rng(args.seed)
+    samples = []
+    for i in range(num_samples):
+        args_dict = {}
+        args_dict["name"] = str(i)
+        args_dict["dx"] = round(rng.uniform(dx_range[0], dx_range[1]), 2)
+        args_dict["dy"] = round(rng.uniform(dy_range[0], dy_range[1]), 2)
+        args_dict["dtheta"] = round(rng.uniform(dtheta_range[0], dtheta_range[1]), 2)
+        args_dict["length"] = length
+        args_dict["meshcat_viz"] = False
+        args_dict["skip_warmup"] = False
+        args_dict["stand"] = False
+        args_dict["hardware"] = True
+        args_dict["output_dir"] = args.output_dir
+        samples.append(args_dict)
+
+    # Resuming: recorded samples are skipped
+    todo = [args_dict for args_dict in samples if not is_recorded(args_dict)]
+    print("Recording", len(todo), "samples,", num_samples - len(todo), "already done")
+
+    start = time.time()
+    with multiprocessing.Pool(args.num_workers, initializer=init_worker) as pool:
+        for done, args_dict in enumerate(
+            pool.imap_unordered(record_sample, todo), start=1
+        ):
+            elapsed = time.time() - start
+            print(
+                f"[{done}/{len(todo)}] recorded {args_dict['name']}",
+                "dx",
+                args_dict["dx"],
+                "dy",
+                args_dict["dy"],
+                "dtheta",
+                args_dict["dtheta"],
+                f"({done / elapsed:.2f} clips/s, {done * length / elapsed:.2f} motion s/s)",
+            )
+
+    # Nearest command lookup over the whole library, see MotionClipIndex
+    index = MotionClipIndex.build(args.output_dir)
+    index.save(os.path.join(args.output_dir, "index.json"))
+    print("Indexed", len(index), "clips")
@@ -1,23 +1,39 @@
+# Training does not need this script anymore, MotionClipLoader applies yaw
+# rotations on the fly when loading the clips. It is kept to export rotated copies
+# in the json layout when needed.
 import argparse
-import json
 import os
+import tempfile
 
-import FramesViewer.utils as fv_utils
 import numpy as np
-from scipy.spatial.transform import Rotation as R
+
+from mini_bdx.utils.motion_clip import (
+    MotionClipLoader,
+    hardware_columns,
+    isaac_columns,
+    json_to_clip,
+)
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-f", "--file", type=str, required=True)
 parser.add_argument("-o", "--output_dir", type=str, required=True)
+parser.add_argument(
+    "--hardware",
+    action="store_true",
+    help="json input in AMP_for_hardware format. If false, IsaacGymEnvs format",
+)
 args = parser.parse_args()
 
 os.makedirs(args.output_dir, exist_ok=True)
 
-episode = json.load(open(args.file))
-
-frame_duration = episode["FrameDuration"]
+clip_file = args.file
+if not clip_file.endswith(".clip"):
+    columns = hardware_columns() if args.hardware else isaac_columns()
+    clip_file = os.path.join(tempfile.mkdtemp(), "clip.clip")
+    json_to_clip(args.file, clip_file, columns, dtype="float64")
 
-frames = episode["Frames"]
+loader = MotionClipLoader(cache_size=1)
+clip = loader.get_clip(clip_file)
 
 step = 5
 yaw_orientations = np.arange(360, step=step) - (180 - step)
@@ -25,32 +41,8 @@ yaw_orientations = np.arange(360, step=step) - (180 - step)
 # yaw_orientations = [180]
 
 for yaw_orientation in yaw_orientations:
-    new_frames = []
-    for i, frame in enumerate(frames):
-        root_position = frame[:3]  # x, y, z
-        root_orientation_quat = frame[3:7]  # quat
-        root_orientation_mat = R.from_quat(root_orientation_quat).as_matrix()
-        # rotate around z axis
-        root_orientation_mat = (
-            R.from_euler("z", yaw_orientation, degrees=True).as_matrix()
-            @ root_orientation_mat
-        )
-        root_orientation_quat = R.from_matrix(root_orientation_mat).as_quat()
-
-        # rotate root position too around z at origin
-        root_position = (
-            R.from_euler("z", yaw_orientation, degrees=True).as_matrix() @ root_position
-        )
-
-        new_frames.append(list(root_position) + list(root_orientation_quat) + frame[7:])
-
-    new_episode = episode.copy()
-    new_episode["Frames"] = new_frames
-
-    output_file = os.path.join(
-        args.output_dir,
-        os.path.basename(args.file).replace(".txt", f"_{yaw_orientation}.txt"),
-    )
-
-    with open(output_file, "w") as f:
-        json.dump(new_episode, f)
+    frames = loader.get(clip_file, np.deg2rad(yaw_orientation))
+
+    name, _ = os.path.splitext(os.path.basename(args.file))
+    output_file = os.path.join(args.output_dir, f"{name}_{yaw_orientation}.txt")
+    clip.export_json(output_file, frames)
@@ -1,5 +1,4 @@
 import argparse
-import json
 import os
 import time
 from os.path import join
@@ -12,6 +11,14 @@ from placo_utils.visualization import footsteps_viz, robot_frame_viz, robot_viz
 from scipy.spatial.transform import Rotation as R
 
 from mini_bdx.placo_walk_engine import PlacoWalkEngine
+from mini_bdx.utils.motion_clip import (
+    MotionClip,
+    MotionClipWriter,
+    debug_columns,
+    derive_clip,
+    hardware_columns,
+    isaac_columns,
+)
 from mini_bdx.utils.rl_utils import mujoco_to_isaac, test
 
 FPS = 60
@@ -26,26 +33,53 @@ MESHCAT_FPS = 20
 # [root position, root orientation, joint poses (e.g. rotations), target toe positions, linear velocity, angular velocity, joint velocities, target toe velocities]
 # [x, y, z, qw, qx, qy, qz, j1, j2, j3, j4, j5, j6, j7, j8, j9, j10, j11, j12, j13, j14, j15, l_toe_x, l_toe_y, l_toe_z, r_toe_x, r_toe_y, r_toe_z, lin_vel_x, lin_vel_y, lin_vel_z, ang_vel_x, ang_vel_y, ang_vel_z, j1_vel, j2_vel, j3_vel, j4_vel, j5_vel, j6_vel, j7_vel, j8_vel, j9_vel, j10_vel, j11_vel, j12_vel, j13_vel, j14_vel, j15_vel, l_toe_vel_x, l_toe_vel_y, l_toe_vel_z, r_toe_vel_x, r_toe_vel_y, r_toe_vel_z]
 def record(pwe, args_dict):
-    episode = {
+    metadata = {
         "LoopMode": "Wrap",
         "FrameDuration": np.around(1 / FPS, 4),
         "EnableCycleOffsetPosition": True,
         "EnableCycleOffsetRotation": False,
-        "Debug_info": [],
-        "Frames": [],
         "MotionWeight": 1,
     }
 
     first_joints_positions = list(pwe.get_angles().values())
-    first_T_world_fbase = pwe.robot.get_T_world_fbase()
-    first_T_world_leftFoot = pwe.robot.get_T_world_left()
-    first_T_world_rightFoot = pwe.robot.get_T_world_right()
-
+    if args_dict["hardware"]:
+        columns = hardware_columns(len(first_joints_positions))
+    else:
+        columns = isaac_columns(len(first_joints_positions))
+
+    # Only the raw state is streamed while recording, the velocities are derived
+    # over the whole clip once the recording is over. Files are renamed at the end so
+    # that an interrupted recording never leaves a truncated clip behind
     # pwe.parameters.single_support_duration = 0.25  # slow
     # pwe.parameters.single_support_duration = 0.20  # normal
     pwe.parameters.single_support_duration = 0.2  # Fast ?
+    period = (
+        2 * pwe.parameters.single_support_duration
+        + 2 * pwe.parameters.double_support_duration()
+    )
+    # The command actually given to the walk engine, stored in the clip info
+    dtheta = args_dict["dtheta"] + 0.001
 
-    pwe.set_traj(args_dict["dx"], args_dict["dy"], args_dict["dtheta"] + 0.001)
+    os.makedirs(args_dict["output_dir"], exist_ok=True)
+    clip_path = os.path.join(args_dict["output_dir"], args_dict["name"] + ".clip")
+    raw_path = clip_path + ".raw.tmp"
+    writer = MotionClipWriter(
+        raw_path,
+        isaac_columns(len(first_joints_positions)) + debug_columns(),
+        metadata,
+        info={
+            "dx": args_dict["dx"],
+            "dy": args_dict["dy"],
+            "dtheta": dtheta,
+        },
+        dtype="float64",
+        flush_every=FPS,
+    )
+    first_T_world_fbase = pwe.robot.get_T_world_fbase()
+    first_T_world_leftFoot = pwe.robot.get_T_world_left()
+    first_T_world_rightFoot = pwe.robot.get_T_world_right()
+
+    pwe.set_traj(args_dict["dx"], args_dict["dy"], dtheta)
     if args_dict["meshcat_viz"]:
         viz = robot_viz(pwe.robot)
     DT = 0.001
@@ -53,15 +87,8 @@ def record(pwe, args_dict):
 
     last_record = 0
     last_meshcat_display = 0
-    prev_root_position = [0, 0, 0]
-    prev_root_orientation_euler = [0, 0, 0]
-    prev_left_toe_pos = [0, 0, 0]
-    prev_right_toe_pos = [0, 0, 0]
-    prev_joints_positions = [0] * 15
+    frame_times = []  # Walk engine time of each frame
     i = 0
-    prev_initialized = False
-    avg_x_lin_vel = []
-    avg_yaw_vel = []
     while True:
         # print("t", pwe.t)
         pwe.tick(DT)
@@ -78,8 +105,8 @@ def record(pwe, args_dict):
                 T_world_fbase = first_T_world_fbase
             else:
                 T_world_fbase = pwe.robot.get_T_world_fbase()
-            root_position = list(T_world_fbase[:3, 3])
-            root_orientation_quat = list(R.from_matrix(T_world_fbase[:3, :3]).as_quat())
+            root_position = T_world_fbase[:3, 3]
+            root_orientation_quat = R.from_matrix(T_world_fbase[:3, :3]).as_quat()
 
             if args_dict["stand"]:
                 joints_positions = first_joints_positions
@@ -93,81 +120,16 @@ def record(pwe, args_dict):
                 T_world_leftFoot = pwe.robot.get_T_world_left()
                 T_world_rightFoot = pwe.robot.get_T_world_right()
 
-            T_body_leftFoot = np.linalg.inv(T_world_fbase) @ T_world_leftFoot
-            T_body_rightFoot = np.linalg.inv(T_world_fbase) @ T_world_rightFoot
-
-            left_toe_pos = list(T_body_leftFoot[:3, 3])
-            right_toe_pos = list(T_body_rightFoot[:3, 3])
-
-            world_linear_vel = list(
-                (np.array(root_position) - np.array(prev_root_position)) / (1 / FPS)
+            writer.append(
+                root_pos=root_position,
+                root_quat=root_orientation_quat,
+                joints=joints_positions,
+                left_foot_pose=T_world_leftFoot,
+                right_foot_pose=T_world_rightFoot,
             )
-            avg_x_lin_vel.append(world_linear_vel[0])
-            body_rot_mat = T_world_fbase[:3, :3]
-            body_linear_vel = list(body_rot_mat.T @ world_linear_vel)
-
-            world_angular_vel = list(
-                (
-                    R.from_quat(root_orientation_quat).as_euler("xyz")
-                    - prev_root_orientation_euler
-                )
-                / (1 / FPS)
-            )
-            avg_yaw_vel.append(world_angular_vel[2])
-            body_angular_vel = list(body_rot_mat.T @ world_angular_vel)
-            # print("world angular vel", world_angular_vel)
-            # print("body angular vel", body_angular_vel)
-
-            joints_vel = list(
-                (np.array(joints_positions) - np.array(prev_joints_positions))
-                / (1 / FPS)
-            )
-            left_toe_vel = list(
-                (np.array(left_toe_pos) - np.array(prev_left_toe_pos)) / (1 / FPS)
-            )
-            right_toe_vel = list(
-                (np.array(right_toe_pos) - np.array(prev_right_toe_pos)) / (1 / FPS)
-            )
-
-            if prev_initialized:
-                if args_dict["hardware"]:
-                    episode["Frames"].append(
-                        root_position
-                        + root_orientation_quat
-                        + joints_positions
-                        + left_toe_pos
-                        + right_toe_pos
-                        + world_linear_vel
-                        + world_angular_vel
-                        + joints_vel
-                        + left_toe_vel
-                        + right_toe_vel
-                    )
-                else:
-                    episode["Frames"].append(
-                        root_position + root_orientation_quat + joints_positions
-                    )
-                episode["Debug_info"].append(
-                    {
-                        "left_foot_pose": list(T_world_leftFoot.flatten()),
-                        "right_foot_pose": list(T_world_rightFoot.flatten()),
-                    }
-                )
-
-            prev_root_position = root_position.copy()
-            prev_root_orientation_euler = (
-                R.from_quat(root_orientation_quat).as_euler("xyz").copy()
-            )
-            prev_left_toe_pos = left_toe_pos.copy()
-            prev_right_toe_pos = right_toe_pos.copy()
-            prev_joints_positions = joints_positions.copy()
-            prev_initialized = True
-
-            # print("avg x vel", np.mean(avg_x_lin_vel[-50:]))
-            # print("avg yaw vel", np.mean(avg_yaw_vel[-50:]))
-            # print("=")
 
             last_record = pwe.t
+            frame_times.append(pwe.t)
             # print("saved frame")
 
         if args_dict["meshcat_viz"] and pwe.t - last_meshcat_display >= 1 / MESHCAT_FPS:
@@ -180,13 +142,37 @@ def record(pwe, args_dict):
 
         i += 1
 
-    print("recorded", len(episode["Frames"]), "frames")
-    file_name = args_dict["name"] + str(".txt")
-    file_path = os.path.join(args_dict["output_dir"], file_name)
-    os.makedirs(args_dict["output_dir"], exist_ok=True)
-    print("DONE, saving", file_name)
-    with open(file_path, "w") as f:
-        json.dump(episode, f)
+    writer.close()
+
+    # The first frame has no previous one to compute velocities from, it is dropped.
+    # Stored in float64, as the json export is read from this clip.
+    # The gait timing lets MotionClipIndex look frames up by gait phase, which is
+    # (t % period) / period for the walk engine time t of a frame
+    derive_clip(
+        MotionClip(raw_path),
+        clip_path + ".tmp",
+        columns + debug_columns(),
+        dt=1 / FPS,
+        skip=1,
+        dtype="float64",
+        info={
+            "period": period,
+            "start_t": frame_times[1],
+            "frame_interval": (frame_times[-1] - frame_times[1])
+            / (len(frame_times) - 2),
+        },
+    )
+    os.replace(clip_path + ".tmp", clip_path)
+    os.remove(raw_path)
+    print("recorded", writer.nb_frames - 1, "frames")
+
+    if args_dict.get("json", True):
+        # Same json layout as before, for the downstream trainers
+        file_name = args_dict["name"] + str(".txt")
+        file_path = os.path.join(args_dict["output_dir"], file_name)
+        print("DONE, saving", file_name)
+        MotionClip(clip_path).export_json(file_path + ".tmp")
+        os.replace(file_path + ".tmp", file_path)
 
 
 if __name__ == "__main__":
@@ -216,8 +202,15 @@ if __name__ == "__main__":
         action="store_true",
         help="use AMP_for_hardware format. If false, use IsaacGymEnvs format",
     )
+    parser.add_argument(
+        "--no_json",
+        dest="json",
+        action="store_false",
+        help="only write the binary clip, without the json export",
+    )
     args = parser.parse_args()
     pwe = PlacoWalkEngine(
-        "../../mini_bdx/robots/bdx/robot.urdf", ignore_feet_contact=True
+        "../../mini_bdx/robots/bdx/robot.urdf",
+        ignore_feet_contact=True,
     )
     record(pwe, vars(args))
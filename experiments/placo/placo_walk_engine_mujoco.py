@@ -5,7 +5,7 @@ import mujoco.viewer
 import numpy as np
 
 from mini_bdx.placo_walk_engine import PlacoWalkEngine
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 from mini_bdx.utils.xbox_controller import XboxController
 
 parser = argparse.ArgumentParser()
@@ -51,7 +51,7 @@ def key_callback(keycode):
     # if keycode == 69:  # e
 
 
-model = mujoco.MjModel.from_xml_path("../../mini_bdx/robots/bdx/scene.xml")
+model = load_model("../../mini_bdx/robots/bdx/scene.xml")
 data = mujoco.MjData(model)
 viewer = mujoco.viewer.launch_passive(model, data, key_callback=key_callback)
 
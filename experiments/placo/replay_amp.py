@@ -7,6 +7,8 @@ import numpy as np
 from FramesViewer.viewer import Viewer
 from scipy.spatial.transform import Rotation as R
 
+from mini_bdx.utils.motion_clip import MotionClip
+
 parser = argparse.ArgumentParser()
 parser.add_argument("-f", "--file", type=str, required=True)
 parser.add_argument(
@@ -19,7 +21,10 @@ args = parser.parse_args()
 fv = Viewer()
 fv.start()
 
-episode = json.load(open(args.file))
+if args.file.endswith(".clip"):
+    episode = MotionClip(args.file).to_json_dict()
+else:
+    episode = json.load(open(args.file))
 
 frame_duration = episode["FrameDuration"]
 
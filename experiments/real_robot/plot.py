@@ -1,9 +1,24 @@
+import argparse
 import pickle
 import matplotlib.pyplot as plt
 
 import numpy as np
 
-command_value = pickle.load(open("command_value.pkl", "rb"))
+from mini_bdx.utils.telemetry import read_telemetry
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--telemetry", type=str, default=None, help="Telemetry file of rl_walk.py"
+)
+args = parser.parse_args()
+
+if args.telemetry is not None:
+    records, _ = read_telemetry(args.telemetry)
+    command_value = list(
+        zip(records["commanded_position"], records["measured_position"])
+    )
+else:
+    command_value = pickle.load(open("command_value.pkl", "rb"))
 
 dofs = {
     0: "right_hip_yaw",
@@ -4,12 +4,15 @@ import time
 import numpy as np
 
 from mini_bdx.hwi import HWI
-from mini_bdx.onnx_infer import OnnxInfer
+from mini_bdx.utils.loop_scheduler import LoopScheduler
+from mini_bdx.utils.policy_runner import PolicyRunner
 from mini_bdx.utils.rl_utils import (
     action_to_pd_targets,
     isaac_joints_order,
     isaac_to_mujoco,
+    mujoco_to_isaac_order,
 )
+from mini_bdx.utils.telemetry import TelemetryRecorder, record_dtype
 
 pd_action_offset = [
     0.0,
@@ -47,13 +50,12 @@ pd_action_scale = [
 ]
 
 
-def make_action_dict(action):
-    action_dict = {}
-    for i, a in enumerate(action):
-        if "antenna" not in isaac_joints_order[i]:
-            action_dict[isaac_joints_order[i]] = a
+antennas = [joint for joint in isaac_joints_order if "antenna" in joint]
+
 
-    return action_dict
+def make_action_dict(action):
+    # The policy outputs are in isaac order, the antennas are not driven
+    return mujoco_to_isaac_order.unpack(action, ignore=antennas)
 
 
 # TODO
@@ -62,42 +64,56 @@ def get_obs(hwi, imu):
     pass
 
 
-policy = OnnxInfer("/home/antoine/MISC/IsaacGymEnvs/isaacgymenvs/ONNX_NO_PUSH.onnx")
+policy = PolicyRunner("/home/antoine/MISC/IsaacGymEnvs/isaacgymenvs/ONNX_NO_PUSH.onnx")
 
 fake_obs = pickle.loads(open("saved_obs.pkl", "rb").read())
 fake_actions = pickle.loads(open("saved_actions.pkl", "rb").read())
 
 hwi = HWI(usb_port="/dev/ttyUSB0")
 
-command_value = []
-
 hwi.turn_on()
 time.sleep(1)
 skip = 10
 i = 0
 ctrl_freq = 30  # hz
+joints = [joint for joint in isaac_joints_order if "antenna" not in joint]
+telemetry = TelemetryRecorder(
+    "telemetry.bin",
+    record_dtype(len(fake_obs[0]), len(isaac_joints_order), len(joints)),
+    metadata={"joints": joints, "ctrl_freq": ctrl_freq},
+)
+scheduler = LoopScheduler(ctrl_freq)
 while True:
     if skip > 0:
         skip -= 1
-    start = time.time()
-    obs = fake_obs[i]  # for now
-    # obs = get_obs(hwi, imu)
-
-    obs = np.clip(obs, -5, 5)
-    action = policy.infer(obs)
-    action = fake_actions[i][0]
-    action = np.clip(action, -1, 1)
-    action = action_to_pd_targets(action, pd_action_offset, pd_action_scale)
-    action_dict = make_action_dict(action)
+    with scheduler.phase("sense"):
+        obs = fake_obs[i]  # for now
+        # obs = get_obs(hwi, imu)
+
+    with scheduler.phase("infer"):
+        obs = np.clip(obs, -5, 5)
+        action = policy.infer(obs)
+        action = fake_actions[i][0]
+        action = np.clip(action, -1, 1)
+        pd_targets = action_to_pd_targets(action, pd_action_offset, pd_action_scale)
+        action_dict = make_action_dict(pd_targets)
     # print(action_dict)
-    hwi.set_position_all(action_dict)
-    took = time.time() - start
-    # time.sleep((max(0, (1 / ctrl_freq) - took)))
-    time.sleep(1 / ctrl_freq)
+    with scheduler.phase("actuate"):
+        hwi.set_position_all(action_dict)
+    scheduler.wait()
     i += 1
     if i >= len(fake_obs) - 1:
         break
 
-    command_value.append((list(action_dict.values()), hwi.get_present_positions()))
-    # print(len(command_value[0][0]), len(command_value[0][1]))
-    pickle.dump(command_value, open("command_value.pkl", "wb"))
+    telemetry.log(
+        timestamp=scheduler.clock.now(),
+        obs=obs,
+        action=action,
+        commanded_position=list(action_dict.values()),
+        measured_position=hwi.get_present_positions(),
+    )
+
+telemetry.close()
+print(scheduler.report())
+print(policy.report(1 / ctrl_freq))
+scheduler.dump("loop_timings.json")
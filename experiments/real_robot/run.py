@@ -7,11 +7,18 @@ import placo
 from mini_bdx_runtime.hwi import HWI
 
 # from mini_bdx.hwi import HWI
+from mini_bdx.utils.loop_scheduler import LoopScheduler
 from mini_bdx.utils.xbox_controller import XboxController
 from mini_bdx.walk_engine import WalkEngine
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-x", action="store_true", default=False)
+parser.add_argument(
+    "--baked_gait",
+    action="store_true",
+    default=False,
+    help="Serve steady gaits from baked cycles (new commands bake over a few ticks)",
+)
 args = parser.parse_args()
 
 if args.x:
@@ -46,7 +53,11 @@ walk_engine = WalkEngine(
     default_trunk_z_offset=-0.023,
     target_trunk_pitch=-11.0,
     max_rise_gain=0.01,
+    baked_gait=args.baked_gait,
 )
+if args.baked_gait:
+    # Walking in place, before the loop starts
+    walk_engine.prebake([(0, 0, 0)])
 
 
 def xbox_input():
@@ -88,39 +99,44 @@ gyro = [0, 0.0, 0]
 accelerometer = [0, 0, 0]
 
 skip = 10
-prev = time.time()
+ctrl_freq = 60  # hz
+scheduler = LoopScheduler(ctrl_freq)
 while True:
-    dt = time.time() - prev
-    t = time.time()
+    # Actual duration of the last period, longer than 1 / ctrl_freq on overruns
+    dt = scheduler.last_period
     if args.x:
         xbox_input()
 
     # Get sensor data
     # gyro, accelerometer = get_imu()
-    right_contact = abs(hwi.get_present_current("right_ankle")) > 1
-    left_contact = abs(hwi.get_present_current("left_ankle")) > 1
+    with scheduler.phase("sense"):
+        right_contact = abs(hwi.get_present_current("right_ankle")) > 1
+        left_contact = abs(hwi.get_present_current("left_ankle")) > 1
     # print("left_contact", left_contact, "right_contact", right_contact)
-    walk_engine.update(
-        walking,
-        gyro,
-        accelerometer,
-        left_contact,
-        right_contact,
-        target_step_size_x,
-        target_step_size_y,
-        target_yaw,
-        target_head_pitch,
-        target_head_yaw,
-        target_head_z_offset,
-        dt,
-        ignore_feet_contact=True,
-    )
-    angles = walk_engine.get_angles()
+    with scheduler.phase("infer"):
+        walk_engine.update(
+            walking,
+            gyro,
+            accelerometer,
+            left_contact,
+            right_contact,
+            target_step_size_x,
+            target_step_size_y,
+            target_yaw,
+            target_head_pitch,
+            target_head_yaw,
+            target_head_z_offset,
+            dt,
+            ignore_feet_contact=True,
+        )
+        angles = walk_engine.get_angles()
 
     if skip > 0:
         skip -= 1
+        scheduler.wait()
         continue
-    hwi.set_position_all(angles)
+    with scheduler.phase("actuate"):
+        hwi.set_position_all(angles)
 
     # print("-")
     cv2.imshow("image", im)
@@ -153,6 +169,8 @@ while True:
         walk_engine.swing_gain += 0.001
     if key == ord("w"):
         walking = not walking
+    if key == ord("t"):
+        print(scheduler.report())
 
     # print("gyro : ", gyro)
     # print("target_trunk pitch", walk_engine.trunk_pitch)
@@ -163,4 +181,4 @@ while True:
     # print("swing gain", walk_engine.swing_gain)
     # print("===")
 
-    prev = t
+    scheduler.wait()
@@ -1,25 +1,65 @@
-from pypot.feetech import FeetechSTS3215IO
+import argparse
 import time
 import numpy as np
 
-io = FeetechSTS3215IO(
-    "/dev/ttyACM0",
-    baudrate=1000000,
-    use_sync_read=True,
+from mini_bdx.utils.servo_bus import FakeFeetechBus, ServoBusManager
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--bus_manager",
+    action="store_true",
+    help="Single sync write + sync read per cycle, from the bus thread",
 )
+parser.add_argument("--fake", action="store_true", help="Use a fake bus (implies --bus_manager)")
+args = parser.parse_args()
 
 # id = 24
 ids = [10, 11, 12, 13, 14, 20, 21, 22, 23, 24, 30, 31, 32, 33]
 
-io.enable_torque(ids)
-io.set_mode({id: 0 for id in ids})
-times = []
-for i in range(1000):
-    s = time.time()
-    io.get_present_position(ids)
-    io.set_goal_position({id: 0 for id in ids})
-    times.append(time.time() - s)
+if not args.bus_manager and not args.fake:
+    from pypot.feetech import FeetechSTS3215IO
+
+    io = FeetechSTS3215IO(
+        "/dev/ttyACM0",
+        baudrate=1000000,
+        use_sync_read=True,
+    )
+
+    io.enable_torque(ids)
+    io.set_mode({id: 0 for id in ids})
+    times = []
+    for i in range(1000):
+        s = time.time()
+        io.get_present_position(ids)
+        io.set_goal_position({id: 0 for id in ids})
+        times.append(time.time() - s)
+
+        time.sleep(1 / 100)
+
+    print("avg :", np.mean(times))
+else:
+    if args.fake:
+        serial = FakeFeetechBus(ids, baudrate=1000000)
+    else:
+        import serial as pyserial
+
+        serial = pyserial.Serial("/dev/ttyACM0", baudrate=1000000, timeout=0.01)
+
+    bus = ServoBusManager(serial, ids, frequency=100)
+    bus.enable_torque()
+    bus.set_goals({id: 0 for id in ids})
+    bus.start()
+
+    times = []
+    for i in range(1000):
+        s = time.time()
+        bus.get_state()
+        bus.set_goals({id: 0 for id in ids})
+        times.append(time.time() - s)
 
-    time.sleep(1 / 100)
+        time.sleep(1 / 100)
 
-print("avg :", np.mean(times))
\ No newline at end of file
+    bus.stop()
+    print("avg (control loop side) :", np.mean(times))
+    print(bus.scheduler.report())
+    print("read errors :", bus.stats()["read_errors"])
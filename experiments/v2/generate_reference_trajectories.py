@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+
+import mujoco
+import numpy as np
+
+from mini_bdx.placo_walk_engine import PlacoWalkEngine, ReferenceTrajectories
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-o", "--output", type=str, default="reference_trajectories.npz")
+parser.add_argument(
+    "-r",
+    "--robot",
+    type=str,
+    default="bdx",
+    choices=["bdx", "open_duck_mini_v2"],
+    help="Robot of the env using the references",
+)
+parser.add_argument(
+    "-p", "--params", type=str, default="placo_defaults.json", help="Walk parameters"
+)
+parser.add_argument(
+    "--grid_size", type=int, default=5, help="Number of values per command axis"
+)
+parser.add_argument(
+    "--nb_samples", type=int, default=100, help="Number of samples per walk cycle"
+)
+args = parser.parse_args()
+
+robot_path = os.path.join("../../mini_bdx/robots", args.robot)
+
+# The references are recorded in the order of the joints of the mujoco model, as
+# the envs write them in their joints slots
+model = mujoco.MjModel.from_xml_path(os.path.join(robot_path, "scene.xml"))
+joints = [
+    model.joint(i).name
+    for i in np.argsort(model.jnt_qposadr)
+    if model.jnt_type[i] != mujoco.mjtJoint.mjJNT_FREE
+]
+params = json.load(open(args.params))
+params["joints"] = joints
+params["joint_angles"] = {
+    joint: angle
+    for joint, angle in params.get("joint_angles", {}).items()
+    if joint in joints
+}
+
+pwe = PlacoWalkEngine(
+    robot_path,
+    model_filename="robot.urdf",
+    init_params=params,
+    ignore_feet_contact=True,
+    verbose=False,
+)
+
+dx_range = [-0.04, 0.04]
+dy_range = [-0.05, 0.05]
+dtheta_range = [-0.15, 0.15]
+
+references = ReferenceTrajectories.generate(
+    pwe,
+    np.linspace(*dx_range, args.grid_size),
+    np.linspace(*dy_range, args.grid_size),
+    np.linspace(*dtheta_range, args.grid_size),
+    nb_samples=args.nb_samples,
+)
+references.save(args.output)
+print("Saved", args.output, "for the joints", joints)
@@ -4,7 +4,7 @@ import json
 import mujoco
 import mujoco.viewer
 import pickle
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 import numpy as np
 
 # DT = 0.01
@@ -16,7 +16,7 @@ pwe = PlacoWalkEngine(
     init_params=json.load(open("placo_defaults.json")),
     ignore_feet_contact=True,
 )
-model = mujoco.MjModel.from_xml_path(
+model = load_model(
     "/home/antoine/MISC/openduckminiv2_playground/env/locomotion/open_duck_mini_v2/xmls/scene_mjx_flat_terrain.xml"
 )
 model.opt.timestep = DT
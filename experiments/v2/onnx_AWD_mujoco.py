@@ -6,8 +6,10 @@ import time
 import pygame
 import argparse
 from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import load_model as load_mujoco_model
 
-from mini_bdx_runtime.onnx_infer import OnnxInfer
+from mini_bdx.utils.policy_runner import PolicyRunner
+from mini_bdx.utils.telemetry import TelemetryRecorder, read_telemetry, record_dtype
 import pickle
 from bam.model import load_model
 from bam.mujoco import MujocoController
@@ -30,9 +32,12 @@ if args.k:
     pygame.display.set_caption("Press arrow keys to move robot")
 
 if args.replay_obs is not None:
-    with open(args.replay_obs, "rb") as f:
-        replay_obs = pickle.load(f)
-        replay_obs = np.array(replay_obs)
+    if args.replay_obs.endswith(".bin"):
+        replay_obs = np.array(read_telemetry(args.replay_obs)[0]["obs"])
+    else:
+        with open(args.replay_obs, "rb") as f:
+            replay_obs = pickle.load(f)
+            replay_obs = np.array(replay_obs)
 
 # Params
 linearVelocityScale = 1.0
@@ -66,7 +71,7 @@ init_pos = np.array(
 # model = mujoco.MjModel.from_xml_path(
 #     "/home/antoine/MISC/mini_BDX/mini_bdx/robots/open_duck_mini_v2/scene_position.xml"
 # )
-model = mujoco.MjModel.from_xml_path(
+model = load_mujoco_model(
     "/home/antoine/MISC/mujoco_menagerie/open_duck_mini_v2/scene.xml"
 )
 model.opt.timestep = 0.005
@@ -85,7 +90,7 @@ if args.bam:
 
 NUM_OBS = 56
 
-policy = OnnxInfer(args.onnx_model_path, awd=True)
+policy = PolicyRunner(args.onnx_model_path)
 
 COMMANDS_RANGE_X = [-0.2, 0.3]
 COMMANDS_RANGE_Y = [-0.2, 0.2]
@@ -100,7 +105,11 @@ data.qpos[7 : 7 + 16] = init_pos
 data.ctrl[:16] = init_pos
 
 replay_index = 0
-saved_obs = []
+telemetry = TelemetryRecorder(
+    "mujoco_telemetry.bin",
+    record_dtype(NUM_OBS, 16, 16),
+    metadata={"joints": mujoco_joints_order, "decimation": decimation},
+)
 
 
 def quat_rotate_inverse(q, v):
@@ -204,15 +213,22 @@ try:
                     obs = replay_obs[replay_index]
                 else:
                     obs = get_obs(data, prev_action, commands)
-                    saved_obs.append(obs)
 
-                obs = list(obs) + list(np.zeros(18))
-                action = policy.infer(obs)
+                # The 18 remaining policy inputs are left to zero
+                action = policy.infer(obs, pad=True)
 
                 prev_action = action.copy()
 
                 action = action * action_scale + init_pos
 
+                telemetry.log(
+                    timestamp=data.time,
+                    obs=obs,
+                    action=prev_action,
+                    commanded_position=action,
+                    measured_position=data.qpos[7 : 7 + 16],
+                )
+
                 # if args.bam:
                 #     for i, joint_name in enumerate(mujoco_joints_order):
                 #         mujoco_controllers[joint_name].update(action[i])
@@ -240,4 +256,5 @@ try:
                 time.sleep(time_until_next_step)
 
 except KeyboardInterrupt:
-    pickle.dump(saved_obs, open("mujoco_saved_obs.pkl", "wb"))
+    print(policy.report(model.opt.timestep * decimation))
+    telemetry.close()
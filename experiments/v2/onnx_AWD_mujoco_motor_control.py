@@ -6,7 +6,7 @@ import argparse
 import pickle
 import numpy as np
 
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 
 from mini_bdx_runtime.onnx_infer import OnnxInfer
 
@@ -156,7 +156,7 @@ init_pos = np.array(
     ]
 )
 
-model = mujoco.MjModel.from_xml_path(
+model = load_model(
     "/home/antoine/MISC/mini_BDX/mini_bdx/robots/open_duck_mini_v2/scene.xml"
 )
 # model = mujoco.MjModel.from_xml_path(
@@ -7,6 +7,8 @@ from placo_utils.tf import tf
 
 from mini_bdx_runtime.hwi_feetech_pypot import HWI
 
+from mini_bdx.utils.loop_scheduler import LoopScheduler
+
 MESHCAT_VIZ = False
 
 joints = [
@@ -97,6 +99,7 @@ def get_angles():
 
 
 # original_T_world_frame = T_world_trunk.copy()
+scheduler = LoopScheduler(1 / DT)
 while True:
 
     # T_world_frame = original_T_world_frame.copy()
@@ -112,25 +115,27 @@ while True:
 
     # trunk_task.T_world_frame = T_world_frame.copy()
 
-    solver.solve(True)
-    robot.update_kinematics()
+    with scheduler.phase("infer"):
+        solver.solve(True)
+        robot.update_kinematics()
 
     if not MESHCAT_VIZ:
-        all_angles = list(get_angles().values())
+        with scheduler.phase("actuate"):
+            all_angles = list(get_angles().values())
 
-        angles = {}
-        for i, motor_name in enumerate(hwi.joints.keys()):
-            angles[motor_name] = all_angles[i]
+            angles = {}
+            for i, motor_name in enumerate(hwi.joints.keys()):
+                angles[motor_name] = all_angles[i]
 
-        hwi.set_position_all(angles)
+            hwi.set_position_all(angles)
 
     if MESHCAT_VIZ:
         viz.display(robot.state.q)
         robot_frame_viz(robot, "left_foot")
         frame_viz("left_foot_target", left_foot_task.T_world_frame, opacity=0.25)
 
-    time.sleep(DT)
-    t += DT
+    scheduler.wait()
+    t = scheduler.t
     print(t)
 
 # @schedule(interval=dt)
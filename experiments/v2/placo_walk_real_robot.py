@@ -1,5 +1,6 @@
 from mini_bdx_runtime.hwi_feetech_pypot import HWI
 from mini_bdx.placo_walk_engine.placo_walk_engine import PlacoWalkEngine
+from mini_bdx.utils.loop_scheduler import LoopScheduler
 from placo_utils.visualization import robot_viz
 import json
 import time
@@ -87,8 +88,10 @@ if args.viz:
     viz = robot_viz(pwe.robot)
 
 pwe.set_traj(0.0, 0, 0.0)
+scheduler = LoopScheduler(1 / DT)
 while True:
-    pwe.tick(DT)
+    with scheduler.phase("infer"):
+        pwe.tick(DT)
 
     if args.xbox:
         commands = get_last_command()
@@ -102,13 +105,14 @@ while True:
         if commands is not None:
             pwe.set_traj(*placo_commands)
 
-    if not args.viz:
-        all_angles = list(pwe.get_angles().values())
-        angles = {}
-        for i, motor_name in enumerate(hwi.joints.keys()):
-            angles[motor_name] = all_angles[i]
-        hwi.set_position_all(angles)
-    else:
-        viz.display(pwe.robot.state.q)
-
-    time.sleep(DT)
+    with scheduler.phase("actuate"):
+        if not args.viz:
+            all_angles = list(pwe.get_angles().values())
+            angles = {}
+            for i, motor_name in enumerate(hwi.joints.keys()):
+                angles[motor_name] = all_angles[i]
+            hwi.set_position_all(angles)
+        else:
+            viz.display(pwe.robot.state.q)
+
+    scheduler.wait()
@@ -1,9 +1,10 @@
 import mujoco
 import numpy as np
 import mujoco_viewer
+from mini_bdx.utils.mujoco_utils import load_model
 from mini_bdx_runtime.rl_utils import mujoco_joints_order
 
-model = mujoco.MjModel.from_xml_path(
+model = load_model(
     "/home/antoine/MISC/mini_BDX/mini_bdx/robots/open_duck_mini_v2/scene.xml"
 )
 model.opt.timestep = 0.001
@@ -1,12 +1,12 @@
 import mujoco
 import pickle
-from mini_bdx.utils.mujoco_utils import check_contact
+from mini_bdx.utils.mujoco_utils import check_contact, load_model
 import mujoco.viewer
 import time
 import numpy as np
 
 
-model = mujoco.MjModel.from_xml_path(
+model = load_model(
     "/home/antoine/MISC/mini_BDX/mini_bdx/robots/open_duck_mini_v2/scene.xml"
 )
 model.opt.timestep = 0.005
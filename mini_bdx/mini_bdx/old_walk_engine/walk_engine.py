@@ -1,11 +1,29 @@
 # Based on https://github.com/Rhoban/walk_engine
 
+from collections import OrderedDict
+
 import FramesViewer.utils as fv_utils
 import numpy as np
 import placo
 
 from mini_bdx.utils import PolySpline
 
+JOINT_NAMES = [
+    "right_hip_yaw",
+    "right_hip_roll",
+    "right_hip_pitch",
+    "right_knee",
+    "right_ankle",
+    "left_hip_yaw",
+    "left_hip_roll",
+    "left_hip_pitch",
+    "left_knee",
+    "left_ankle",
+    "neck_pitch",
+    "head_pitch",
+    "head_yaw",
+]
+
 
 class FootPose:
     def __init__(self):
@@ -80,6 +98,13 @@ class WalkEngine:
         step_size_x: float = 0,
         step_size_y: float = 0,
         step_size_yaw: float = 0,
+        baked_gait: bool = False,
+        baked_gait_resolution: int = 50,
+        baked_gait_cache_size: int = 8,
+        baked_gait_tolerance: float = 1e-3,
+        baked_gait_step_quantum: float = 0.005,
+        baked_gait_angle_quantum: float = np.deg2rad(2),
+        baked_gait_samples_per_tick: int = 4,
     ):
         kinematics_solver = placo.KinematicsSolver(robot)
         self.left = Foot()
@@ -158,6 +183,27 @@ class WalkEngine:
         self.step_duration = 0
         self._swing_gain = 0
 
+        # Baked gait: when walking with a steady command, joint angles are served
+        # from a precomputed gait cycle instead of solving the IK every tick.
+        # Tables are indexed by the cycle phase, the first half of the cycle being
+        # a left support step.
+        self.baked_gait = baked_gait
+        self.baked_gait_resolution = baked_gait_resolution
+        self.baked_gait_cache_size = baked_gait_cache_size
+        self.baked_gait_tolerance = baked_gait_tolerance
+        # Gaits are baked for commands rounded to these quanta (m for the step sizes
+        # and head z offset, rad for the yaw and head angles), so that small stick
+        # movements reuse the cached gaits instead of baking new ones in the loop
+        self.baked_gait_step_quantum = baked_gait_step_quantum
+        self.baked_gait_angle_quantum = baked_gait_angle_quantum
+        # A gait missing from the cache is baked over the next ticks,
+        # baked_gait_samples_per_tick phase samples per update(), the live IK being
+        # used meanwhile. prebake() bakes commands ahead of time instead
+        self.baked_gait_samples_per_tick = baked_gait_samples_per_tick
+        self.baked_gaits = OrderedDict()
+        self._baked_angles = None
+        self._bake = None  # (key, bake_gait_steps() generator, bake state)
+
         self.reset()
 
     def get_left_foot_pose(self, t):
@@ -240,6 +286,41 @@ class WalkEngine:
         self.step_size_yaw = self.step_size_yaw + (delta_yaw / 100)
         self.rise_gain = self.rise_gain + (delta_rise_gain / 100)
 
+        if self.baked_gait and walking and not self.trunk_pitch_roll_compensation:
+            command = self.quantize_command(
+                target_step_x,
+                target_step_y,
+                target_yaw,
+                target_head_pitch,
+                target_head_yaw,
+                target_head_z_offset,
+            )
+            # The current step sizes are quantized as the targets, so that a target
+            # jittering within a quantum does not switch between baked and live
+            current = self.quantize_command(
+                self.step_size_x, self.step_size_y, self.step_size_yaw
+            )
+            steady = (
+                max(
+                    max(abs(a - b) for a, b in zip(command[:3], current[:3])),
+                    abs(target_rise_gain - self.rise_gain),
+                )
+                < self.baked_gait_tolerance
+            )
+            key = self.gait_key(*command)
+            if key not in self.baked_gaits:
+                self.advance_bake(key, command)
+            elif steady:
+                self.baked_gaits.move_to_end(key)
+                self._baked_angles = self.get_baked_angles(self.baked_gaits[key])
+                return
+
+        if self._baked_angles is not None:
+            # Leaving the baked gait, the IK starts back from the last served angles
+            for joint, angle in zip(JOINT_NAMES, self._baked_angles):
+                self.robot.set_joint(joint, angle)
+            self._baked_angles = None
+
         swing = 0
         if walking:
             self.left_foot_task.T_world_frame = self.get_left_foot_pose(
@@ -295,23 +376,240 @@ class WalkEngine:
         self.kinematics_solver.solve(True)
 
     def get_angles(self):
-        angles = {
-            "right_hip_yaw": self.robot.get_joint("right_hip_yaw"),
-            "right_hip_roll": self.robot.get_joint("right_hip_roll"),
-            "right_hip_pitch": self.robot.get_joint("right_hip_pitch"),
-            "right_knee": self.robot.get_joint("right_knee"),
-            "right_ankle": self.robot.get_joint("right_ankle"),
-            "left_hip_yaw": self.robot.get_joint("left_hip_yaw"),
-            "left_hip_roll": self.robot.get_joint("left_hip_roll"),
-            "left_hip_pitch": self.robot.get_joint("left_hip_pitch"),
-            "left_knee": self.robot.get_joint("left_knee"),
-            "left_ankle": self.robot.get_joint("left_ankle"),
-            "neck_pitch": self.robot.get_joint("neck_pitch"),
-            "head_pitch": self.robot.get_joint("head_pitch"),
-            "head_yaw": self.robot.get_joint("head_yaw"),
-        }
+        if self._baked_angles is not None:
+            return dict(zip(JOINT_NAMES, self._baked_angles))
+
+        angles = {joint: self.robot.get_joint(joint) for joint in JOINT_NAMES}
+        return angles
+
+    def quantize_command(
+        self,
+        target_step_x,
+        target_step_y,
+        target_yaw,
+        target_head_pitch=0,
+        target_head_yaw=0,
+        target_head_z_offset=0,
+    ):
+        def step(value):
+            quantum = self.baked_gait_step_quantum
+            return round(value / quantum) * quantum if quantum > 0 else value
+
+        def angle(value):
+            quantum = self.baked_gait_angle_quantum
+            return round(value / quantum) * quantum if quantum > 0 else value
+
+        return (
+            step(target_step_x),
+            step(target_step_y),
+            angle(target_yaw),
+            angle(target_head_pitch),
+            angle(target_head_yaw),
+            step(target_head_z_offset),
+        )
+
+    def gait_key(
+        self,
+        target_step_x,
+        target_step_y,
+        target_yaw,
+        target_head_pitch=0,
+        target_head_yaw=0,
+        target_head_z_offset=0,
+    ):
+        # (step_size_x, step_size_y, step_size_yaw, frequency, rise_gain), followed
+        # by the other parameters shaping the steady state gait
+        key = (
+            target_step_x,
+            target_step_y,
+            target_yaw,
+            self.frequency,
+            self.max_rise_gain,
+            self.rise_duration,
+            self.swing_gain,
+            self.swing_phase,
+            self.foot_y_offset,
+            self.foot_y_offset_per_step_size_y,
+            self.default_trunk_x_offset,
+            self.tune_trunk_x_offset,
+            self.default_trunk_z_offset,
+            self.target_trunk_pitch,
+            self.target_trunk_roll,
+            target_head_pitch,
+            target_head_yaw,
+            target_head_z_offset,
+        )
+        return tuple(round(float(value), 5) for value in key)
+
+    def store_baked_gait(self, key, angles):
+        self.baked_gaits[key] = angles
+        self.baked_gaits.move_to_end(key)
+        while len(self.baked_gaits) > self.baked_gait_cache_size:
+            self.baked_gaits.popitem(last=False)
+
+    def prebake(self, commands):
+        # Bakes the gaits of the given commands, (target_step_x, target_step_y,
+        # target_yaw[, target_head_pitch, target_head_yaw, target_head_z_offset])
+        # tuples, before starting the control loop
+        for command in commands:
+            command = self.quantize_command(*command)
+            key = self.gait_key(*command)
+            if key not in self.baked_gaits:
+                self.store_baked_gait(key, self.bake_gait(*command))
+
+    def advance_bake(self, key, command):
+        # Bakes the next baked_gait_samples_per_tick samples of the gait of command.
+        # The bake has its own engine state, swapped with the live one
+        if self._bake is None or self._bake[0] != key:
+            self._bake = (key, self.bake_gait_steps(*command), None)
+        key, steps, bake_state = self._bake
+
+        live_state = self.save_state()
+        if bake_state is not None:
+            self.restore_state(bake_state)
+        try:
+            for _ in range(self.baked_gait_samples_per_tick):
+                next(steps)
+            self._bake = (key, steps, self.save_state())
+        except StopIteration as done:
+            self.store_baked_gait(key, done.value)
+            self._bake = None
+        self.restore_state(live_state)
+
+    def bake_gait(self, *args, **kwargs):
+        # Bakes a whole gait at once, see bake_gait_steps().
+        # The engine state is restored afterwards.
+        saved_state = self.save_state()
+        steps = self.bake_gait_steps(*args, **kwargs)
+        try:
+            while True:
+                next(steps)
+        except StopIteration as done:
+            angles = done.value
+        self.restore_state(saved_state)
         return angles
 
+    def bake_gait_steps(
+        self,
+        target_step_x,
+        target_step_y,
+        target_yaw,
+        target_head_pitch=0,
+        target_head_yaw=0,
+        target_head_z_offset=0,
+        ik_iterations=5,
+    ):
+        # Generator playing two steady state steps (left support then right support)
+        # and recording the joint angles on a regular phase grid. It yields after
+        # each sample and returns the angles. The engine state is not restored.
+        self.step_size_x = target_step_x
+        self.step_size_y = target_step_y
+        self.step_size_yaw = target_yaw
+        self.rise_gain = self.max_rise_gain
+        self.trunk_pitch = self.target_trunk_pitch
+        self.trunk_roll = self.target_trunk_roll
+
+        T_world_trunk = np.eye(4)
+        T_world_trunk = fv_utils.rotateInSelf(
+            T_world_trunk, [self.trunk_roll, self.trunk_pitch, 0], degrees=True
+        )
+
+        T_world_head = self.T_world_head.copy()
+        T_world_head = fv_utils.translateInSelf(
+            T_world_head, [0, 0, -target_head_z_offset]
+        )
+        T_world_head = fv_utils.rotateInSelf(
+            T_world_head, [0, target_head_pitch, target_head_yaw], degrees=False
+        )
+        self.head_task.T_world_frame = T_world_head
+
+        # After two steps, the splines no longer depend on the initial pose
+        self.reset()
+        self.new_step()
+        self.new_step()
+        if not self.is_left_support:
+            self.new_step()
+
+        angles = np.zeros((2 * self.baked_gait_resolution, len(JOINT_NAMES)))
+        for step in range(2):
+            swing_P = 0 if self.is_left_support else np.pi
+            swing_P += np.pi * 2 * self.swing_phase
+            for i in range(self.baked_gait_resolution):
+                t = self.step_duration * i / self.baked_gait_resolution
+                self.left_foot_task.T_world_frame = self.get_left_foot_pose(t)
+                self.right_foot_task.T_world_frame = self.get_right_foot_pose(t)
+
+                swing = self._swing_gain * np.sin(
+                    np.pi * t / self.step_duration + swing_P
+                )
+                T_world_trunk[:3, 3] = [0, swing, 0]
+                self.trunk_task.T_world_frame = T_world_trunk
+
+                for _ in range(ik_iterations):
+                    self.robot.update_kinematics()
+                    self.kinematics_solver.solve(True)
+
+                angles[step * self.baked_gait_resolution + i] = [
+                    self.robot.get_joint(joint) for joint in JOINT_NAMES
+                ]
+                yield
+            self.new_step()
+
+        return angles
+
+    def get_baked_angles(self, angles):
+        # Linear interpolation in the baked cycle at the current phase
+        phase = self.time_since_last_step / self.step_duration
+        if not self.is_left_support:
+            phase += 1.0
+        index = phase * self.baked_gait_resolution
+        i = int(index) % len(angles)
+        alpha = index - int(index)
+        return (1 - alpha) * angles[i] + alpha * angles[(i + 1) % len(angles)]
+
+    def save_state(self):
+        return {
+            "q": self.robot.state.q.copy(),
+            "left": self.left.copy(),
+            "right": self.right.copy(),
+            "is_left_support": self.is_left_support,
+            "step_duration": self.step_duration,
+            "_swing_gain": self._swing_gain,
+            "step_size_x": self.step_size_x,
+            "step_size_y": self.step_size_y,
+            "step_size_yaw": self.step_size_yaw,
+            "rise_gain": self.rise_gain,
+            "trunk_pitch": self.trunk_pitch,
+            "trunk_roll": self.trunk_roll,
+            "time_since_last_step": self.time_since_last_step,
+            "tasks": [
+                np.array(task.T_world_frame)
+                for task in (
+                    self.head_task,
+                    self.trunk_task,
+                    self.left_foot_task,
+                    self.right_foot_task,
+                )
+            ],
+        }
+
+    def restore_state(self, state):
+        state = dict(state)
+        self.robot.state.q = state.pop("q").copy()
+        self.robot.update_kinematics()
+        for task, T_world_frame in zip(
+            (
+                self.head_task,
+                self.trunk_task,
+                self.left_foot_task,
+                self.right_foot_task,
+            ),
+            state.pop("tasks"),
+        ):
+            task.T_world_frame = T_world_frame
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def reset(self):
         self.left.trunk_y_offset = self.foot_distance + self.foot_y_offset
         self.right.trunk_y_offset = -(self.foot_distance + self.foot_y_offset)
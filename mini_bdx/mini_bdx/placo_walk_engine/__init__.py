@@ -1 +1,2 @@
 from .placo_walk_engine import PlacoWalkEngine
+from .reference_trajectories import ReferenceTrajectories
@@ -1,6 +1,7 @@
 import time
 import warnings
 import json
+from collections import OrderedDict
 
 import numpy as np
 import placo
@@ -11,6 +12,30 @@ warnings.filterwarnings("ignore")
 DT = 0.01
 REFINE = 10
 
+# Walk parameters the initial pose and the plans depend on, part of the snapshots
+# cache key
+PLAN_PARAMETERS = [
+    "double_support_ratio",
+    "startend_double_support_ratio",
+    "planned_timesteps",
+    "replan_timesteps",
+    "walk_com_height",
+    "walk_foot_height",
+    "walk_trunk_pitch",
+    "walk_foot_rise_ratio",
+    "single_support_duration",
+    "single_support_timesteps",
+    "foot_length",
+    "feet_spacing",
+    "zmp_margin",
+    "foot_zmp_target_x",
+    "foot_zmp_target_y",
+    "walk_max_dtheta",
+    "walk_max_dy",
+    "walk_max_dx_forward",
+    "walk_max_dx_backward",
+]
+
 
 class PlacoWalkEngine:
     def __init__(
@@ -19,12 +44,36 @@ class PlacoWalkEngine:
         model_filename: str = "go_bdx.urdf",
         init_params: dict = {},
         ignore_feet_contact: bool = False,
+        adaptive_refine: bool = False,
+        refine_tolerance: float = 1e-4,
+        max_refine: int = REFINE,
+        fast_reset: bool = True,
+        snapshot_cache_size: int = 8,
+        verbose: bool = True,
     ) -> None:
         model_filename = os.path.join(asset_path, model_filename)
         self.asset_path = asset_path
         self.model_filename = model_filename
         self.ignore_feet_contact = ignore_feet_contact
 
+        # Adaptive refine skips the remaining refine solves of a tick once the errors
+        # of the walk tasks (feet, CoM or trunk, see walk_tasks_error()) fall below
+        # refine_tolerance (m and rad), a single solve covering them, with at most
+        # max_refine solves per tick. Not validated on the robot yet, off by default
+        self.adaptive_refine = adaptive_refine
+        self.refine_tolerance = refine_tolerance
+        self.max_refine = max_refine
+        self.tick_stats = {"iterations": 0, "solve_time": 0.0}
+
+        # With fast_reset, reset() restores a snapshot of the initial pose and plan
+        # (see snapshot()) instead of solving and planning again. Plans are cached
+        # per (d_x, d_y, d_theta), the least recently used being dropped. The cache
+        # is cleared when the walk parameters changed (see plan_key())
+        self.fast_reset = fast_reset
+        self.snapshot_cache_size = snapshot_cache_size
+        self.snapshots = OrderedDict()
+        self.verbose = verbose
+
         # Loading the robot
         self.robot = placo.HumanoidRobot(model_filename)
 
@@ -53,6 +102,17 @@ class PlacoWalkEngine:
         self.tasks.initialize_tasks(self.solver, self.robot)
         self.tasks.left_foot_task.orientation().mask.set_axises("yz", "local")
         self.tasks.right_foot_task.orientation().mask.set_axises("yz", "local")
+        self.refine_tasks = [
+            self.tasks.left_foot_task.position(),
+            self.tasks.left_foot_task.orientation(),
+            self.tasks.right_foot_task.position(),
+            self.tasks.right_foot_task.orientation(),
+            self.tasks.trunk_orientation_task,
+        ]
+        if getattr(self.tasks, "trunk_mode", False):
+            self.refine_tasks.append(self.tasks.trunk_task)
+        else:
+            self.refine_tasks.append(self.tasks.com_task)
         # tasks.trunk_orientation_task.configure("trunk_orientation", "soft", 1e-4)
         # tasks.left_foot_task.orientation().configure("left_foot_orientation", "soft", 1e-6)
         # tasks.right_foot_task.orientation().configure("right_foot_orientation", "soft", 1e-6)
@@ -68,16 +128,11 @@ class PlacoWalkEngine:
         self.joints_task.configure("joints", "soft", 1.0)
 
         # Placing the robot in the initial position
-        print("Placing the robot in the initial position...")
-        self.tasks.reach_initial_pose(
-            np.eye(4),
-            self.parameters.feet_spacing,
-            self.parameters.walk_com_height,
-            self.parameters.walk_trunk_pitch,
-        )
-        print("Initial position reached")
+        self.log("Placing the robot in the initial position...")
+        self.reach_initial_pose()
+        self.log("Initial position reached")
 
-        print(self.get_angles())
+        self.log(self.get_angles())
         # exit()
 
         # Creating the FootstepsPlanner
@@ -92,20 +147,12 @@ class PlacoWalkEngine:
             self.d_x, self.d_y, self.d_theta, self.nb_steps
         )
 
-        # Planning footsteps
-        self.T_world_left = placo.flatten_on_floor(self.robot.get_T_world_left())
-        self.T_world_right = placo.flatten_on_floor(self.robot.get_T_world_right())
-        self.footsteps = self.repetitive_footsteps_planner.plan(
-            placo.HumanoidRobot_Side.left, self.T_world_left, self.T_world_right
-        )
-
-        self.supports = placo.FootstepsPlanner.make_supports(
-            self.footsteps, True, self.parameters.has_double_support(), True
-        )
-
         # Creating the pattern generator and making an initial plan
         self.walk = placo.WalkPatternGenerator(self.robot, self.parameters)
-        self.trajectory = self.walk.plan(self.supports, self.robot.com_world(), 0.0)
+        self.plan()
+        self.initial_snapshot = self.snapshot()
+        self.snapshots_key = self.plan_key()
+        self.snapshots[self.get_command()] = self.initial_snapshot
 
         self.time_since_last_right_contact = 0.0
         self.time_since_last_left_contact = 0.0
@@ -181,13 +228,27 @@ class PlacoWalkEngine:
             angles.pop(joint, None)
         return angles
 
-    def reset(self):
-        self.t = self.initial_delay
-        self.start = None
-        self.last_replan = 0
-        self.time_since_last_right_contact = 0.0
-        self.time_since_last_left_contact = 0.0
+    def get_angles_array(self, out=None):
+        # Same as get_angles(), in self.joints order, without building a dict
+        if out is None:
+            out = np.zeros(len(self.joints))
+        for i, joint in enumerate(self.joints):
+            out[i] = self.robot.get_joint(joint)
+        return out
+
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
+
+    def get_command(self):
+        return (self.d_x, self.d_y, self.d_theta)
 
+    def plan_key(self):
+        # Everything but the command the cached snapshots depend on
+        values = [getattr(self.parameters, name) for name in PLAN_PARAMETERS]
+        return tuple(values) + (self.nb_steps,)
+
+    def reach_initial_pose(self):
         self.tasks.reach_initial_pose(
             np.eye(4),
             self.parameters.feet_spacing,
@@ -195,7 +256,8 @@ class PlacoWalkEngine:
             self.parameters.walk_trunk_pitch,
         )
 
-        # Planning footsteps
+    def plan(self):
+        # Plans footsteps and the CoM trajectory from the current pose
         self.T_world_left = placo.flatten_on_floor(self.robot.get_T_world_left())
         self.T_world_right = placo.flatten_on_floor(self.robot.get_T_world_right())
         self.footsteps = self.repetitive_footsteps_planner.plan(
@@ -207,6 +269,66 @@ class PlacoWalkEngine:
         )
         self.trajectory = self.walk.plan(self.supports, self.robot.com_world(), 0.0)
 
+    def snapshot(self):
+        # Robot state and plan, as left by reach_initial_pose() and plan(). Planner
+        # outputs are never modified in place (replanning creates new ones), so they
+        # are shared rather than copied
+        return {
+            "q": self.robot.state.q.copy(),
+            "qd": self.robot.state.qd.copy(),
+            "T_world_left": self.T_world_left.copy(),
+            "T_world_right": self.T_world_right.copy(),
+            "footsteps": self.footsteps,
+            "supports": self.supports,
+            "trajectory": self.trajectory,
+        }
+
+    def restore(self, snapshot):
+        self.robot.state.q = snapshot["q"].copy()
+        self.robot.state.qd = snapshot["qd"].copy()
+        self.robot.update_kinematics()
+        self.T_world_left = snapshot["T_world_left"].copy()
+        self.T_world_right = snapshot["T_world_right"].copy()
+        self.footsteps = snapshot["footsteps"]
+        self.supports = snapshot["supports"]
+        self.trajectory = snapshot["trajectory"]
+
+    def reset(self):
+        self.t = self.initial_delay
+        self.start = None
+        self.last_replan = 0
+        self.time_since_last_right_contact = 0.0
+        self.time_since_last_left_contact = 0.0
+
+        if not self.fast_reset:
+            self.reach_initial_pose()
+            self.plan()
+            return
+
+        plan_key = self.plan_key()
+        if plan_key != self.snapshots_key:
+            # Parameters changed since the snapshots were taken
+            self.snapshots.clear()
+            self.reach_initial_pose()
+            self.plan()
+            self.initial_snapshot = self.snapshot()
+            self.snapshots_key = plan_key
+            self.snapshots[self.get_command()] = self.initial_snapshot
+            return
+
+        command = self.get_command()
+        if command in self.snapshots:
+            self.snapshots.move_to_end(command)
+            self.restore(self.snapshots[command])
+            return
+
+        # The initial pose does not depend on the command, only the plan does
+        self.restore(self.initial_snapshot)
+        self.plan()
+        self.snapshots[command] = self.snapshot()
+        while len(self.snapshots) > self.snapshot_cache_size:
+            self.snapshots.popitem(last=False)
+
     def set_traj(self, d_x, d_y, d_theta):
         self.d_x = d_x
         self.d_y = d_y
@@ -251,6 +373,10 @@ class PlacoWalkEngine:
 
         return self.trajectory.support_side(self.t)
 
+    def walk_tasks_error(self):
+        # Largest error norm of the walk tasks, as computed by the last solve
+        return max(task.error_norm() for task in self.refine_tasks)
+
     def tick(self, dt, left_contact=True, right_contact=True):
         if self.start is None:
             self.start = time.time()
@@ -267,15 +393,49 @@ class PlacoWalkEngine:
             > self.parameters.single_support_duration
         )
 
-        for k in range(REFINE):
-            # Updating the QP tasks from planned trajectory
-            if not falling:
-                self.tasks.update_tasks_from_trajectory(
-                    self.trajectory, self.t - dt + k * dt / REFINE
-                )
-
-            self.robot.update_kinematics()
-            _ = self.solver.solve(True)
+        solve_start = time.perf_counter()
+        if self.adaptive_refine:
+            # The refine sub-steps are followed as in the fixed loop below. Once the
+            # walk tasks errors fell below refine_tolerance (or before exceeding
+            # max_refine solves), a last solve targets the end of the tick, with a
+            # solver dt spanning all the remaining sub-steps so that the velocity
+            # limits allow the same motion as their REFINE solves
+            substeps = 0  # Sub-steps covered by the solves done
+            iterations = 0
+            while substeps < REFINE:
+                # Errors are the ones the last solve started from, i.e. the tracking
+                # error of its sub-step target
+                if iterations >= self.max_refine - 1 or (
+                    iterations > 0 and self.walk_tasks_error() < self.refine_tolerance
+                ):
+                    steps = REFINE - substeps
+                else:
+                    steps = 1
+                substeps += steps
+
+                if not falling:
+                    self.tasks.update_tasks_from_trajectory(
+                        self.trajectory, self.t - dt + (substeps - 1) * dt / REFINE
+                    )
+                self.solver.dt = steps * DT / REFINE
+                self.robot.update_kinematics()
+                self.solver.solve(True)
+                iterations += 1
+            self.solver.dt = DT / REFINE
+        else:
+            for k in range(REFINE):
+                # Updating the QP tasks from planned trajectory
+                if not falling:
+                    self.tasks.update_tasks_from_trajectory(
+                        self.trajectory, self.t - dt + k * dt / REFINE
+                    )
+
+                self.robot.update_kinematics()
+                _ = self.solver.solve(True)
+            iterations = REFINE
+
+        self.tick_stats["iterations"] = iterations
+        self.tick_stats["solve_time"] = time.perf_counter() - solve_start
 
         # If enough time elapsed and we can replan, do the replanning
         if (
@@ -0,0 +1,259 @@
+import itertools
+
+import numpy as np
+import placo
+from scipy.spatial.transform import Rotation as R
+
+from .placo_walk_engine import DT
+
+SUPPORT_PHASES = ["both", placo.HumanoidRobot_Side.left, placo.HumanoidRobot_Side.right]
+
+
+class ReferenceTrajectories:
+    # Precomputed PlacoWalkEngine trajectories, one periodic walk cycle per
+    # (d_x, d_y, d_theta) command of a regular grid.
+    # Arrays are indexed by [i_x, i_y, i_theta, sample, ...], samples being evenly
+    # spaced in phase, starting at phase_offset.
+    # As the online engine, the robot first stands still for -initial_delay seconds
+    # (t < 0), in the stand_angles pose.
+    def __init__(
+        self,
+        d_xs,
+        d_ys,
+        d_thetas,
+        period,
+        phase_offset,
+        joints,
+        angles,
+        left_foot_poses,
+        right_foot_poses,
+        support_phases,
+        footsteps,
+        stand_angles=None,
+        initial_delay=0.0,
+    ):
+        self.d_xs = np.asarray(d_xs, dtype=np.float64)
+        self.d_ys = np.asarray(d_ys, dtype=np.float64)
+        self.d_thetas = np.asarray(d_thetas, dtype=np.float64)
+        self.period = float(period)
+        self.phase_offset = float(phase_offset)
+        self.joints = list(joints)
+        self.angles = angles
+        self.left_foot_poses = left_foot_poses
+        self.right_foot_poses = right_foot_poses
+        self.support_phases = support_phases
+        self.footsteps = footsteps
+        self.nb_samples = angles.shape[3]
+        self.stand_angles = stand_angles
+        self.initial_delay = float(initial_delay)
+
+    @classmethod
+    def generate(
+        cls, pwe, d_xs, d_ys, d_thetas, nb_samples=100, warmup=2.0, dt=DT, verbose=True
+    ):
+        # Ticks the walk engine at dt (its DT, as when it runs online) for each
+        # command of the grid, and records one walk cycle once warmup seconds
+        # elapsed. The ticks are then resampled at nb_samples phases: angles and
+        # foot positions are interpolated linearly, the other values are taken from
+        # the closest tick.
+        period = pwe.period
+        shape = (len(d_xs), len(d_ys), len(d_thetas), nb_samples)
+        angles = np.zeros(shape + (len(pwe.joints),), dtype=np.float32)
+        left_foot_poses = np.zeros(shape + (4, 4), dtype=np.float32)
+        right_foot_poses = np.zeros(shape + (4, 4), dtype=np.float32)
+        support_phases = np.zeros(shape, dtype=np.int8)
+        footsteps = np.zeros(shape + (2, 4), dtype=np.float32)  # 2*[x, y, z, theta]
+
+        pwe.reset()
+        stand_angles = np.array(list(pwe.get_angles().values()), dtype=np.float32)
+
+        for (i, d_x), (j, d_y), (k, d_theta) in itertools.product(
+            enumerate(d_xs), enumerate(d_ys), enumerate(d_thetas)
+        ):
+            if verbose:
+                print("Generating reference for", d_x, d_y, d_theta)
+            pwe.reset()
+            pwe.set_traj(d_x, d_y, d_theta)
+            while pwe.t < warmup:
+                pwe.tick(dt)
+
+            # One cycle of ticks, and one more to interpolate the last samples
+            start_t = pwe.t
+            ticks = []
+            while len(ticks) < 2 or ticks[-2][0] < start_t + period:
+                T_fbase_world = np.linalg.inv(pwe.robot.get_T_world_fbase())
+                next_footsteps = pwe.get_footsteps_in_robot_frame()[2:4]
+                next_footsteps += next_footsteps[-1:] * (2 - len(next_footsteps))
+                ticks.append(
+                    (
+                        pwe.t,
+                        list(pwe.get_angles().values()),
+                        T_fbase_world @ pwe.robot.get_T_world_left(),
+                        T_fbase_world @ pwe.robot.get_T_world_right(),
+                        SUPPORT_PHASES.index(pwe.get_current_support_phase()),
+                        [
+                            list(footstep[:3, 3])
+                            + [R.from_matrix(footstep[:3, :3]).as_euler("xyz")[2]]
+                            for footstep in next_footsteps
+                        ],
+                    )
+                )
+                pwe.tick(dt)
+            times, tick_angles, lefts, rights, supports, tick_footsteps = map(
+                np.array, zip(*ticks)
+            )
+
+            # Time of each sample phase in the recorded cycle
+            start_phase = (start_t % period) / period
+            sample_times = (
+                start_t
+                + ((np.arange(nb_samples) / nb_samples - start_phase) % 1.0) * period
+            )
+            closest = np.abs(times[None, :] - sample_times[:, None]).argmin(axis=1)
+            for n, sample_t in enumerate(sample_times):
+                angles[i, j, k, n] = [
+                    np.interp(sample_t, times, tick_angles[:, a])
+                    for a in range(tick_angles.shape[1])
+                ]
+            for poses, tick_poses in (
+                (left_foot_poses, lefts),
+                (right_foot_poses, rights),
+            ):
+                poses[i, j, k] = tick_poses[closest]
+                for a in range(3):
+                    poses[i, j, k, :, a, 3] = np.interp(
+                        sample_times, times, tick_poses[:, a, 3]
+                    )
+            support_phases[i, j, k] = supports[closest]
+            footsteps[i, j, k] = tick_footsteps[closest]
+
+        return cls(
+            d_xs,
+            d_ys,
+            d_thetas,
+            period,
+            0.0,
+            list(pwe.joints),
+            angles,
+            left_foot_poses,
+            right_foot_poses,
+            support_phases,
+            footsteps,
+            stand_angles,
+            pwe.initial_delay,
+        )
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            np.savez(
+                f,
+                d_xs=self.d_xs,
+                d_ys=self.d_ys,
+                d_thetas=self.d_thetas,
+                period=self.period,
+                phase_offset=self.phase_offset,
+                joints=np.array(self.joints),
+                angles=self.angles,
+                left_foot_poses=self.left_foot_poses,
+                right_foot_poses=self.right_foot_poses,
+                support_phases=self.support_phases,
+                footsteps=self.footsteps,
+                initial_delay=self.initial_delay,
+                **(
+                    {}
+                    if self.stand_angles is None
+                    else {"stand_angles": self.stand_angles}
+                ),
+            )
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            return cls(
+                data["d_xs"],
+                data["d_ys"],
+                data["d_thetas"],
+                data["period"],
+                data["phase_offset"],
+                data["joints"].tolist(),
+                data["angles"],
+                data["left_foot_poses"],
+                data["right_foot_poses"],
+                data["support_phases"],
+                data["footsteps"],
+                # Files generated before the initial delay was reproduced
+                data["stand_angles"] if "stand_angles" in data else None,
+                data["initial_delay"] if "initial_delay" in data else 0.0,
+            )
+
+    def get_phase(self, t):
+        # Same as the PlacoWalkEngine clock signal
+        return (t % self.period) / self.period
+
+    def is_standing(self, t):
+        # Whether the robot stands still at t, during the initial delay
+        return t < 0 and self.stand_angles is not None
+
+    def _grid_weights(self, values, value):
+        # Two neighbouring grid indices and their linear interpolation weights
+        if len(values) == 1:
+            return (0, 0), (1.0, 0.0)
+        value = np.clip(value, values[0], values[-1])
+        i = min(int(np.searchsorted(values, value, side="right")) - 1, len(values) - 2)
+        alpha = (value - values[i]) / (values[i + 1] - values[i])
+        return (i, i + 1), (1.0 - alpha, alpha)
+
+    def _sample_weights(self, phase):
+        u = (phase - self.phase_offset) * self.nb_samples
+        s = int(np.floor(u))
+        alpha = u - s
+        s %= self.nb_samples
+        return (s, (s + 1) % self.nb_samples), (1.0 - alpha, alpha)
+
+    def _corners(self, d_x, d_y, d_theta, phase):
+        x_idx, x_w = self._grid_weights(self.d_xs, d_x)
+        y_idx, y_w = self._grid_weights(self.d_ys, d_y)
+        theta_idx, theta_w = self._grid_weights(self.d_thetas, d_theta)
+        s_idx, s_w = self._sample_weights(phase)
+        for a, b, c, d in itertools.product(range(2), repeat=4):
+            weight = x_w[a] * y_w[b] * theta_w[c] * s_w[d]
+            if weight > 0:
+                yield (x_idx[a], y_idx[b], theta_idx[c], s_idx[d]), weight
+
+    def get(self, d_x, d_y, d_theta, phase):
+        # Interpolates linearly between the neighbouring commands of the grid and
+        # the neighbouring phase samples.
+        # Discrete values (support phase) and foot rotations are taken from the
+        # closest sample.
+        angles = np.zeros(self.angles.shape[-1])
+        left_foot_pose = np.zeros((4, 4))
+        right_foot_pose = np.zeros((4, 4))
+        footsteps = np.zeros(self.footsteps.shape[-2:])
+        best_weight = -1
+        for index, weight in self._corners(d_x, d_y, d_theta, phase):
+            angles += weight * self.angles[index]
+            left_foot_pose[:3, 3] += weight * self.left_foot_poses[index][:3, 3]
+            right_foot_pose[:3, 3] += weight * self.right_foot_poses[index][:3, 3]
+            footsteps += weight * self.footsteps[index]
+            if weight > best_weight:
+                best_weight = weight
+                closest = index
+
+        left_foot_pose[:3, :3] = self.left_foot_poses[closest][:3, :3]
+        right_foot_pose[:3, :3] = self.right_foot_poses[closest][:3, :3]
+        left_foot_pose[3, 3] = 1
+        right_foot_pose[3, 3] = 1
+
+        return {
+            "angles": angles,
+            "left_foot_pose": left_foot_pose,
+            "right_foot_pose": right_foot_pose,
+            "support_phase": SUPPORT_PHASES[self.support_phases[closest]],
+            "footsteps": footsteps,
+        }
+
+    def get_angles(self, d_x, d_y, d_theta, phase):
+        angles = np.zeros(self.angles.shape[-1])
+        for index, weight in self._corners(d_x, d_y, d_theta, phase):
+            angles += weight * self.angles[index]
+        return angles
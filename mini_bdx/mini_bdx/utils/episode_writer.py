@@ -0,0 +1,212 @@
+import os
+import queue
+import threading
+from glob import glob
+
+import numpy as np
+
+# Messages to the writer thread
+_START = "start"
+_BLOCK = "block"
+_END = "end"
+_STOP = "stop"
+
+
+def parse_schema(schema):
+    # schema maps dataset names (e.g. "/observations/qpos") to a shape, or to a
+    # (shape, dtype) pair, float32 by default. Returns {name: (shape, dtype)}
+    parsed = {}
+    for name, spec in schema.items():
+        if isinstance(spec, int):
+            spec = (spec,)
+        if len(spec) == 2 and not isinstance(spec[1], (int, np.integer)):
+            shape, dtype = spec
+        else:
+            shape, dtype = spec, np.float32
+        if isinstance(shape, int):
+            shape = (shape,)
+        parsed[name] = (tuple(shape), np.dtype(dtype))
+    return parsed
+
+
+class HDF5EpisodeWriter:
+    # Records episodes to one HDF5 file each (episode_<id>.hdf5 in session_path),
+    # without stalling the loop producing the steps.
+    # append() copies a step in a preallocated block of block_size steps. Full
+    # blocks are handed to a background thread which owns the files: it creates
+    # the datasets of the schema (resizable, chunked by block and optionally
+    # compressed), grows them and writes each block. end_episode() only queues the
+    # end of the episode, the thread writing the last block and closing the file.
+    # nb_blocks blocks are preallocated. If the thread falls behind by all of them,
+    # append() waits for a block to be written (counted in self.waits).
+    # start_episode(), append() and end_episode() must be called from the same
+    # thread (e.g. the simulation loop, not a viewer key callback).
+    # Usage:
+    #   writer = HDF5EpisodeWriter("data/session", {"/action": 15, ...})
+    #   writer.start_episode()
+    #   for each step:
+    #       writer.append({"/action": action, ...})
+    #   writer.end_episode()
+    #   ...
+    #   writer.close()
+    def __init__(
+        self,
+        session_path,
+        schema,
+        block_size=64,
+        nb_blocks=16,
+        compression=None,
+        compression_opts=None,
+        rdcc_nbytes=1024**2 * 2,
+    ):
+        self.session_path = session_path
+        self.schema = parse_schema(schema)
+        self.block_size = block_size
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.rdcc_nbytes = rdcc_nbytes
+        os.makedirs(session_path, exist_ok=True)
+        self.next_id = len(glob(os.path.join(session_path, "*.hdf5")))
+
+        self.free_blocks = queue.Queue()
+        for _ in range(nb_blocks):
+            self.free_blocks.put(
+                {
+                    name: np.zeros((block_size,) + shape, dtype=dtype)
+                    for name, (shape, dtype) in self.schema.items()
+                }
+            )
+        self.messages = queue.Queue()
+        self.block = None
+        self.pending = 0  # Steps in the current block
+        self.episode_path = None
+        self.episode_steps = 0
+        self.waits = 0
+        self.error = None
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @property
+    def recording(self):
+        return self.episode_path is not None
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def start_episode(self, attrs={}):
+        # Returns the path of the episode file. attrs are stored in its root
+        self._check()
+        if self.recording:
+            raise Exception(f"Episode {self.episode_path} is not ended")
+        self.episode_path = os.path.join(
+            self.session_path, f"episode_{self.next_id}.hdf5"
+        )
+        self.next_id += 1
+        self.episode_steps = 0
+        self.messages.put((_START, (self.episode_path, dict(attrs))))
+        return self.episode_path
+
+    def _get_block(self):
+        try:
+            return self.free_blocks.get_nowait()
+        except queue.Empty:
+            self.waits += 1
+            return self.free_blocks.get()
+
+    def _send_block(self):
+        self.messages.put((_BLOCK, (self.block, self.pending)))
+        self.block = None
+        self.pending = 0
+
+    def append(self, step):
+        # step maps each dataset name of the schema to its value for this step
+        if not self.recording:
+            raise Exception("No episode started")
+        if self.block is None:
+            self.block = self._get_block()
+        for name, values in self.block.items():
+            values[self.pending] = step[name]
+        self.pending += 1
+        self.episode_steps += 1
+        if self.pending == self.block_size:
+            self._send_block()
+
+    def end_episode(self, attrs={}):
+        # Returns immediately, the file being completed by the thread. attrs are
+        # stored in its root, with the number of steps as "num_timesteps"
+        self._check()
+        if not self.recording:
+            raise Exception("No episode started")
+        if self.pending > 0:
+            self._send_block()
+        attrs = dict(attrs)
+        attrs["num_timesteps"] = self.episode_steps
+        self.messages.put((_END, attrs))
+        path = self.episode_path
+        self.episode_path = None
+        return path
+
+    def flush(self):
+        # Waits until everything queued is written
+        self.messages.join()
+        self._check()
+
+    def close(self):
+        # Ends the current episode if any, and waits for the files to be written
+        if self.recording:
+            self.end_episode()
+        self.messages.put((_STOP, None))
+        self.thread.join()
+        self._check()
+
+    def _run(self):
+        import h5py
+
+        file = None
+        datasets = {}
+        size = 0
+        while True:
+            kind, payload = self.messages.get()
+            try:
+                if self.error is not None:
+                    # The episodes are not written anymore after an error, blocks
+                    # are still recycled so that append() does not wait forever
+                    if kind == _BLOCK:
+                        self.free_blocks.put(payload[0])
+                elif kind == _START:
+                    path, attrs = payload
+                    file = h5py.File(path, "w", rdcc_nbytes=self.rdcc_nbytes)
+                    file.attrs.update(attrs)
+                    datasets = {}
+                    for name, (shape, dtype) in self.schema.items():
+                        datasets[name] = file.create_dataset(
+                            name,
+                            shape=(0,) + shape,
+                            maxshape=(None,) + shape,
+                            dtype=dtype,
+                            chunks=(self.block_size,) + shape,
+                            compression=self.compression,
+                            compression_opts=self.compression_opts,
+                        )
+                    size = 0
+                elif kind == _BLOCK:
+                    block, count = payload
+                    for name, dataset in datasets.items():
+                        dataset.resize(size + count, axis=0)
+                        dataset[size : size + count] = block[name][:count]
+                    size += count
+                    self.free_blocks.put(block)
+                elif kind == _END:
+                    file.attrs.update(payload)
+                    file.close()
+                    file = None
+                elif kind == _STOP:
+                    return
+            except Exception as e:
+                self.error = e
+                if kind == _BLOCK:
+                    self.free_blocks.put(payload[0])
+            finally:
+                self.messages.task_done()
@@ -0,0 +1,205 @@
+import json
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from mini_bdx.utils.ring_buffer import RingBuffer
+
+# Overrun policies
+SKIP = "skip"  # Missed deadlines are dropped, the loop stays on the period grid
+CATCH_UP = "catch_up"  # Missed iterations run back to back until on time again
+
+
+class Clock:
+    # Monotonic wall clock
+    def now(self):
+        return time.monotonic()
+
+    def sleep_until(self, deadline, busy_wait=0.0):
+        # time.sleep() can overshoot by a fraction of a millisecond, the last
+        # busy_wait seconds before the deadline are spent spinning instead
+        remaining = deadline - time.monotonic() - busy_wait
+        if remaining > 0:
+            time.sleep(remaining)
+        while time.monotonic() < deadline:
+            pass
+
+
+class SimulatedClock:
+    # Clock for simulated hardware, time only moves forward with advance() (e.g.
+    # after each simulation step) and when sleeping
+    def __init__(self, start=0.0):
+        self.t = start
+
+    def now(self):
+        return self.t
+
+    def advance(self, duration):
+        self.t += duration
+
+    def sleep_until(self, deadline, busy_wait=0.0):
+        self.t = max(self.t, deadline)
+
+
+class Timings:
+    # Rolling window of the last depth durations
+    def __init__(self, depth):
+        self.samples = RingBuffer(depth, ())
+        self.count = 0
+
+    def push(self, duration):
+        self.samples.push(duration)
+        self.count += 1
+
+    def values(self):
+        return self.samples.ordered()[-min(self.count, self.samples.depth) :]
+
+    def summary(self):
+        values = self.values()
+        if len(values) == 0:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "mean": float(np.mean(values)),
+            "std": float(np.std(values)),
+            "min": float(np.min(values)),
+            "p50": float(np.percentile(values, 50)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(np.max(values)),
+        }
+
+
+class LoopScheduler:
+    # Paces a control loop at frequency Hz, sleeping until absolute deadlines
+    # (start + k * period) rather than for a fixed duration after the work, so that
+    # the work duration does not add up to the period.
+    # Usage:
+    #   scheduler = LoopScheduler(50)
+    #   while True:
+    #       with scheduler.phase("sense"):
+    #           ...
+    #       with scheduler.phase("infer"):
+    #           ...
+    #       scheduler.wait()
+    # Periods, jitters (wake up time - deadline) and phase durations of the last
+    # history iterations are kept, see stats(), histogram() and dump().
+    # Pass a SimulatedClock to run against simulated time.
+    def __init__(
+        self, frequency, overrun=SKIP, busy_wait=0.0005, history=1000, clock=None
+    ):
+        if overrun not in [SKIP, CATCH_UP]:
+            raise Exception(f"Unknown overrun policy {overrun}")
+
+        self.frequency = frequency
+        self.period = 1.0 / frequency
+        self.overrun = overrun
+        self.busy_wait = busy_wait
+        self.history = history
+        self.clock = Clock() if clock is None else clock
+
+        self.periods = Timings(history)
+        self.jitters = Timings(history)
+        self.phases = {}
+        self.reset()
+
+    def reset(self):
+        # The first iteration starts now, e.g. once the hardware is initialized
+        self.start = self.clock.now()
+        self.deadline = self.start
+        self.last_wake = None
+        self.last_period = self.period
+        self.iterations = 0
+        self.overruns = 0
+        self.missed = 0
+
+    @property
+    def t(self):
+        # Scheduled time of the current iteration, since reset()
+        return self.deadline - self.start
+
+    @contextmanager
+    def phase(self, name):
+        start = self.clock.now()
+        try:
+            yield
+        finally:
+            if name not in self.phases:
+                self.phases[name] = Timings(self.history)
+            self.phases[name].push(self.clock.now() - start)
+
+    def wait(self):
+        # Ends the current iteration, sleeping until the next deadline. Returns the
+        # number of deadlines skipped because of an overrun
+        now = self.clock.now()
+        self.deadline += self.period
+        skipped = 0
+        if now > self.deadline:
+            self.overruns += 1
+            if self.overrun == SKIP:
+                skipped = int((now - self.deadline) // self.period) + 1
+                self.deadline += skipped * self.period
+                self.missed += skipped
+
+        self.clock.sleep_until(self.deadline, self.busy_wait)
+        wake = self.clock.now()
+        self.jitters.push(wake - self.deadline)
+        if self.last_wake is not None:
+            self.last_period = wake - self.last_wake
+            self.periods.push(self.last_period)
+        self.last_wake = wake
+        self.iterations += 1
+
+        return skipped
+
+    def _timings(self, name):
+        if name == "period":
+            return self.periods
+        if name == "jitter":
+            return self.jitters
+        return self.phases[name]
+
+    def stats(self):
+        # Summaries of the rolling windows, durations in seconds
+        stats = {
+            "frequency": self.frequency,
+            "iterations": self.iterations,
+            "overruns": self.overruns,
+            "missed": self.missed,
+            "period": self.periods.summary(),
+            "jitter": self.jitters.summary(),
+        }
+        stats["phases"] = {
+            name: timings.summary() for name, timings in self.phases.items()
+        }
+        return stats
+
+    def histogram(self, name="jitter", bins=20, range=None):
+        # (counts, bin_edges) of the rolling window of name ("period", "jitter" or
+        # a phase name)
+        return np.histogram(self._timings(name).values(), bins=bins, range=range)
+
+    def report(self):
+        lines = [
+            f"{self.iterations} iterations at {self.frequency}Hz, "
+            f"{self.overruns} overruns, {self.missed} missed deadlines"
+        ]
+        names = ["period", "jitter"] + list(self.phases.keys())
+        for name in names:
+            summary = self._timings(name).summary()
+            if summary["count"] == 0:
+                continue
+            lines.append(
+                f"  {name:>8}: mean {summary['mean'] * 1000:.3f}ms, "
+                f"p99 {summary['p99'] * 1000:.3f}ms, max {summary['max'] * 1000:.3f}ms"
+            )
+        return "\n".join(lines)
+
+    def dump(self, filename):
+        # Stats and raw samples of the rolling windows, as json
+        samples = {
+            name: self._timings(name).values().tolist()
+            for name in ["period", "jitter"] + list(self.phases.keys())
+        }
+        with open(filename, "w") as f:
+            json.dump({"stats": self.stats(), "samples": samples}, f)
@@ -0,0 +1,375 @@
+import json
+import os
+import struct
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+# Binary motion clip file layout:
+#   MAGIC | header length (uint32, little endian) | json header | padding | frames
+# Frames are a (nb_frames, nb_values) array of fixed dtype, stored row after row
+# right after the header, so that the file can be appended to while recording and
+# memory mapped when reading. The number of frames is deduced from the file size.
+MAGIC = b"MCLIP001"
+ALIGNMENT = 64
+
+DEFAULT_METADATA = {
+    "LoopMode": "Wrap",
+    "FrameDuration": np.around(1 / 60, 4),
+    "EnableCycleOffsetPosition": True,
+    "EnableCycleOffsetRotation": False,
+    "MotionWeight": 1,
+}
+
+# Columns going into the "Debug_info" of the json layout instead of the "Frames"
+DEBUG_COLUMNS = ["left_foot_pose", "right_foot_pose"]
+
+
+def isaac_columns(nb_joints=15):
+    # [root position, root orientation, joint poses (e.g. rotations)]
+    return [("root_pos", 3), ("root_quat", 4), ("joints", nb_joints)]
+
+
+def hardware_columns(nb_joints=15):
+    # [root position, root orientation, joint poses (e.g. rotations), target toe
+    # positions, linear velocity, angular velocity, joint velocities, target toe
+    # velocities]
+    return isaac_columns(nb_joints) + [
+        ("left_toe_pos", 3),
+        ("right_toe_pos", 3),
+        ("world_linear_vel", 3),
+        ("world_angular_vel", 3),
+        ("joints_vel", nb_joints),
+        ("left_toe_vel", 3),
+        ("right_toe_vel", 3),
+    ]
+
+
+def debug_columns():
+    return [(name, 16) for name in DEBUG_COLUMNS]
+
+
+def columns_slices(columns):
+    slices = {}
+    start = 0
+    for name, size in columns:
+        slices[name] = slice(start, start + size)
+        start += size
+    return slices
+
+
+class MotionClipWriter:
+    # Streams frames to a binary motion clip file, see MotionClip for reading
+    def __init__(
+        self,
+        filename,
+        columns,
+        metadata=DEFAULT_METADATA,
+        info={},
+        dtype="float32",
+        flush_every=60,
+    ):
+        self.filename = filename
+        self.columns = [(name, int(size)) for name, size in columns]
+        self.slices = columns_slices(self.columns)
+        self.nb_values = sum(size for _, size in self.columns)
+        self.dtype = np.dtype(dtype)
+        self.flush_every = flush_every
+        self.nb_frames = 0
+
+        header = json.dumps(
+            {
+                "columns": self.columns,
+                "dtype": self.dtype.str,
+                "metadata": dict(metadata),
+                "info": dict(info),
+            }
+        ).encode()
+        prefix_length = len(MAGIC) + 4
+        padding = -(prefix_length + len(header)) % ALIGNMENT
+
+        self.f = open(filename, "wb")
+        self.f.write(MAGIC)
+        self.f.write(struct.pack("<I", len(header) + padding))
+        self.f.write(header + b" " * padding)
+        self.frame = np.zeros(self.nb_values, dtype=self.dtype)
+
+    def append(self, frame=None, **fields):
+        # Either a full frame, or its columns as keyword arguments
+        if frame is not None:
+            self.frame[:] = frame
+        else:
+            for name, value in fields.items():
+                self.frame[self.slices[name]] = np.ravel(value)
+        self.f.write(self.frame.tobytes())
+        self.nb_frames += 1
+        if self.flush_every is not None and self.nb_frames % self.flush_every == 0:
+            self.f.flush()
+
+    def append_many(self, frames):
+        frames = np.asarray(frames, dtype=self.dtype).reshape(-1, self.nb_values)
+        self.f.write(frames.tobytes())
+        self.nb_frames += len(frames)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MotionClip:
+    # Memory mapped motion clip. Frames are only read from disk when accessed.
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise Exception(f"{filename} is not a motion clip file")
+            (header_length,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_length))
+
+        self.columns = [(name, size) for name, size in header["columns"]]
+        self.slices = columns_slices(self.columns)
+        self.metadata = header["metadata"]
+        self.info = header["info"]
+        self.dtype = np.dtype(header["dtype"])
+        self.nb_values = sum(size for _, size in self.columns)
+
+        self.data_offset = len(MAGIC) + 4 + header_length
+        frame_size = self.nb_values * self.dtype.itemsize
+        # A partially written last frame (interrupted recording) is ignored
+        nb_frames = (os.path.getsize(filename) - self.data_offset) // frame_size
+        if nb_frames > 0:
+            self.frames = np.memmap(
+                filename,
+                dtype=self.dtype,
+                mode="r",
+                offset=self.data_offset,
+                shape=(nb_frames, self.nb_values),
+            )
+        else:
+            self.frames = np.zeros((0, self.nb_values), dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, name):
+        return self.frames[:, self.slices[name]]
+
+    def __contains__(self, name):
+        return name in self.slices
+
+    @property
+    def frame_duration(self):
+        return self.metadata["FrameDuration"]
+
+    def to_json_dict(self, frames=None):
+        # Same layout as the json clips written by placo_record_amp. frames can be
+        # given to export modified frames (e.g. rotated) with this clip's layout
+        if frames is None:
+            frames = self.frames
+        frames_columns = [
+            self.slices[name] for name, _ in self.columns if name not in DEBUG_COLUMNS
+        ]
+
+        episode = dict(self.metadata)
+        if all(name in self for name in DEBUG_COLUMNS):
+            episode["Debug_info"] = [
+                {name: frame[self.slices[name]].tolist() for name in DEBUG_COLUMNS}
+                for frame in frames
+            ]
+        episode["Frames"] = np.concatenate(
+            [frames[:, s] for s in frames_columns], axis=1
+        ).tolist()
+        return episode
+
+    def export_json(self, filename, frames=None):
+        with open(filename, "w") as f:
+            json.dump(self.to_json_dict(frames), f)
+
+
+def rotate_yaw(clip, yaw, frames=None):
+    # Returns a copy of the clip frames rotated by yaw (radians) around the world z
+    # axis at the origin. Root position, root orientation and world linear velocity
+    # are rotated, the other columns being expressed in the body frame or invariant
+    # (the yaw rate of the "xyz" euler angles is unchanged).
+    if frames is None:
+        frames = np.array(clip.frames)
+    rot = R.from_euler("z", yaw)
+
+    root_pos = clip.slices["root_pos"]
+    root_quat = clip.slices["root_quat"]
+    frames[:, root_pos] = rot.apply(frames[:, root_pos])
+    frames[:, root_quat] = (rot * R.from_quat(frames[:, root_quat])).as_quat()
+    if "world_linear_vel" in clip:
+        world_linear_vel = clip.slices["world_linear_vel"]
+        frames[:, world_linear_vel] = rot.apply(frames[:, world_linear_vel])
+    for name in DEBUG_COLUMNS:
+        if name in clip:
+            poses = frames[:, clip.slices[name]].reshape(-1, 4, 4)
+            poses[:, :3, :] = np.einsum("ij,njk->nik", rot.as_matrix(), poses[:, :3, :])
+            frames[:, clip.slices[name]] = poses.reshape(-1, 16)
+    return frames
+
+
+class MotionClipLoader:
+    # Loads motion clips and augments them with yaw rotations on the fly, instead of
+    # storing rotated copies on disk. Recently rotated clips are kept in a LRU cache.
+    def __init__(self, cache_size=32, yaw_decimals=4):
+        self.cache_size = cache_size
+        self.yaw_decimals = yaw_decimals
+        self.clips = {}
+        self.cache = OrderedDict()
+
+    def get_clip(self, filename):
+        if filename not in self.clips:
+            self.clips[filename] = MotionClip(filename)
+        return self.clips[filename]
+
+    def get(self, filename, yaw=0.0):
+        # Frames of the clip rotated by yaw (radians)
+        yaw = round(float(yaw), self.yaw_decimals)
+        key = (filename, yaw)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        clip = self.get_clip(filename)
+        if yaw == 0.0:
+            frames = np.array(clip.frames)
+        else:
+            frames = rotate_yaw(clip, yaw)
+        self.cache[key] = frames
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return frames
+
+    def sample(self, filename, yaws=None, rng=np.random):
+        # Frames rotated by a random yaw, drawn in yaws if given, uniformly otherwise
+        if yaws is None:
+            yaw = rng.uniform(-np.pi, np.pi)
+        else:
+            yaw = rng.choice(yaws)
+        return yaw, self.get(filename, yaw)
+
+
+def json_to_clip(json_filename, clip_filename, columns, dtype="float32"):
+    # Converts a json clip to the binary format. columns describe the json frames
+    # content (isaac_columns() or hardware_columns()), debug columns are added when
+    # the json clip has Debug_info.
+    with open(json_filename, "r") as f:
+        episode = json.load(f)
+
+    frames = np.array(episode.pop("Frames"), dtype=np.float64)
+    debug = episode.pop("Debug_info", [])
+    if len(debug) > 0:
+        columns = columns + debug_columns()
+        frames = np.concatenate(
+            [frames] + [np.array([d[name] for d in debug]) for name in DEBUG_COLUMNS],
+            axis=1,
+        )
+
+    with MotionClipWriter(clip_filename, columns, episode, dtype=dtype) as writer:
+        writer.append_many(frames)
+
+
+def finite_difference(values, dt, scheme="backward"):
+    # Time derivative along the first axis. "backward" is (x[i] - x[i - 1]) / dt,
+    # the first frame getting the second one's value, "central" uses np.gradient
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return np.zeros_like(values)
+
+    if scheme == "backward":
+        derivative = np.empty_like(values)
+        derivative[1:] = np.diff(values, axis=0) / dt
+        derivative[0] = derivative[1]
+        return derivative
+    elif scheme == "central":
+        return np.gradient(values, dt, axis=0)
+    else:
+        raise Exception(f"Unknown finite difference scheme {scheme}")
+
+
+def derive_velocities(
+    root_pos,
+    root_quat,
+    joints,
+    left_foot_pose,
+    right_foot_pose,
+    dt,
+    scheme="backward",
+):
+    # Derives the AMP for hardware columns from the raw recorded state of a whole
+    # clip at once.
+    # root_quat are scipy (x, y, z, w) quaternions and foot poses are (N, 4, 4) world
+    # frames. The angular velocity is the derivative of the "xyz" euler angles,
+    # unwrapped so that crossing +-pi does not produce spikes.
+    root_pos = np.asarray(root_pos, dtype=np.float64)
+    rot_mat = R.from_quat(root_quat).as_matrix()  # (N, 3, 3) world -> body
+    left_foot_pose = np.asarray(left_foot_pose, dtype=np.float64).reshape(-1, 4, 4)
+    right_foot_pose = np.asarray(right_foot_pose, dtype=np.float64).reshape(-1, 4, 4)
+
+    # Toe positions in the body frame, R^T (p_foot - p_root)
+    left_toe_pos = np.einsum("nji,nj->ni", rot_mat, left_foot_pose[:, :3, 3] - root_pos)
+    right_toe_pos = np.einsum(
+        "nji,nj->ni", rot_mat, right_foot_pose[:, :3, 3] - root_pos
+    )
+
+    euler = np.unwrap(R.from_quat(root_quat).as_euler("xyz"), axis=0)
+
+    world_linear_vel = finite_difference(root_pos, dt, scheme)
+    world_angular_vel = finite_difference(euler, dt, scheme)
+
+    return {
+        "left_toe_pos": left_toe_pos,
+        "right_toe_pos": right_toe_pos,
+        "world_linear_vel": world_linear_vel,
+        "world_angular_vel": world_angular_vel,
+        "body_linear_vel": np.einsum("nji,nj->ni", rot_mat, world_linear_vel),
+        "body_angular_vel": np.einsum("nji,nj->ni", rot_mat, world_angular_vel),
+        "joints_vel": finite_difference(joints, dt, scheme),
+        "left_toe_vel": finite_difference(left_toe_pos, dt, scheme),
+        "right_toe_vel": finite_difference(right_toe_pos, dt, scheme),
+    }
+
+
+def derive_clip(
+    raw_clip,
+    filename,
+    columns,
+    dt=None,
+    scheme="backward",
+    skip=0,
+    dtype="float32",
+    info=None,
+):
+    # Writes a clip with the given columns from a raw clip holding the isaac columns
+    # and the debug columns, derived values being computed with derive_velocities.
+    # The first skip frames are dropped. info entries are added to the raw clip ones.
+    if dt is None:
+        dt = raw_clip.frame_duration
+
+    derived = derive_velocities(
+        raw_clip["root_pos"],
+        raw_clip["root_quat"],
+        raw_clip["joints"],
+        raw_clip["left_foot_pose"],
+        raw_clip["right_foot_pose"],
+        dt,
+        scheme,
+    )
+    frames = np.concatenate(
+        [raw_clip[name] if name in raw_clip else derived[name] for name, _ in columns],
+        axis=1,
+    )[skip:]
+
+    info = dict(raw_clip.info, **({} if info is None else info))
+    with MotionClipWriter(
+        filename, columns, raw_clip.metadata, info, dtype=dtype
+    ) as writer:
+        writer.append_many(frames)
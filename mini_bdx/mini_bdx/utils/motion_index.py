@@ -0,0 +1,205 @@
+import glob
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.spatial.transform import Rotation as R
+
+from mini_bdx.utils.motion_clip import (
+    DEBUG_COLUMNS,
+    MotionClip,
+    columns_slices,
+    rotate_yaw,
+)
+
+COMMAND_KEYS = ["dx", "dy", "dtheta"]
+# Walk engine timing of the frames, written by placo_record_amp
+GAIT_KEYS = ["period", "start_t", "frame_interval"]
+
+
+class MotionClipIndex:
+    # Persistent index of a motion clip library by walk command (dx, dy, dtheta).
+    # Each entry stores the clip file (relative to the index directory), its command,
+    # the offset of the frames in the file and the number of frames, so that frames
+    # can be memory mapped without parsing the clip headers.
+    # Frames are looked up by gait phase, (t % period) / period for the walk engine
+    # time t, in the last complete gait cycle of the clip (the steady walk, after the
+    # standing warmup and the first steps).
+    def __init__(self, root_dir, entries, columns, dtype):
+        self.root_dir = root_dir
+        self.entries = entries
+        self.columns = [(name, size) for name, size in columns]
+        self.slices = columns_slices(self.columns)
+        self.nb_values = sum(size for _, size in self.columns)
+        self.dtype = np.dtype(dtype)
+
+        self.commands = np.array(
+            [[entry[key] for key in COMMAND_KEYS] for entry in entries],
+            dtype=np.float64,
+        ).reshape(-1, len(COMMAND_KEYS))
+
+        # Each command axis is normalized by its range in the library
+        self.scale = np.ptp(self.commands, axis=0) if len(entries) > 0 else 1.0
+        self.scale = np.where(self.scale > 0, self.scale, 1.0)
+        self.tree = cKDTree(self.commands / self.scale)
+
+        self._frames = {}
+        self._anchors = {}
+
+    @classmethod
+    def build(cls, root_dir):
+        # Indexes all the .clip files of root_dir having a command in their info
+        entries = []
+        columns = None
+        dtype = None
+        for filename in sorted(glob.glob(os.path.join(root_dir, "*.clip"))):
+            clip = MotionClip(filename)
+            if not all(key in clip.info for key in COMMAND_KEYS):
+                print("Skipping", filename, "(no command info)")
+                continue
+            if not all(key in clip.info for key in GAIT_KEYS):
+                print("Skipping", filename, "(no gait timing info)")
+                continue
+
+            if columns is None:
+                columns = clip.columns
+                dtype = clip.dtype
+            elif clip.columns != columns or clip.dtype != dtype:
+                raise Exception(f"{filename} layout differs from the other clips")
+
+            entry = {key: clip.info[key] for key in COMMAND_KEYS}
+            entry["file"] = os.path.relpath(filename, root_dir)
+            entry["offset"] = clip.data_offset
+            entry["nb_frames"] = len(clip)
+            entry["frame_duration"] = clip.frame_duration
+            entry.update({key: clip.info[key] for key in GAIT_KEYS})
+            entry["cycle_start"] = cls.cycle_start(entry)
+            entries.append(entry)
+
+        if columns is None:
+            raise Exception(f"No indexable clip in {root_dir}")
+
+        return cls(root_dir, entries, columns, dtype)
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(
+                {
+                    "columns": self.columns,
+                    "dtype": self.dtype.str,
+                    "clips": self.entries,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "r") as f:
+            data = json.load(f)
+        return cls(
+            os.path.dirname(os.path.abspath(filename)),
+            data["clips"],
+            data["columns"],
+            data["dtype"],
+        )
+
+    @staticmethod
+    def cycle_start(entry):
+        # Walk engine time at which the last complete gait cycle of the clip starts
+        period = entry["period"]
+        end_t = entry["start_t"] + (entry["nb_frames"] - 1) * entry["frame_interval"]
+        cycle_start = (np.floor(end_t / period) - 1) * period
+        if cycle_start < entry["start_t"]:
+            raise Exception(f"{entry['file']} holds no complete gait cycle")
+        return float(cycle_start)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.slices
+
+    def get_frames(self, i):
+        if i not in self._frames:
+            entry = self.entries[i]
+            self._frames[i] = np.memmap(
+                os.path.join(self.root_dir, entry["file"]),
+                dtype=self.dtype,
+                mode="r",
+                offset=entry["offset"],
+                shape=(entry["nb_frames"], self.nb_values),
+            )
+        return self._frames[i]
+
+    def query(self, dx, dy, dtheta, k=1):
+        # Returns the distances (in normalized command space) and the indices of the k
+        # nearest clips
+        k = min(k, len(self))
+        distances, indices = self.tree.query(
+            np.array([dx, dy, dtheta]) / self.scale, k=k
+        )
+        return np.atleast_1d(distances), np.atleast_1d(indices)
+
+    def _interpolate(self, i, t):
+        # Frame of clip i at walk engine time t, interpolated between the two
+        # neighbouring frames
+        entry = self.entries[i]
+        frames = self.get_frames(i)
+        index = (t - entry["start_t"]) / entry["frame_interval"]
+        index = min(max(index, 0.0), len(frames) - 1)
+        j = int(index)
+        alpha = index - j
+        frame = (1 - alpha) * frames[j] + alpha * frames[min(j + 1, len(frames) - 1)]
+        return self._normalize_quat(frame)
+
+    def get_anchor(self, i):
+        # Root heading frame (x, y, yaw) at the start of the gait cycle of clip i
+        if i not in self._anchors:
+            frame = self._interpolate(i, self.entries[i]["cycle_start"])
+            yaw = R.from_quat(frame[self.slices["root_quat"]]).as_euler("xyz")[2]
+            x, y = frame[self.slices["root_pos"]][:2]
+            self._anchors[i] = (x, y, yaw)
+        return self._anchors[i]
+
+    def get_frame(self, i, phase):
+        # Frame of clip i at gait phase in [0, 1), its root (and the other world
+        # columns) being expressed in the root heading frame of the cycle start, so
+        # that clips of different commands can be blended
+        entry = self.entries[i]
+        t = entry["cycle_start"] + (phase % 1.0) * entry["period"]
+        frame = self._interpolate(i, t)[None]
+
+        x, y, yaw = self.get_anchor(i)
+        frame[:, self.slices["root_pos"]][:, :2] -= (x, y)
+        for name in DEBUG_COLUMNS:
+            if name in self:
+                frame[:, self.slices[name]][:, [3, 7]] -= (x, y)
+        return self._normalize_quat(rotate_yaw(self, -yaw, frame)[0])
+
+    def get_reference(self, dx, dy, dtheta, phase, k=4):
+        # Reference frame for an arbitrary command at a gait phase, blending the k
+        # nearest clips with inverse distance weights. The root is relative to the
+        # cycle start, see get_frame()
+        distances, indices = self.query(dx, dy, dtheta, k)
+        if distances[0] < 1e-9:
+            return self.get_frame(indices[0], phase)
+
+        weights = 1.0 / distances
+        weights /= np.sum(weights)
+        frames = np.array([self.get_frame(i, phase) for i in indices])
+
+        # Quaternions q and -q are the same rotation, they are aligned before blending
+        root_quat = self.slices["root_quat"]
+        signs = np.sign(frames[:, root_quat] @ frames[0, root_quat])
+        frames[:, root_quat] *= np.where(signs < 0, -1.0, 1.0)[:, None]
+
+        return self._normalize_quat(weights @ frames)
+
+    def _normalize_quat(self, frame):
+        frame = np.array(frame, dtype=np.float64)
+        root_quat = self.slices["root_quat"]
+        norm = np.linalg.norm(frame[root_quat])
+        if norm > 0:
+            frame[root_quat] /= norm
+        return frame
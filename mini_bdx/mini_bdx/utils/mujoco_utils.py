@@ -1,6 +1,14 @@
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+
 import mujoco
 import numpy as np
 
+MODEL_CACHE_DIR = os.environ.get(
+    "MINI_BDX_MODEL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "mini_bdx")
+)
+
 
 def check_contact(data, model, body1_name, body2_name):
     body1_id = data.body(body1_name).id
@@ -56,6 +64,60 @@ def get_contact_force(data, model, body1_name, body2_name):
     return force
 
 
+class ContactIndex:
+    # Answers contact queries for a fixed set of body pairs.
+    # Call update() once after each simulation step, then query contact() and
+    # force() as many times as needed.
+    def __init__(self, model, body_pairs):
+        self.model = model
+        self.body_pairs = [tuple(pair) for pair in body_pairs]
+        self.geom_bodyid = np.array(model.geom_bodyid)
+
+        # Symmetric (body, body) -> pair index lookup, -1 for untracked pairs
+        self.pair_lookup = -np.ones((model.nbody, model.nbody), dtype=np.int64)
+        self.pair_ids = {}
+        for i, (body1_name, body2_name) in enumerate(self.body_pairs):
+            body1_id = self._body_id(body1_name)
+            body2_id = self._body_id(body2_name)
+            self.pair_lookup[body1_id, body2_id] = i
+            self.pair_lookup[body2_id, body1_id] = i
+            self.pair_ids[(body1_name, body2_name)] = i
+            self.pair_ids[(body2_name, body1_name)] = i
+
+        self.contacts = np.zeros(len(self.body_pairs), dtype=bool)
+        self.forces = np.zeros(len(self.body_pairs))
+        self._c_array = np.zeros(6, dtype=np.float64)
+
+    def _body_id(self, name):
+        # mj_name2id() returns -1 for unknown names, which would index the last body
+        body_id = mujoco.mj_name2id(self.model, mujoco.mjtObj.mjOBJ_BODY, name)
+        if body_id < 0:
+            raise ValueError(f"Unknown body {name}")
+        return body_id
+
+    def update(self, data, compute_forces=True):
+        ncon = data.ncon
+        body1 = self.geom_bodyid[data.contact.geom1[:ncon]]
+        body2 = self.geom_bodyid[data.contact.geom2[:ncon]]
+        pairs = self.pair_lookup[body1, body2]
+
+        matched = np.flatnonzero(pairs >= 0)
+        self.contacts[:] = False
+        self.contacts[pairs[matched]] = True
+
+        self.forces[:] = 0
+        if compute_forces:
+            for i in matched:
+                mujoco.mj_contactForce(self.model, data, i, self._c_array)
+                self.forces[pairs[i]] += np.linalg.norm(self._c_array)
+
+    def contact(self, body1_name, body2_name):
+        return self.contacts[self.pair_ids[(body1_name, body2_name)]]
+
+    def force(self, body1_name, body2_name):
+        return self.forces[self.pair_ids[(body1_name, body2_name)]]
+
+
 def get_actuator_name(model, index: int) -> str:
     return mujoco.mj_id2name(model, mujoco.mjtObj.mjOBJ_ACTUATOR, index)
 
@@ -68,3 +130,88 @@ def list_actuators(model):
     for i in range(20):
         name = get_actuator_name(model, i)
         print(i, name)
+
+
+def model_source_files(xml_path):
+    # Files a MuJoCo model is compiled from: the xml files (following includes) and
+    # the assets they reference (meshes, textures, height fields, skins)
+    root_dir = os.path.dirname(os.path.abspath(xml_path))
+    asset_dirs = {"mesh": root_dir, "texture": root_dir, "hfield": root_dir}
+    xml_files = []
+    assets = []
+
+    todo = [os.path.abspath(xml_path)]
+    while len(todo) > 0:
+        path = todo.pop(0)
+        xml_files.append(path)
+        for element in ET.parse(path).iter():
+            if element.tag == "include":
+                todo.append(os.path.join(root_dir, element.get("file")))
+            elif element.tag == "compiler":
+                if element.get("assetdir") is not None:
+                    for kind in asset_dirs:
+                        asset_dirs[kind] = os.path.join(
+                            root_dir, element.get("assetdir")
+                        )
+                for kind in ["mesh", "texture"]:
+                    if element.get(kind + "dir") is not None:
+                        asset_dirs[kind] = os.path.join(
+                            root_dir, element.get(kind + "dir")
+                        )
+            elif element.tag in ["mesh", "texture", "hfield", "skin"]:
+                # Cube textures can have one file per face (fileright, ...)
+                for attribute, value in element.attrib.items():
+                    if attribute.startswith("file"):
+                        assets.append((element.tag, value))
+
+    # Asset directories apply whatever the position of the compiler element
+    files = list(xml_files)
+    for kind, filename in assets:
+        files.append(os.path.join(asset_dirs.get(kind, root_dir), filename))
+    return files
+
+
+def model_hash(xml_path):
+    # Content hash of the model sources, and of the MuJoCo version since compiled
+    # models are not portable across versions
+    h = hashlib.sha256(mujoco.__version__.encode())
+    root_dir = os.path.dirname(os.path.abspath(xml_path))
+    for path in model_source_files(xml_path):
+        h.update(os.path.relpath(path, root_dir).encode())
+        # Missing files are left for the MuJoCo compiler to report
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def load_model(xml_path, cache_dir=MODEL_CACHE_DIR):
+    # Same as mujoco.MjModel.from_xml_path(), compiling the model once to a binary
+    # .mjb in cache_dir. The cache is keyed by model_hash(), so that any change
+    # of the xml or asset files triggers a new compilation
+    if cache_dir is None:
+        return mujoco.MjModel.from_xml_path(xml_path)
+
+    name, _ = os.path.splitext(os.path.basename(xml_path))
+    mjb_path = os.path.join(cache_dir, f"{name}_{model_hash(xml_path)[:16]}.mjb")
+    if os.path.exists(mjb_path):
+        return mujoco.MjModel.from_binary_path(mjb_path)
+
+    model = mujoco.MjModel.from_xml_path(xml_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written to a temporary file first, parallel workers may compile concurrently
+    tmp_path = f"{mjb_path}.{os.getpid()}.tmp"
+    mujoco.mj_saveModel(model, tmp_path, None)
+    os.replace(tmp_path, mjb_path)
+    return model
+
+
+class CachedModelMixin:
+    # To be listed before gymnasium's MujocoEnv in the bases of an env, loads the
+    # model through load_model()
+    def _initialize_simulation(self):
+        model = load_model(self.fullpath)
+        model.vis.global_.offwidth = max(model.vis.global_.offwidth, self.width)
+        model.vis.global_.offheight = max(model.vis.global_.offheight, self.height)
+        data = mujoco.MjData(model)
+        return model, data
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class ObservationLayout:
+    # Named observation fields, packed in a single preallocated buffer.
+    # Fields are written in place (obs["name"] = values, or set_history()), only
+    # get() copies the buffer.
+    def __init__(self, fields, dtype=np.float64):
+        self.fields = [(name, int(size)) for name, size in fields]
+        self.size = sum(size for _, size in self.fields)
+        self.buffer = np.zeros(self.size, dtype=dtype)
+
+        self.slices = {}
+        start = 0
+        for name, size in self.fields:
+            self.slices[name] = slice(start, start + size)
+            start += size
+        self.views = {name: self.buffer[s] for name, s in self.slices.items()}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.views[name]
+
+    def __setitem__(self, name, values):
+        self.views[name][:] = values
+
+    def set_history(self, name, ring_buffer):
+        # Copies a RingBuffer (oldest to newest) in the field, flattened
+        ring_buffer.ordered(out=self.views[name].reshape(ring_buffer.buffer.shape))
+
+    def get(self, copy=True):
+        # Returned observations are kept by gymnasium and SB3 (e.g. as the terminal
+        # observation when auto resetting), the buffer is only returned as is if
+        # copy is False
+        return self.buffer.copy() if copy else self.buffer
+
+    def bounds(self, low={}, high={}):
+        # (low, high) arrays for a Box space, from per field bounds (scalars or
+        # arrays), unbounded for the fields not given
+        low_array = np.full(self.size, -np.inf)
+        high_array = np.full(self.size, np.inf)
+        for name, s in self.slices.items():
+            if name in low:
+                low_array[s] = low[name]
+            if name in high:
+                high_array[s] = high[name]
+        return low_array, high_array
+
+    def split(self, obs):
+        # Field name -> values of an observation (or of a batch of observations),
+        # for logging
+        return {name: obs[..., s] for name, s in self.slices.items()}
+
+    def to_dict(self):
+        # Field name -> [start, stop], to be stored along with exported policies
+        return {name: [s.start, s.stop] for name, s in self.slices.items()}
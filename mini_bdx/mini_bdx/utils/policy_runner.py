@@ -0,0 +1,133 @@
+import time
+
+import numpy as np
+
+from mini_bdx.utils.loop_scheduler import Timings
+
+
+class PolicyRunner:
+    # Runs an ONNX policy for one observation at a time, for control loops.
+    # Input and output are preallocated float32 buffers bound to the session once,
+    # so that an inference only copies the observation in and runs the graph.
+    # The session runs sequentially on num_threads threads (1 by default, to leave
+    # the other cores to the rest of the robot), with all graph optimizations.
+    # Inference durations of the last history calls are kept, see latency_stats().
+    # With batch_size > 1, infer_batch() runs batch_size observations at once.
+    def __init__(
+        self,
+        onnx_model_path,
+        input_name=None,
+        output_name=None,
+        num_threads=1,
+        warmup=10,
+        history=1000,
+        batch_size=1,
+    ):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        self.session = onnxruntime.InferenceSession(
+            onnx_model_path, options, providers=["CPUExecutionProvider"]
+        )
+
+        inputs = {i.name: i for i in self.session.get_inputs()}
+        outputs = {o.name: o for o in self.session.get_outputs()}
+        self.input_name = (
+            self.session.get_inputs()[0].name if input_name is None else input_name
+        )
+        self.output_name = (
+            self.session.get_outputs()[0].name if output_name is None else output_name
+        )
+        if self.input_name not in inputs:
+            raise Exception(f"No input {self.input_name} in {onnx_model_path}")
+        if self.output_name not in outputs:
+            raise Exception(f"No output {self.output_name} in {onnx_model_path}")
+
+        # The first dynamic dimension is the batch one, the others are set to 1
+        shape = [d if isinstance(d, int) else 1 for d in inputs[self.input_name].shape]
+        dynamic = [not isinstance(d, int) for d in inputs[self.input_name].shape]
+        if batch_size > 1:
+            if not dynamic[0]:
+                raise Exception(f"{onnx_model_path} has no dynamic batch dimension")
+            shape[0] = batch_size
+        self.batch_size = batch_size
+        self.input = np.zeros(shape, dtype=np.float32)
+        # Flat view of the input, for policies taking a single observation
+        self.obs = self.input.reshape(-1)
+
+        # The output shape can depend on the input one, it is given by a first run
+        output = self.session.run([self.output_name], {self.input_name: self.input})
+        self.output = np.zeros(output[0].shape, dtype=np.float32)
+        self.action = self.output.reshape(-1)
+
+        self.binding = self.session.io_binding()
+        self.input_value = onnxruntime.OrtValue.ortvalue_from_numpy(self.input)
+        self.output_value = onnxruntime.OrtValue.ortvalue_from_numpy(self.output)
+        self.binding.bind_ortvalue_input(self.input_name, self.input_value)
+        self.binding.bind_ortvalue_output(self.output_name, self.output_value)
+
+        self.latencies = Timings(history)
+        self.warmup(warmup)
+
+    def warmup(self, iterations):
+        # First runs are slower (allocations, caches), they are not timed
+        for _ in range(iterations):
+            self.session.run_with_iobinding(self.binding)
+
+    def infer(self, obs=None, pad=False):
+        # Copies obs in the input buffer and runs the policy. obs must fill the
+        # input, unless pad is set: the remaining entries are then zeros (e.g. the
+        # AWD policies extra inputs). Without obs, the input buffer is used as is.
+        # Returns the flattened output buffer, overwritten by the next call
+        if obs is not None:
+            self._check_size(len(obs), self.obs.size, pad)
+            self.obs[: len(obs)] = obs
+            if pad:
+                self.obs[len(obs) :] = 0
+
+        start = time.perf_counter()
+        self.session.run_with_iobinding(self.binding)
+        self.latencies.push(time.perf_counter() - start)
+
+        return self.action
+
+    def infer_batch(self, observations):
+        # Runs the policy on a (n, obs_size) array, n <= batch_size. Returns the
+        # first n rows of the output buffer, overwritten by the next call
+        n, obs_size = observations.shape
+        self._check_size(obs_size, self.input.shape[-1], False)
+        self.input[:n] = observations
+
+        start = time.perf_counter()
+        self.session.run_with_iobinding(self.binding)
+        self.latencies.push(time.perf_counter() - start)
+
+        return self.output[:n]
+
+    def _check_size(self, size, input_size, pad):
+        if size > input_size or (size < input_size and not pad):
+            raise Exception(
+                f"Observation of size {size} for a policy input of size {input_size}"
+            )
+
+    def latency_stats(self):
+        return self.latencies.summary()
+
+    def report(self, period=None):
+        # Inference latencies, and share of the control period if given
+        stats = self.latency_stats()
+        if stats["count"] == 0:
+            return "No inference"
+        line = (
+            f"{stats['count']} inferences: p50 {stats['p50'] * 1000:.3f}ms, "
+            f"p99 {stats['p99'] * 1000:.3f}ms, max {stats['max'] * 1000:.3f}ms"
+        )
+        if period is not None:
+            line += f" ({100 * stats['p99'] / period:.1f}% of the period at p99)"
+        return line
@@ -1,56 +1,68 @@
-import numpy as np
-
-
-class Point:
-    def __init__(self, position: float, value: float, delta: float):
-        self.position = position
-        self.value = value
-        self.delta = delta
-
-
-class Points:
-    def __init__(self):
-        self.points = []
-
-
-class Polynom:
-    def __init__(self, a: float, b: float, c: float, d: float):
-        self.a = a
-        self.b = b
-        self.c = c
-        self.d = d
-
+from bisect import bisect_left
 
-class Spline:
-    def __init__(self, poly: Polynom, min: float, max: float):
-        self.poly = poly
-        self.min = min
-        self.max = max
-
-
-class Splines:
-    def __init__(self):
-        self.splines = []
+import numpy as np
 
 
 class PolySpline:
     def __init__(self):
-        self._points = []
-        self._splines = []
+        # Control points
+        self._positions = []
+        self._values = []
+        self._deltas = []
+
+        # Segments bounds and cubic coefficients (a, b, c, d). Single lookups use
+        # these lists (bisect on the bounds), the numpy arrays used to evaluate
+        # many positions at once are built from them when needed
+        self._mins = []
+        self._maxs = []
+        self._coeffs = []
+        self._arrays = None
+
+    @classmethod
+    def from_points(cls, positions, values, deltas):
+        positions = np.asarray(positions, dtype=np.float64)
+        if np.any(np.diff(positions) <= 0):
+            raise Exception("Cubic spline positions must be strictly increasing")
+
+        positions, values, deltas = np.broadcast_arrays(positions, values, deltas)
+        poly_spline = cls()
+        poly_spline._positions = positions.astype(np.float64).tolist()
+        poly_spline._values = values.astype(np.float64).tolist()
+        poly_spline._deltas = deltas.astype(np.float64).tolist()
+        poly_spline.compute_splines()
+        return poly_spline
 
     def add_point(self, position: float, value: float, delta: float):
-        if len(self._points) > 0 and position <= self._points[-1].position:
+        if len(self._positions) > 0 and position <= self._positions[-1]:
             raise Exception(
                 "Trying to add a point in a cublic spline before a previous one"
             )
-        self._points.append(Point(position, value, delta))
+        position = float(position)
+        value = float(value)
+        delta = float(delta)
+
+        # Only the new trailing segment has to be fitted
+        if len(self._positions) > 0 and abs(self._positions[-1] - position) >= 0.00001:
+            self._mins.append(self._positions[-1])
+            self._maxs.append(position)
+            self._coeffs.append(
+                self.polynom_fit(self._values[-1], self._deltas[-1], value, delta)
+            )
+            self._arrays = None
 
-        self.compute_splines()
+        self._positions.append(position)
+        self._values.append(value)
+        self._deltas.append(delta)
 
     def copy(self):
         poly_spline = PolySpline()
-        for point in self._points:
-            poly_spline.add_point(point.position, point.value, point.delta)
+        poly_spline._positions = self._positions.copy()
+        poly_spline._values = self._values.copy()
+        poly_spline._deltas = self._deltas.copy()
+        poly_spline._mins = self._mins.copy()
+        poly_spline._maxs = self._maxs.copy()
+        poly_spline._coeffs = self._coeffs.copy()  # Tuples, shared safely
+        poly_spline._arrays = self._arrays
         return poly_spline
 
     def get(self, x: float):
@@ -59,6 +71,12 @@ class PolySpline:
     def get_vel(self, x: float):
         return self.interpolation(x, "speed")
 
+    def get_many(self, xs):
+        return self.interpolation_many(xs, "value")
+
+    def get_vel_many(self, xs):
+        return self.interpolation_many(xs, "speed")
+
     def get_mod(self, x: float):
         if x < 0.0:
             x = 1.0 + (x - ((int(x) / 1)))
@@ -67,37 +85,41 @@ class PolySpline:
         return self.get(x)
 
     def clear(self):
-        self._points = []
-        self._splines = []
+        self._positions = []
+        self._values = []
+        self._deltas = []
+        self._mins = []
+        self._maxs = []
+        self._coeffs = []
+        self._arrays = None
 
     def compute_splines(self):
-        self._splines = []
-        if len(self._points) < 2:
+        # Refits every segment at once from the control points
+        self._mins = []
+        self._maxs = []
+        self._coeffs = []
+        self._arrays = None
+        if len(self._positions) < 2:
             return
 
-        for i in range(1, len(self._points)):
-            if (
-                np.abs(self._points[i - 1].position - self._points[i].position)
-                < 0.00001
-            ):
-                continue
-            poly = self.polynom_fit(
-                self._points[i - 1].value,
-                self._points[i - 1].delta,
-                self._points[i].value,
-                self._points[i].delta,
-            )
-            spline = Spline(
-                poly, self._points[i - 1].position, self._points[i].position
-            )
-            self._splines.append(spline)
-
-    def polynom_fit(self, val1: float, delta1: float, val2: float, delta2: float):
+        positions = np.array(self._positions)
+        values = np.array(self._values)
+        deltas = np.array(self._deltas)
+        keep = np.abs(np.diff(positions)) >= 0.00001
+        a, b, c, d = self.polynom_fit(
+            values[:-1][keep], deltas[:-1][keep], values[1:][keep], deltas[1:][keep]
+        )
+        self._mins = positions[:-1][keep].tolist()
+        self._maxs = positions[1:][keep].tolist()
+        self._coeffs = list(zip(a.tolist(), b.tolist(), c.tolist(), d.tolist()))
+
+    def polynom_fit(self, val1, delta1, val2, delta2):
+        # Works on scalars as well as on arrays of segments
         a = 2.0 * val1 + delta1 + delta2 - 2.0 * val2
         b = 3.0 * val2 - 2.0 * delta1 - 3.0 * val1 - delta2
         c = delta1
         d = val1
-        return Polynom(a, b, c, d)
+        return a, b, c, d
 
     def interpolation(
         self, x: float, value_type="value"
@@ -105,35 +127,77 @@ class PolySpline:
         if value_type not in ["value", "speed"]:
             raise Exception("Invalid value_type")
 
-        if len(self._points) == 0:
+        if len(self._positions) == 0:
             return 0.0
-        elif len(self._points) == 1:
+        elif len(self._positions) == 1:
             if value_type == "value":
-                return self._points[0].value
+                return self._values[0]
             else:
-                return self._points[0].delta
-        else:
-            if x < self._splines[0].min:
-                x = self._splines[0].min
-            if x > self._splines[-1].max:
-                x = self._splines[-1].max
-
-            for i in range(len(self._splines)):
-                if x >= self._splines[i].min and x <= self._splines[i].max:
-                    xi = (x - self._splines[i].min) / (
-                        self._splines[i].max - self._splines[i].min
-                    )
-                    if value_type == "value":
-                        return self.polynom_value(xi, self._splines[i].poly)
-                    elif value_type == "speed":
-                        return self.polynom_diff(xi, self._splines[i].poly)
+                return self._deltas[0]
+        elif len(self._mins) == 0:
             return 0.0
 
-    def polynom_value(self, t: float, p: Polynom):
-        return p.d + t * (t * (p.a * t + p.b) + p.c)
+        if x < self._mins[0]:
+            x = self._mins[0]
+        if x > self._maxs[-1]:
+            x = self._maxs[-1]
+
+        # First segment whose upper bound is >= x
+        i = bisect_left(self._maxs, x)
+        if x < self._mins[i]:
+            return 0.0
+
+        t = (x - self._mins[i]) / (self._maxs[i] - self._mins[i])
+        if value_type == "value":
+            return self.polynom_value(t, self._coeffs[i])
+        else:
+            return self.polynom_diff(t, self._coeffs[i])
+
+    def _segment_arrays(self):
+        if self._arrays is None:
+            self._arrays = (
+                np.array(self._mins),
+                np.array(self._maxs),
+                np.array(self._coeffs).reshape(-1, 4),
+            )
+        return self._arrays
+
+    def interpolation_many(self, xs, value_type="value"):
+        if value_type not in ["value", "speed"]:
+            raise Exception("Invalid value_type")
+
+        xs = np.asarray(xs, dtype=np.float64)
+        if len(self._positions) == 0:
+            return np.zeros_like(xs)
+        elif len(self._positions) == 1:
+            if value_type == "value":
+                return np.full_like(xs, self._values[0])
+            else:
+                return np.full_like(xs, self._deltas[0])
+        elif len(self._mins) == 0:
+            return np.zeros_like(xs)
+
+        segment_mins, segment_maxs, segment_coeffs = self._segment_arrays()
+        xs = np.clip(xs, segment_mins[0], segment_maxs[-1])
+        idx = np.searchsorted(segment_maxs, xs, side="left")
+        mins = segment_mins[idx]
+        t = (xs - mins) / (segment_maxs[idx] - mins)
+        coeffs = np.moveaxis(segment_coeffs[idx], -1, 0)
+        if value_type == "value":
+            result = self.polynom_value(t, coeffs)
+        else:
+            result = self.polynom_diff(t, coeffs)
+
+        # Points falling between two segments (skipped degenerated ones)
+        return np.where(xs < mins, 0.0, result)
+
+    def polynom_value(self, t, p):
+        a, b, c, d = p
+        return d + t * (t * (a * t + b) + c)
 
-    def polynom_diff(self, t: float, p: Polynom):
-        return t * (3 * p.a * t + 2 * p.b) + p.c
+    def polynom_diff(self, t, p):
+        a, b, c, d = p
+        return t * (3 * a * t + 2 * b) + c
 
 
 if __name__ == "__main__":
@@ -144,6 +208,6 @@ if __name__ == "__main__":
     import matplotlib.pyplot as plt
 
     x = np.linspace(-1, 3, 100)
-    y = [poly_spline.get(i) for i in x]
+    y = poly_spline.get_many(x)
     plt.plot(x, y)
     plt.show()
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class RingBuffer:
+    # Fixed depth history of arrays of the same shape, the oldest entry being
+    # overwritten by push(). Nothing is allocated after construction.
+    def __init__(self, depth, shape, dtype=np.float64, fill=0.0):
+        self.depth = depth
+        self.shape = (shape,) if np.isscalar(shape) else tuple(shape)
+        self.buffer = np.full((depth,) + self.shape, fill, dtype=dtype)
+        self.head = 0  # Index of the next write, i.e. of the oldest entry
+
+        # orders[head] lists the buffer rows from the oldest to the newest
+        self.orders = (np.arange(depth)[:, None] + np.arange(depth)) % depth
+
+        # Difference and filter weights, see _rolled()
+        self.weights = {}
+
+    def reset(self, fill=0.0):
+        self.buffer[:] = fill
+        self.head = 0
+
+    def push(self, values):
+        self.buffer[self.head] = values
+        self.head = (self.head + 1) % self.depth
+
+    def latest(self, k=0):
+        # k-th most recent entry (k=0 being the last one pushed)
+        return self.buffer[(self.head - 1 - k) % self.depth]
+
+    def ordered(self, out=None):
+        # Entries from the oldest to the newest, written to out if given
+        return np.take(self.buffer, self.orders[self.head], axis=0, out=out)
+
+    def _rolled(self, key, make_weights):
+        # make_weights() returns weights applying to the entries ordered from the
+        # oldest to the newest. They are rolled once per head position, to apply
+        # directly to the buffer rows
+        if key not in self.weights:
+            weights = make_weights()
+            self.weights[key] = [
+                np.roll(weights, head, axis=-1) for head in range(self.depth)
+            ]
+        return self.weights[key][self.head]
+
+    def differences(self, order=1, last=None):
+        # order-th finite differences between consecutive entries, from the oldest
+        # to the newest. Only the last ones are kept if last is given
+        nb = self.depth - order
+        if nb <= 0:
+            raise Exception(f"Differences of order {order} need a depth > {order}")
+        last = nb if last is None else min(last, nb)
+
+        weights = self._rolled(
+            ("diff", order, last),
+            lambda: np.diff(np.eye(self.depth), n=order, axis=0)[nb - last :],
+        )
+        return np.tensordot(weights, self.buffer, axes=1)
+
+    def squared_differences(self, order=1, last=None):
+        # Sum of the squared order-th differences, used as a smoothness penalty
+        return np.square(self.differences(order, last)).sum()
+
+    def fir(self, coefficients):
+        # Finite impulse response (low-pass) filter over the history,
+        # coefficients[k] applying to latest(k)
+        if len(coefficients) > self.depth:
+            raise Exception("More FIR coefficients than the history depth")
+
+        def make_weights():
+            weights = np.zeros(self.depth)
+            weights[self.depth - len(coefficients) :] = coefficients[::-1]
+            return weights
+
+        weights = self._rolled(("fir", tuple(coefficients)), make_weights)
+        return np.tensordot(weights, self.buffer, axes=1)
@@ -1,3 +1,5 @@
+import numpy as np
+
 # This is the joints order when loading using IsaacGymEnvs
 # ['left_hip_yaw', 'left_hip_roll', 'left_hip_pitch', 'left_knee', 'left_ankle', 'neck_pitch', 'head_pitch', 'head_yaw', 'left_antenna', 'right_antenna', 'right_hip_yaw', 'right_hip_roll', 'right_hip_pitch', 'right_knee', 'right_ankle']
 # This is the "standard" order (from mujoco)
@@ -43,77 +45,65 @@ isaac_joints_order = [
 ]
 
 
+class JointOrder:
+    # Permutation from one joints order to another, for instance
+    # JointOrder(mujoco_joints_order, isaac_joints_order).
+    # Works on single vectors as well as on (N, dof) batches (or memory mapped
+    # arrays), the joints being on the last axis.
+    def __init__(self, from_order, to_order):
+        self.from_order = list(from_order)
+        self.to_order = list(to_order)
+        missing = [joint for joint in self.to_order if joint not in self.from_order]
+        if len(missing) > 0:
+            raise ValueError(f"Unknown joints {missing}")
+
+        self.indices = np.array([self.from_order.index(joint) for joint in to_order])
+
+    @property
+    def inverse(self):
+        return JointOrder(self.to_order, self.from_order)
+
+    def __call__(self, joints, out=None):
+        return np.take(np.asarray(joints), self.indices, axis=-1, out=out)
+
+    def pack(self, joints_dict, out=None):
+        # {joint: value} -> array in to_order
+        if out is None:
+            out = np.zeros(len(self.to_order))
+        for i, joint in enumerate(self.to_order):
+            out[i] = joints_dict[joint]
+        return out
+
+    def unpack(self, joints, ignore=[]):
+        # Array in to_order -> {joint: value}, for instance for hwi.set_position_all()
+        return {
+            joint: value
+            for joint, value in zip(self.to_order, joints)
+            if joint not in ignore
+        }
+
+
+isaac_to_mujoco_order = JointOrder(isaac_joints_order, mujoco_joints_order)
+mujoco_to_isaac_order = isaac_to_mujoco_order.inverse
+
+
 def isaac_to_mujoco(joints):
-    new_joints = [
-        # right leg
-        joints[10],
-        joints[11],
-        joints[12],
-        joints[13],
-        joints[14],
-        # left leg
-        joints[0],
-        joints[1],
-        joints[2],
-        joints[3],
-        joints[4],
-        # head
-        joints[5],
-        joints[6],
-        joints[7],
-        joints[8],
-        joints[9],
-    ]
-
-    return new_joints
+    return isaac_to_mujoco_order(joints).tolist()
 
 
 def mujoco_to_isaac(joints):
-    new_joints = [
-        # left leg
-        joints[5],
-        joints[6],
-        joints[7],
-        joints[8],
-        joints[9],
-        # head
-        joints[10],
-        joints[11],
-        joints[12],
-        joints[13],
-        joints[14],
-        # right leg
-        joints[0],
-        joints[1],
-        joints[2],
-        joints[3],
-        joints[4],
-    ]
-    return new_joints
+    return mujoco_to_isaac_order(joints).tolist()
+
+
+# Right leg, head and left leg, from the mujoco order
+mujoco_to_test_order = JointOrder(
+    mujoco_joints_order,
+    mujoco_joints_order[:5] + mujoco_joints_order[10:] + mujoco_joints_order[5:10],
+)
 
 
 def test(joints):
-    new_joints = [
-        # right leg
-        joints[0],
-        joints[1],
-        joints[2],
-        joints[3],
-        joints[4],
-        # head
-        joints[10],
-        joints[11],
-        joints[12],
-        joints[13],
-        joints[14],
-        # left leg
-        joints[5],
-        joints[6],
-        joints[7],
-        joints[8],
-        joints[9],
-    ]
-    return new_joints
+    return mujoco_to_test_order(joints).tolist()
 
 
 def action_to_pd_targets(action, pd_action_offset, pd_action_scale):
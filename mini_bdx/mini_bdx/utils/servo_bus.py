@@ -0,0 +1,360 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from mini_bdx.utils.loop_scheduler import LoopScheduler
+
+# Feetech (SCS/STS) protocol
+BROADCAST_ID = 0xFE
+INST_SYNC_READ = 0x82
+INST_SYNC_WRITE = 0x83
+
+# STS3215 control table
+ADDR_TORQUE_ENABLE = 40
+ADDR_GOAL_POSITION = 42
+ADDR_PRESENT_POSITION = 56
+# From present position (56) to present current (69-70), read in one transaction
+PRESENT_LENGTH = 15
+# Offsets in the present block
+POSITION_OFFSET = 0
+SPEED_OFFSET = 2
+LOAD_OFFSET = 4
+CURRENT_OFFSET = 13
+
+STEPS_PER_RADIAN = 4096 / (2 * np.pi)
+CENTER_STEPS = 2048
+CURRENT_UNIT = 0.0065  # A
+LOAD_UNIT = 0.001  # Fraction of the max torque
+
+
+def checksum(body):
+    return (~sum(body)) & 0xFF
+
+
+def make_packet(id, instruction, params=b""):
+    body = bytes([id, len(params) + 2, instruction]) + bytes(params)
+    return b"\xff\xff" + body + bytes([checksum(body)])
+
+
+def sync_write_packet(ids, address, data):
+    # data holds one bytes object per id, all of the same length
+    params = bytearray([address, len(data[0])])
+    for id, values in zip(ids, data):
+        params.append(id)
+        params += values
+    return make_packet(BROADCAST_ID, INST_SYNC_WRITE, params)
+
+
+def sync_read_packet(ids, address, length):
+    params = bytes([address, length]) + bytes(ids)
+    return make_packet(BROADCAST_ID, INST_SYNC_READ, params)
+
+
+def read_status(serial, length, max_skip=64):
+    # Reads a status packet with length bytes of data, returns (id, error, data),
+    # or None on timeout or corrupted packet. Bytes before the 0xff 0xff header
+    # (e.g. the end of a corrupted packet) are skipped, up to max_skip
+    previous = None
+    for _ in range(max_skip + 2):
+        byte = serial.read(1)
+        if len(byte) == 0:
+            return None
+        if previous == 0xFF and byte[0] == 0xFF:
+            break
+        previous = byte[0]
+    else:
+        return None
+    header = serial.read(3)  # id length error
+    if len(header) < 3:
+        return None
+    # A third 0xff is the first byte of the header
+    while header[0] == 0xFF:
+        byte = serial.read(1)
+        if len(byte) == 0:
+            return None
+        header = header[1:] + byte
+    id, packet_length, error = header[0], header[1], header[2]
+    if packet_length != length + 2:
+        return None
+    tail = serial.read(length + 1)  # data and checksum
+    if len(tail) < length + 1 or checksum(header + tail[:-1]) != tail[-1]:
+        return None
+    return id, error, tail[:-1]
+
+
+def decode_signed(raw, sign_bit):
+    # Feetech registers are sign and magnitude, the sign bit depending on the
+    # register. Works on scalars and arrays
+    magnitude = raw & ((1 << sign_bit) - 1)
+    return np.where(raw & (1 << sign_bit), -magnitude, magnitude)
+
+
+def encode_signed(value, sign_bit):
+    return (-value) | (1 << sign_bit) if value < 0 else value
+
+
+def radians_to_steps(angle):
+    return int(np.clip(round(angle * STEPS_PER_RADIAN) + CENTER_STEPS, 0, 4095))
+
+
+class BusState:
+    # Last values read from the servos, in the order of the manager ids. valid
+    # tells which servos answered in the last cycle, the others keep the values of
+    # their last answer
+    def __init__(self, nb_servos):
+        self.position = np.zeros(nb_servos)  # rad
+        self.velocity = np.zeros(nb_servos)  # rad/s
+        self.current = np.zeros(nb_servos)  # A
+        self.load = np.zeros(nb_servos)  # Fraction of the max torque
+        self.valid = np.zeros(nb_servos, dtype=bool)
+        self.timestamp = 0.0
+        self.cycle = 0
+
+    def copy_to(self, out):
+        out.position[:] = self.position
+        out.velocity[:] = self.velocity
+        out.current[:] = self.current
+        out.load[:] = self.load
+        out.valid[:] = self.valid
+        out.timestamp = self.timestamp
+        out.cycle = self.cycle
+        return out
+
+
+class ServoBusManager:
+    # Owns a Feetech servo bus from a dedicated thread. Each cycle, the goal
+    # positions are sent with a single sync write, then position, velocity, load
+    # and current of all the servos are fetched with a single sync read.
+    # The control loop calls set_goals() and get_state(), which never wait for the
+    # bus: goals are picked up at the next cycle, and states are published in a
+    # double buffer. serial is any object with read(size) (returning less bytes on
+    # timeout) and write(data), e.g. a serial.Serial or a FakeFeetechBus. Its
+    # reset_input_buffer() is called before each sync read when it has one.
+    # Transaction durations are timed by the cycle scheduler, see stats().
+    def __init__(self, serial, ids, frequency=100, clock=None):
+        self.serial = serial
+        self.ids = list(ids)
+        self.index = {id: i for i, id in enumerate(self.ids)}
+        self.nb_servos = len(self.ids)
+        self.scheduler = LoopScheduler(frequency, clock=clock)
+
+        # Nothing is written until the first set_goals()
+        self.goals = None
+        self.writes = queue.SimpleQueue()
+
+        # The thread writes states[(seq + 1) % 2] then increments seq, so that
+        # states[seq % 2] is the last published state
+        self.states = [BusState(self.nb_servos), BusState(self.nb_servos)]
+        self.seq = 0
+        self.raw = np.zeros((self.nb_servos, PRESENT_LENGTH), dtype=np.int64)
+        self.answered = np.zeros(self.nb_servos, dtype=bool)
+        self.read_errors = np.zeros(self.nb_servos, dtype=np.int64)
+
+        self.running = False
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        self.running = True
+        self.scheduler.reset()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def set_goals(self, goals):
+        # Goal positions (rad), as a {id: angle} dict or an array in ids order
+        if isinstance(goals, dict):
+            if self.goals is None:
+                new_goals = np.zeros(self.nb_servos)
+            else:
+                new_goals = self.goals.copy()
+            for id, angle in goals.items():
+                new_goals[self.index[id]] = angle
+        else:
+            new_goals = np.array(goals, dtype=np.float64)
+        self.goals = new_goals
+
+    def write_register(self, address, values):
+        # Queues a sync write of {id: bytes} (all of the same length), sent before
+        # the goals of the next cycle
+        self.writes.put((address, values))
+
+    def enable_torque(self):
+        self.write_register(ADDR_TORQUE_ENABLE, {id: b"\x01" for id in self.ids})
+
+    def disable_torque(self):
+        self.write_register(ADDR_TORQUE_ENABLE, {id: b"\x00" for id in self.ids})
+
+    def get_state(self, out=None):
+        # Copy of the last published state (in out if given)
+        if self.error is not None:
+            raise self.error
+        if out is None:
+            out = BusState(self.nb_servos)
+        while True:
+            seq = self.seq
+            self.states[seq % 2].copy_to(out)
+            # Retried if a state was published during the copy, as the thread may
+            # have started writing the next one in this buffer
+            if self.seq == seq:
+                return out
+
+    def stats(self):
+        return {
+            "scheduler": self.scheduler.stats(),
+            "read_errors": dict(zip(self.ids, self.read_errors.tolist())),
+        }
+
+    def _run(self):
+        try:
+            while self.running:
+                self._cycle()
+                self.scheduler.wait()
+        except Exception as e:
+            self.error = e
+            self.running = False
+
+    def _cycle(self):
+        with self.scheduler.phase("sync_write"):
+            while not self.writes.empty():
+                address, values = self.writes.get()
+                ids = list(values.keys())
+                data = [values[id] for id in ids]
+                self.serial.write(sync_write_packet(ids, address, data))
+
+            goals = self.goals
+            if goals is not None:
+                data = []
+                for angle in goals:
+                    steps = radians_to_steps(angle)
+                    data.append(bytes([steps & 0xFF, steps >> 8]))
+                self.serial.write(sync_write_packet(self.ids, ADDR_GOAL_POSITION, data))
+
+        with self.scheduler.phase("sync_read"):
+            # Status bytes left by a previous cycle (late answers after a timeout)
+            # would be read as the answers of this one. Without reset_input_buffer(),
+            # read_status() still skips them up to the next status header
+            reset_input_buffer = getattr(self.serial, "reset_input_buffer", None)
+            if reset_input_buffer is not None:
+                reset_input_buffer()
+            self.serial.write(
+                sync_read_packet(self.ids, ADDR_PRESENT_POSITION, PRESENT_LENGTH)
+            )
+            self.answered[:] = False
+            for _ in range(self.nb_servos):
+                status = read_status(self.serial, PRESENT_LENGTH)
+                if status is None:
+                    # Timeout or corrupted packet, the next answers are dropped by
+                    # the input buffer reset of the next cycle
+                    break
+                id, _, data = status
+                if id in self.index:
+                    self.raw[self.index[id]] = list(data)
+                    self.answered[self.index[id]] = True
+            self.read_errors[~self.answered] += 1
+
+        self._publish()
+
+    def _publish(self):
+        def u16(offset):
+            return self.raw[:, offset] | (self.raw[:, offset + 1] << 8)
+
+        previous = self.states[self.seq % 2]
+        state = self.states[(self.seq + 1) % 2]
+        previous.copy_to(state)
+
+        a = self.answered
+        state.position[a] = (u16(POSITION_OFFSET)[a] - CENTER_STEPS) / STEPS_PER_RADIAN
+        state.velocity[a] = decode_signed(u16(SPEED_OFFSET), 15)[a] / STEPS_PER_RADIAN
+        state.load[a] = decode_signed(u16(LOAD_OFFSET), 10)[a] * LOAD_UNIT
+        state.current[a] = decode_signed(u16(CURRENT_OFFSET), 15)[a] * CURRENT_UNIT
+        state.valid[:] = a
+        state.timestamp = self.scheduler.clock.now()
+        state.cycle = previous.cycle + 1
+
+        self.seq += 1
+
+
+class FakeFeetechBus:
+    # Serial like loopback simulating Feetech servos, to run ServoBusManager
+    # without hardware. Sync writes update the servos registers, sync reads queue
+    # the servos status packets, to be read(). Present positions follow the goals
+    # with a first order response of time constant tau. With a baudrate, writes
+    # take the time of the transfer
+    def __init__(self, ids, tau=0.05, baudrate=None):
+        self.registers = {id: bytearray(256) for id in ids}
+        self.positions = {id: float(CENTER_STEPS) for id in ids}
+        self.tau = tau
+        self.baudrate = baudrate
+        self.rx = bytearray()
+        self.last_update = time.monotonic()
+        for id in ids:
+            self._set_u16(id, ADDR_GOAL_POSITION, CENTER_STEPS)
+            self._set_u16(id, ADDR_PRESENT_POSITION, CENTER_STEPS)
+
+    def _u16(self, id, address):
+        return self.registers[id][address] | (self.registers[id][address + 1] << 8)
+
+    def _set_u16(self, id, address, value):
+        self.registers[id][address] = value & 0xFF
+        self.registers[id][address + 1] = (value >> 8) & 0xFF
+
+    def _update(self):
+        now = time.monotonic()
+        dt = now - self.last_update
+        self.last_update = now
+        alpha = 1 - np.exp(-dt / self.tau) if dt > 0 else 0.0
+        for id, position in self.positions.items():
+            error = self._u16(id, ADDR_GOAL_POSITION) - position
+            if not self.registers[id][ADDR_TORQUE_ENABLE]:
+                error = 0.0
+            self.positions[id] = position + alpha * error
+            speed = int(round(alpha * error / dt)) if dt > 0 else 0
+            load = int(np.clip(round(error), -1000, 1000))
+            self._set_u16(id, ADDR_PRESENT_POSITION, int(round(self.positions[id])))
+            self._set_u16(id, ADDR_PRESENT_POSITION + 2, encode_signed(speed, 15))
+            self._set_u16(id, ADDR_PRESENT_POSITION + 4, encode_signed(load, 10))
+            self._set_u16(id, ADDR_PRESENT_POSITION + 13, abs(load) // 2)
+
+    def write(self, data):
+        if self.baudrate is not None:
+            time.sleep(len(data) * 10 / self.baudrate)
+
+        data = bytes(data)
+        nb_bytes = len(data)
+        while len(data) >= 6:
+            length = data[3]
+            packet, data = data[: length + 4], data[length + 4 :]
+            if checksum(packet[2:-1]) != packet[-1]:
+                continue
+            instruction, params = packet[4], packet[5:-1]
+            address, size = params[0], params[1]
+            if instruction == INST_SYNC_WRITE:
+                for i in range(2, len(params), size + 1):
+                    id = params[i]
+                    if id in self.registers:
+                        values = params[i + 1 : i + 1 + size]
+                        self.registers[id][address : address + size] = values
+            elif instruction == INST_SYNC_READ:
+                self._update()
+                for id in params[2:]:
+                    if id in self.registers:
+                        values = self.registers[id][address : address + size]
+                        body = bytes([id, size + 2, 0]) + bytes(values)
+                        self.rx += b"\xff\xff" + body + bytes([checksum(body)])
+        return nb_bytes
+
+    def read(self, size=1):
+        data = bytes(self.rx[:size])
+        del self.rx[:size]
+        return data
+
+    def reset_input_buffer(self):
+        self.rx.clear()
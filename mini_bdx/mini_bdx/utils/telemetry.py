@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b"MBDXTLM1"
+# Magic, then the json header length (uint32), the json header and padding up to
+# a multiple of HEADER_ALIGN, then the records
+HEADER_ALIGN = 64
+
+
+def record_dtype(obs_size, action_size, nb_joints, imu_size=6):
+    # Fixed telemetry record. imu is [gyro, accelerometer] by default
+    return np.dtype(
+        [
+            ("timestamp", np.float64),
+            ("obs", np.float32, (obs_size,)),
+            ("action", np.float32, (action_size,)),
+            ("commanded_position", np.float32, (nb_joints,)),
+            ("measured_position", np.float32, (nb_joints,)),
+            ("current", np.float32, (nb_joints,)),
+            ("imu", np.float32, (imu_size,)),
+        ]
+    )
+
+
+class TelemetryRecorder:
+    # Append only binary log of fixed size records, for real time loops.
+    # log() copies a record in a preallocated ring and returns, never waiting for
+    # the disk: a background thread appends the records to the file by chunks of
+    # chunk_records, or after flush_interval seconds, and flushes them. At most the
+    # records not yet written (one chunk, or flush_interval seconds) are lost on a
+    # crash. If the writer falls behind by more than capacity records, new records
+    # are dropped (and counted) rather than blocking.
+    # The ring is single producer single consumer: only the loop moves head, only
+    # the writer moves tail, so no lock is needed.
+    # Read the file back with read_telemetry().
+    def __init__(
+        self,
+        filename,
+        dtype,
+        metadata={},
+        chunk_records=256,
+        flush_interval=1.0,
+        capacity=8192,
+        fsync=False,
+    ):
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.chunk_records = chunk_records
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.fsync = fsync
+
+        self.ring = np.zeros(capacity, dtype=self.dtype)
+        self.head = 0  # Records logged
+        self.tail = 0  # Records written
+        self.dropped = 0
+
+        header = json.dumps(
+            {
+                "dtype": self.dtype.descr,
+                "chunk_records": chunk_records,
+                "metadata": metadata,
+            }
+        ).encode()
+        size = len(MAGIC) + 4 + len(header)
+        padding = -size % HEADER_ALIGN
+        self.file = open(filename, "wb")
+        self.file.write(MAGIC)
+        self.file.write(np.uint32(len(header) + padding).tobytes())
+        self.file.write(header + b" " * padding)
+        self.file.flush()
+
+        self.running = True
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def log(self, **fields):
+        # Fields missing are zeros, arrays shorter than their field fill its start
+        if self.head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+
+        record = self.ring[self.head % self.capacity]
+        record.fill(0)
+        for name, value in fields.items():
+            if record[name].ndim == 0:
+                record[name] = value
+            else:
+                record[name][: len(value)] = value
+        self.head += 1
+
+        if self.head - self.tail >= self.chunk_records:
+            self.wake.set()
+        return True
+
+    def _write(self, end):
+        # Writes the records from tail to end, the ring being contiguous in between
+        # or wrapping around once
+        start = self.tail
+        while start < end:
+            i = start % self.capacity
+            stop = min(end, start + self.capacity - i)
+            self.file.write(self.ring[i : i + stop - start].tobytes())
+            start = stop
+        self.tail = end
+
+    def _flush(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+
+            end = self.head
+            pending = end - self.tail
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if pending >= self.chunk_records or (due and pending > 0):
+                self._write(end)
+                self._flush()
+                last_flush = time.monotonic()
+
+    def close(self):
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        self._write(self.head)
+        self._flush()
+        self.file.close()
+
+
+def read_telemetry(filename):
+    # Returns the records (read only memmap, a truncated last record being
+    # ignored) and the metadata given to the recorder
+    with open(filename, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise Exception(f"{filename} is not a telemetry file")
+        header_length = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+        header = json.loads(f.read(header_length))
+
+    descr = [
+        tuple(tuple(x) if isinstance(x, list) else x for x in field)
+        for field in header["dtype"]
+    ]
+    dtype = np.dtype(descr)
+    offset = len(MAGIC) + 4 + header_length
+    count = (os.path.getsize(filename) - offset) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype), header["metadata"]
+
+    records = np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=count)
+    return records, header["metadata"]
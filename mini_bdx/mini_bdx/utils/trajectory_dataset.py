@@ -0,0 +1,360 @@
+import json
+import os
+import pickle
+
+import numpy as np
+
+# A trajectory dataset is a directory holding:
+#   info.json      sizes, dtype and metadata
+#   obs.bin        observations of all the episodes, concatenated (length + 1 rows
+#                  per episode, the last one being the observation after the last
+#                  action, as in imitation's Trajectory)
+#   acts.bin       actions of all the episodes, concatenated
+#   episodes.bin   one EPISODE_DTYPE record per episode
+# The data files are raw arrays, appended by chunks and memory mapped for reading.
+# An episode is written in the index only once its data is on disk, so data after
+# the last indexed episode (interrupted recording) is ignored, and dropped when the
+# dataset is opened again for appending.
+
+INFO_FILE = "info.json"
+OBS_FILE = "obs.bin"
+ACTS_FILE = "acts.bin"
+EPISODES_FILE = "episodes.bin"
+
+EPISODE_DTYPE = np.dtype(
+    [
+        ("obs_start", np.int64),
+        ("act_start", np.int64),
+        ("length", np.int64),  # Number of actions
+        ("terminal", np.bool_),
+    ]
+)
+
+
+class TrajectoryWriter:
+    # Appends episodes to a trajectory dataset, created if path does not exist.
+    # Steps are buffered in chunks of chunk_steps rows, written when full and when
+    # the episode ends, so that recording never holds more than a chunk in memory.
+    # Usage:
+    #   writer = TrajectoryWriter("dataset", obs_size, action_size)
+    #   for each step:
+    #       writer.add_step(obs, action)
+    #   writer.end_episode(last_obs)
+    #   ...
+    #   writer.close()
+    def __init__(
+        self,
+        path,
+        obs_size,
+        action_size,
+        dtype=np.float32,
+        metadata=None,
+        chunk_steps=4096,
+    ):
+        self.path = path
+        self.obs_size = obs_size
+        self.action_size = action_size
+        self.dtype = np.dtype(dtype)
+        self.chunk_steps = chunk_steps
+
+        info_path = os.path.join(path, INFO_FILE)
+        if os.path.exists(info_path):
+            with open(info_path) as f:
+                info = json.load(f)
+            if (info["obs_size"], info["action_size"], info["dtype"]) != (
+                obs_size,
+                action_size,
+                self.dtype.str,
+            ):
+                raise Exception(
+                    f"{path} holds {info['obs_size']} observations and "
+                    f"{info['action_size']} actions of {info['dtype']}"
+                )
+        else:
+            os.makedirs(path, exist_ok=True)
+            info = {
+                "obs_size": obs_size,
+                "action_size": action_size,
+                "dtype": self.dtype.str,
+                "metadata": {} if metadata is None else metadata,
+            }
+            with open(info_path, "w") as f:
+                json.dump(info, f)
+
+        # Data of an interrupted episode is dropped
+        episodes = read_episodes(path)
+        if len(episodes) > 0:
+            last = episodes[-1]
+            self.nb_obs = int(last["obs_start"] + last["length"] + 1)
+            self.nb_acts = int(last["act_start"] + last["length"])
+        else:
+            self.nb_obs = 0
+            self.nb_acts = 0
+        self.nb_episodes = len(episodes)
+        self.obs_file = self._open(OBS_FILE, self.nb_obs * obs_size)
+        self.acts_file = self._open(ACTS_FILE, self.nb_acts * action_size)
+        self.episodes_file = self._open(
+            EPISODES_FILE, self.nb_episodes, EPISODE_DTYPE.itemsize
+        )
+
+        self.obs = np.zeros((chunk_steps, obs_size), dtype=self.dtype)
+        self.acts = np.zeros((chunk_steps, action_size), dtype=self.dtype)
+        self.pending = 0  # Steps in the chunk
+        self.episode_start = (self.nb_obs, self.nb_acts)
+
+    def _open(self, name, count, itemsize=None):
+        itemsize = self.dtype.itemsize if itemsize is None else itemsize
+        f = open(os.path.join(self.path, name), "ab")
+        f.truncate(count * itemsize)
+        f.seek(0, os.SEEK_END)
+        return f
+
+    def _write_chunk(self):
+        self.obs_file.write(self.obs[: self.pending].tobytes())
+        self.acts_file.write(self.acts[: self.pending].tobytes())
+        self.pending = 0
+
+    def add_step(self, obs, action):
+        # obs is the observation the action was taken from
+        self.obs[self.pending] = obs
+        self.acts[self.pending] = action
+        self.pending += 1
+        self.nb_obs += 1
+        self.nb_acts += 1
+        if self.pending == self.chunk_steps:
+            self._write_chunk()
+
+    def end_episode(self, last_obs, terminal=True):
+        # last_obs is the observation after the last action
+        self._write_chunk()
+        self.obs_file.write(np.asarray(last_obs, dtype=self.dtype).tobytes())
+        self.nb_obs += 1
+        self.obs_file.flush()
+        self.acts_file.flush()
+
+        obs_start, act_start = self.episode_start
+        record = np.array(
+            [(obs_start, act_start, self.nb_acts - act_start, terminal)],
+            dtype=EPISODE_DTYPE,
+        )
+        self.episodes_file.write(record.tobytes())
+        self.episodes_file.flush()
+        self.nb_episodes += 1
+        self.episode_start = (self.nb_obs, self.nb_acts)
+
+    def append_episode(self, obs, acts, terminal=True):
+        # Whole episode, len(obs) == len(acts) + 1 (e.g. an imitation Trajectory)
+        obs = np.asarray(obs, dtype=self.dtype)
+        acts = np.asarray(acts, dtype=self.dtype)
+        if len(obs) != len(acts) + 1:
+            raise Exception(f"{len(obs)} observations for {len(acts)} actions")
+        self._write_chunk()
+        self.obs_file.write(obs[:-1].tobytes())
+        self.acts_file.write(acts.tobytes())
+        self.nb_obs += len(acts)
+        self.nb_acts += len(acts)
+        self.end_episode(obs[-1], terminal)
+
+    def discard_episode(self):
+        # Drops the steps added since the last end_episode()
+        self.pending = 0
+        self.nb_obs, self.nb_acts = self.episode_start
+        self.obs_file.truncate(self.nb_obs * self.obs_size * self.dtype.itemsize)
+        self.acts_file.truncate(self.nb_acts * self.action_size * self.dtype.itemsize)
+
+    def close(self):
+        # Steps of an episode not ended are dropped
+        self.discard_episode()
+        self.obs_file.close()
+        self.acts_file.close()
+        self.episodes_file.close()
+
+
+def read_episodes(path):
+    filename = os.path.join(path, EPISODES_FILE)
+    if not os.path.exists(filename):
+        return np.zeros(0, dtype=EPISODE_DTYPE)
+    count = os.path.getsize(filename) // EPISODE_DTYPE.itemsize
+    return np.fromfile(filename, dtype=EPISODE_DTYPE, count=count)
+
+
+def _memmap(filename, dtype, count, size):
+    if count == 0:
+        return np.zeros((0, size), dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", shape=(count, size))
+
+
+class TrajectoryDataset:
+    # Read only view of a trajectory dataset. Observations and actions are memory
+    # mapped, nothing is loaded until accessed, so datasets larger than the RAM can
+    # be used. Indexing and iterating give imitation Trajectory objects (views on
+    # the mapped files), minibatches() gives shuffled batches of transitions.
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INFO_FILE)) as f:
+            info = json.load(f)
+        self.obs_size = info["obs_size"]
+        self.action_size = info["action_size"]
+        self.dtype = np.dtype(info["dtype"])
+        self.metadata = info["metadata"]
+
+        self.episodes = read_episodes(path)
+        if len(self.episodes) > 0:
+            last = self.episodes[-1]
+            nb_obs = int(last["obs_start"] + last["length"] + 1)
+            nb_acts = int(last["act_start"] + last["length"])
+        else:
+            nb_obs = 0
+            nb_acts = 0
+        self.obs = _memmap(
+            os.path.join(path, OBS_FILE), self.dtype, nb_obs, self.obs_size
+        )
+        self.acts = _memmap(
+            os.path.join(path, ACTS_FILE), self.dtype, nb_acts, self.action_size
+        )
+
+        # Transition i is acts[i], from obs[obs_index[i]] to obs[obs_index[i] + 1]
+        self.episode_of = np.repeat(
+            np.arange(len(self.episodes)), self.episodes["length"]
+        )
+        self.obs_index = (
+            np.arange(nb_acts)
+            - self.episodes["act_start"][self.episode_of]
+            + self.episodes["obs_start"][self.episode_of]
+        )
+        last_steps = self.episodes["act_start"] + self.episodes["length"] - 1
+        self.dones = np.zeros(nb_acts, dtype=bool)
+        self.dones[last_steps[self.episodes["terminal"]]] = True
+
+    def __len__(self):
+        return len(self.episodes)
+
+    @property
+    def nb_transitions(self):
+        return len(self.acts)
+
+    def episode(self, i):
+        # (obs, acts, terminal) of episode i, obs having one more row than acts
+        episode = self.episodes[i]
+        obs_start, act_start = episode["obs_start"], episode["act_start"]
+        length = episode["length"]
+        return (
+            self.obs[obs_start : obs_start + length + 1],
+            self.acts[act_start : act_start + length],
+            bool(episode["terminal"]),
+        )
+
+    def __getitem__(self, i):
+        from imitation.data.types import Trajectory
+
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        obs, acts, terminal = self.episode(i)
+        return Trajectory(obs, acts, None, terminal)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def transitions(self, indices):
+        # Transitions mapping (obs, acts, next_obs, dones) of the given transition
+        # indices. Sorted indices read the files in order
+        obs_index = self.obs_index[indices]
+        return {
+            "obs": np.asarray(self.obs[obs_index]),
+            "acts": np.asarray(self.acts[indices]),
+            "next_obs": np.asarray(self.obs[obs_index + 1]),
+            "dones": self.dones[indices],
+        }
+
+    def minibatches(
+        self, batch_size, shuffle_buffer=1000000, block_size=4096, rng=None
+    ):
+        # Iterable of shuffled minibatches, see Minibatches
+        return Minibatches(self, batch_size, shuffle_buffer, block_size, rng)
+
+
+class Minibatches:
+    # Shuffled minibatches of transitions of a TrajectoryDataset, each iteration
+    # being an epoch over the dataset (the last incomplete batch is dropped). Can
+    # be given as demonstrations to imitation's algorithms (e.g. BC, GAIL) with
+    # batch_size matching their batch size.
+    # Random accesses to memory mapped files larger than the RAM are slow, so the
+    # shuffle is done in two levels: the transitions are split in blocks of
+    # block_size consecutive ones, visited in a random order, and shuffle_buffer
+    # transitions worth of blocks are read at once and shuffled together. Each
+    # batch then only holds transitions of the blocks in memory. With
+    # shuffle_buffer larger than the dataset, the shuffle is uniform.
+    def __init__(self, dataset, batch_size, shuffle_buffer, block_size, rng=None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.block_size = block_size
+        self.blocks_per_window = max(shuffle_buffer // block_size, 1)
+        self.rng = np.random.default_rng() if rng is None else rng
+
+    def __len__(self):
+        return self.dataset.nb_transitions // self.batch_size
+
+    def __iter__(self):
+        nb_transitions = self.dataset.nb_transitions
+        blocks = np.arange(0, nb_transitions, self.block_size)
+        self.rng.shuffle(blocks)
+
+        leftover = None
+        for start in range(0, len(blocks), self.blocks_per_window):
+            window = np.sort(blocks[start : start + self.blocks_per_window])
+            indices = np.concatenate(
+                [
+                    np.arange(block, min(block + self.block_size, nb_transitions))
+                    for block in window
+                ]
+            )
+            # Transitions of the window are read in file order, then shuffled
+            data = self.dataset.transitions(indices)
+            if leftover is not None:
+                data = {
+                    key: np.concatenate([leftover[key], values])
+                    for key, values in data.items()
+                }
+            order = self.rng.permutation(len(data["acts"]))
+            nb_batches = len(order) // self.batch_size
+            for b in range(nb_batches):
+                batch = order[b * self.batch_size : (b + 1) * self.batch_size]
+                yield {key: values[batch] for key, values in data.items()}
+
+            # Remaining transitions are mixed with the next window
+            rest = order[nb_batches * self.batch_size :]
+            leftover = {key: values[rest] for key, values in data.items()}
+
+
+def write_trajectories(path, trajectories, dtype=np.float32, metadata=None):
+    # Appends imitation Trajectory objects (e.g. a legacy pickled dataset)
+    writer = None
+    for trajectory in trajectories:
+        if writer is None:
+            writer = TrajectoryWriter(
+                path,
+                trajectory.obs.shape[1],
+                trajectory.acts.shape[1],
+                dtype=dtype,
+                metadata=metadata,
+            )
+        writer.append_episode(trajectory.obs, trajectory.acts, trajectory.terminal)
+    if writer is not None:
+        writer.close()
+
+
+def load_demonstrations(path, batch_size=None):
+    # Demonstrations for imitation's algorithms, from a trajectory dataset or a
+    # legacy pickled list of Trajectory objects (loaded in memory). With
+    # batch_size, a trajectory dataset gives shuffled minibatches of transitions
+    # instead of trajectories, which avoids flattening it in memory
+    if path.endswith(".pkl"):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    dataset = TrajectoryDataset(path)
+    if batch_size is None:
+        return dataset
+    return dataset.minibatches(batch_size)